@@ -0,0 +1,240 @@
+"""
+Aggregates the runs of a simulation one run at a time, so that the runs don't need to be kept in memory until they are
+all finished.
+"""
+# pylint: disable=import-error
+from typing import Dict, List, Optional, cast
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+
+class RunningAggregate:
+    """
+    Calculates the mean and the standard deviation of the runs one run at a time, using Welford's online algorithm, so
+    that the runs don't need to be kept in memory. All runs must have the same date, node, age and state rows.
+
+    The runs are accumulated in the order of their trials, whatever the order they are added in, so the numbers don't
+    depend on which trials finish first (or were resumed from a spool). Only the totals of the runs added before their
+    turn are kept until then. The first trial is counted twice, since that's what the mean and the standard deviation
+    have always been calculated on. Quantiles are optional and estimated with :class:`QuantileSketch`, where every run
+    is only counted once.
+
+    :param quantiles: quantiles (between 0 and 1) of the runs to be estimated, one column is added for each of them
+    """
+
+    def __init__(self, quantiles: Optional[List[float]] = None):
+        """Initialise."""
+        self._quantiles = quantiles or []
+        self._index: Optional[pd.MultiIndex] = None
+        self._moments = RunningMoments()
+        self._sketches: List[QuantileSketch] = []
+        self._next = 0
+        self._pending: Dict[int, np.ndarray] = {}
+
+    def add(self, output: pd.DataFrame, trial: Optional[int] = None):
+        """Add a run to the aggregate.
+
+        :param output: The output of a run, with the date, node, age, state and total columns
+        :param trial: The index of the trial of the run. If not given, the runs are taken to be added in order
+        """
+        totals = output.set_index(["date", "node", "age", "state"])["total"]
+        if self._index is None:
+            self._index = totals.index
+            self._sketches = [QuantileSketch(q, len(totals)) for q in self._quantiles]
+        elif not totals.index.equals(self._index):
+            totals = totals.reindex(self._index)
+        self._pending[self._next if trial is None else trial] = totals.to_numpy(dtype=float)
+        while self._next in self._pending:
+            values = self._pending.pop(self._next)
+            if self._next == 0:
+                self._moments.add(values)  # the first trial is counted twice (see above)
+            self._moments.add(values)
+            for sketch in self._sketches:
+                sketch.add(values)
+            self._next += 1
+
+    def result(self) -> pd.DataFrame:
+        """
+        :return: The mean and the standard deviation (and the quantiles) of the runs added so far, for each date,
+                 node, age and state
+        """
+        assert self._index is not None, "At least one run must be added"
+        assert not self._pending, f"Trials {sorted(self._pending)} were added but trial {self._next} is missing"
+        agg = pd.DataFrame({"mean": self._moments.mean, "std": self._moments.std()}, index=self._index)
+        for q, sketch in zip(self._quantiles, self._sketches):
+            agg[quantileColumn(q)] = sketch.estimate()
+        return agg.reset_index()
+
+
+class RunningMoments:
+    """
+    Mean and variance of a stream of arrays, element by element, calculated with Welford's online algorithm.
+
+    >>> moments = RunningMoments()
+    >>> for values in [[1.0, 10.0], [2.0, 10.0], [3.0, 10.0]]:
+    ...     moments.add(np.array(values))
+    >>> moments.count, moments.mean, moments.std()
+    (3, array([ 2., 10.]), array([1., 0.]))
+    """
+
+    def __init__(self):
+        """Initialise."""
+        self.count = 0
+        self.mean: Optional[np.ndarray] = None
+        self._m2: Optional[np.ndarray] = None
+
+    def add(self, values: np.ndarray):
+        """Add an array to the stream.
+
+        :param values: An array with the same shape as all the others
+        """
+        if self.mean is None:
+            self.mean = np.zeros(values.shape)
+            self._m2 = np.zeros(values.shape)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+    def std(self) -> np.ndarray:
+        """
+        >>> moments = RunningMoments()
+        >>> moments.add(np.array([1.0, 10.0]))
+        >>> moments.std()
+        array([0., 0.])
+
+        :return: The sample standard deviation (zero if there are less than two arrays)
+        """
+        assert self.mean is not None and self._m2 is not None, "At least one array must be added"
+        if self.count < 2:
+            return np.zeros(self._m2.shape)
+        return np.sqrt(self._m2 / (self.count - 1))
+
+    def relativeStandardError(self) -> float:
+        """
+        The Monte Carlo standard error of the mean, relative to the mean, of the element where it's the largest. An
+        element whose mean is zero has no error if all its values are zero, and an infinite one otherwise.
+
+        >>> moments = RunningMoments()
+        >>> for values in [[1.0, 0.0], [3.0, 0.0]]:
+        ...     moments.add(np.array(values))
+        >>> moments.relativeStandardError()
+        0.5
+
+        :return: The largest relative standard error, infinite if there are less than two arrays
+        """
+        if self.count < 2:
+            return np.inf
+        error = self.std() / np.sqrt(self.count)
+        relative = np.where(error == 0.0, 0.0, np.inf)
+        np.divide(error, np.abs(self.mean), out=relative, where=self.mean != 0.0)
+        return float(relative.max()) if relative.size else 0.0
+
+
+def quantileColumn(quantile: float) -> str:
+    """Name of the column with a quantile in the aggregated results
+
+    >>> quantileColumn(0.025)
+    'q0.025'
+
+    :param quantile: A number between 0 and 1
+    :return: The column name
+    """
+    return f"q{quantile:g}"
+
+
+class QuantileSketch:
+    """
+    Estimates a quantile of a stream of arrays, element by element, without keeping the arrays. It uses the P²
+    algorithm (Jain and Chlamtac, 1985), which keeps five markers per element whose heights approximate the minimum,
+    the p/2, p and (1+p)/2 quantiles and the maximum. The estimate is exact while five or fewer arrays have been added.
+
+    >>> sketch = QuantileSketch(0.5, 2)
+    >>> for i in range(101):
+    ...     sketch.add(np.array([i, -i]))
+    >>> sketch.estimate()
+    array([ 50., -50.])
+
+    :param quantile: The quantile to be estimated, between 0 and 1
+    :param size: The size of the arrays that will be added
+    """
+
+    def __init__(self, quantile: float, size: int):
+        """Initialise."""
+        assert 0.0 <= quantile <= 1.0, f"Invalid quantile {quantile}"
+        self._quantile = quantile
+        self._count = 0
+        self._heights = np.zeros((5, size))
+        self._positions = np.repeat(np.arange(1.0, 6.0)[:, np.newaxis], size, axis=1)
+        self._desired = np.array([1.0, 1.0 + 2.0 * quantile, 1.0 + 4.0 * quantile, 3.0 + 2.0 * quantile, 5.0])
+        self._increments = np.array([0.0, quantile / 2.0, quantile, (1.0 + quantile) / 2.0, 1.0])
+
+    def add(self, values: np.ndarray):
+        """Add an observation to each element.
+
+        :param values: The observations, with the size given when the sketch was created
+        """
+        q = self._heights
+        n = self._positions
+        if self._count < 5:
+            q[self._count] = values
+            self._count += 1
+            if self._count == 5:
+                q.sort(axis=0)
+            return
+        self._count += 1
+
+        q[0] = np.minimum(q[0], values)
+        q[4] = np.maximum(q[4], values)
+        # Markers above the one the value falls into are pushed one position up
+        k = (values >= q[1:4]).sum(axis=0)
+        n += np.arange(5)[:, np.newaxis] > k
+        self._desired += self._increments
+
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            up = (d >= 1.0) & (n[i + 1] - n[i] > 1.0)
+            down = (d <= -1.0) & (n[i - 1] - n[i] < -1.0)
+            sign = np.where(up, 1.0, -1.0)
+            parabolic = q[i] + sign / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + sign) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - sign) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+            )
+            neighbour = np.where(up, q[i + 1], q[i - 1])
+            linear = q[i] + sign * (neighbour - q[i]) / (np.where(up, n[i + 1], n[i - 1]) - n[i])
+            height = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear)
+            move = up | down
+            q[i] = np.where(move, height, q[i])
+            n[i] += np.where(move, sign, 0.0)
+
+    def estimate(self) -> np.ndarray:
+        """
+        :return: The estimated quantile of each element
+        """
+        assert self._count > 0, "At least one array must be added"
+        if self._count <= 5:
+            return np.quantile(self._heights[:self._count], self._quantile, axis=0)
+        return self._heights[2].copy()
+
+
+def aggregateStates(states: np.ndarray, quantiles: List[float]) -> List[np.ndarray]:
+    """Aggregates the states of all the trials on a day. The numbers are exactly the ones :class:`RunningAggregate`
+    calculates for that day when the runs are added in trial order: the first trial is counted twice in the mean and
+    the standard deviation, and the quantiles are estimated with :class:`QuantileSketch`.
+
+    :param states: a (trials, nodes, ages, compartments) array
+    :param quantiles: quantiles (between 0 and 1) of the trials to be estimated
+    :return: The mean, the standard deviation and then each quantile, as (nodes, ages, compartments) arrays
+    """
+    moments = RunningMoments()
+    sketches = [QuantileSketch(q, states[0].size) for q in quantiles]
+    moments.add(states[0].ravel())
+    for values in states.reshape(len(states), -1):
+        moments.add(values)
+        for sketch in sketches:
+            sketch.add(values)
+    shape = states.shape[1:]
+    return [cast(np.ndarray, moments.mean).reshape(shape), moments.std().reshape(shape)] + [
+        sketch.estimate().reshape(shape) for sketch in sketches
+    ]
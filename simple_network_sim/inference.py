@@ -3,431 +3,34 @@ main module used for running the inference on simple network sim
 """
 from __future__ import annotations
 
-import datetime as dt
 import logging.config
 import sys
 import time
-from abc import ABC, abstractmethod
-from typing import Tuple, List, Dict, Type, ClassVar, Union
+from concurrent import futures
+from typing import Tuple, List, Dict, Type, ClassVar, Optional
 
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
 from data_pipeline_api import standard_api
-from more_itertools import pairwise
 
 from . import loaders, common
 from . import network_of_populations as ss
 from . import sampleUseOfModel as sm
+from .inferred_variables import (
+    InferredVariable,
+    InferredInfectionProbability,
+    InferredInitialInfections,
+    InferredContactMultipliers,
+    uniform_pdf,
+)
+from .particle_evaluation import ParticleEvaluator, evaluate_published_particle, log_issues
+from .pool import SimulationPool
 
 sys.path.append('..')
 
 logger = logging.getLogger(__name__)
 
 
-def uniform_pdf(
-        x: Union[float, np.array],
-        a: Union[float, np.array],
-        b: Union[float, np.array]
-) -> Union[float, np.array]:
-    """pdf function for uniform distribution
-
-    :param x: value at which to evaluate the pdf
-    :param a: lower bound of the distribution
-    :param b: upper bound of the distribution
-    """
-    return ((a <= x) & (x <= b)) / (b - a)
-
-
-def lognormal(mean: float, stddev: float, stddev_min: float = -np.inf) -> stats.rv_continuous:
-    """Constructs Scipy lognormal object to match a given mean and std
-    dev passed as input. The parameters to input in the model are inverted
-    from the formulas:
-
-    .. math::
-            if X~LogNormal(mu, scale)
-        then:
-            E[X] = exp{mu + sigma^2 * 0.5}
-            Var[X] = (exp{sigma^2} - 1) * exp{2 * mu + sigma^2}
-
-    The stddev is taken as a % of the mean, floored at 10. This
-    allows natural scaling with the size of the population inside the
-    nodes, always allowing for a minimal uncertainty.
-
-    :param mean: Mean to match
-    :param stddev: Std dev to match
-    :param stddev_min: Minimum std dev to match
-    :return: Distribution object representing a lognormal distribution with
-    the given mean and std dev
-    """
-    stddev = np.maximum(mean * stddev, stddev_min)
-    sigma = np.sqrt(np.log(1 + (stddev**2 / mean**2)))
-    mu = np.log(mean / np.sqrt(1 + (stddev**2 / mean**2)))
-    return stats.lognorm(s=sigma, loc=0., scale=np.exp(mu))
-
-
-def split_dataframe(multipliers, partitions, col="Contact_Multiplier"):
-    df = multipliers.copy()
-    df.Date = pd.to_datetime(df.Date)
-    for prev_date, curr_date in pairwise(partitions):
-        index = (df.Date.dt.date < curr_date) & (df.Date.dt.date >= prev_date)
-        values = df.loc[index, col].values
-
-        if len(values) == 0:
-            continue
-
-        yield values[0], index
-
-
-class InferredVariable(ABC):
-    """
-    Abstract class representing a variable to infer in ABC-SMC. To be inferred,
-    we require from a parameter to:
-    - Sample and retrieve pdf from prior
-    - Perturb the parameter and get the perturbation pdf
-    - Validate if the parameter is correct
-    - Convert to frame to be initialize and run the model
-    """
-    value: pd.DataFrame
-
-    def __init__(self, value: pd.DataFrame, mean: pd.DataFrame):
-        self.value = value
-        self.mean = mean
-
-    @staticmethod
-    @abstractmethod
-    def generate_from_prior(fitter: ABCSMC) -> InferredVariable:
-        """ Abstract method for generating a parameter from the prior """
-
-    @abstractmethod
-    def generate_perturbated(self) -> InferredVariable:
-        """ Abstract method for generating a perturbated copy """
-
-    @abstractmethod
-    def validate(self) -> bool:
-        """ Abstract method for validating the parameter correctness """
-
-    @abstractmethod
-    def prior_pdf(self) -> float:
-        """ Abstract method for generating the prior pdf """
-
-    @abstractmethod
-    def perturbation_pdf(self, x: pd.DataFrame) -> float:
-        """ Abstract method for generating the perturbation pdf """
-
-
-class InferredInfectionProbability(InferredVariable):
-    """
-    Class representing inferred infection probability to be used inside ABC-SMC fitter.
-    Infection probability is the odd that a contact between an infectious and susceptible
-    person leads to a new infection.
-    """
-
-    # pylint: disable=too-many-arguments
-    def __init__(
-            self,
-            value: pd.DataFrame,
-            mean: pd.DataFrame,
-            shape: float,
-            kernel_sigma: float,
-            rng: np.random.Generator
-    ):
-        super().__init__(value, mean)
-        self.shape = shape
-        self.kernel_sigma = kernel_sigma
-        self.rng = rng
-
-    @staticmethod
-    def generate_from_prior(fitter: ABCSMC) -> InferredInfectionProbability:
-        """ Sample from prior distribution. For infection probability, we use
-        the value in the data pipeline as mean of our prior, and shape parameter
-        is fixed at 2. This defines a Beta distribution centered around our prior.
-
-        :param fitter: ABC-SMC fitter object
-        :return: New InferredInitialInfections randomly sampled from prior
-        """
-        shape = fitter.infection_probability_shape
-        sigma = fitter.infection_probability_kernel_sigma
-        mean = fitter.infection_probability
-
-        value = fitter.infection_probability.copy()
-        value.Value = fitter.rng.beta(shape, shape * (1 - mean.Value) / mean.Value)
-
-        return InferredInfectionProbability(value, mean, shape, sigma, fitter.rng)
-
-    def generate_perturbated(self) -> InferredInfectionProbability:
-        """ From current parameter, add a perturbation to infection probability and return
-        a newly created perturbated parameter:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(max(P_{t-1} - \sigma, 0),\min(\sigma + P_{t-1}, 1))
-
-        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
-        that the infection probability remains valid. This is correct as the algorithm
-        states that the particle should be re-sampled as long as the perturbation brings it
-        out of bounds, and the truncation of a uniform distribution is still a uniform
-        distribution.
-
-        :return: New parameter which is similar to self up to a perturbation
-        """
-        sigma = self.kernel_sigma
-        value = self.value.copy()
-        value.Value = self.rng.uniform(np.maximum(value.Value - sigma, 0), np.minimum(value.Value + sigma, 1.))
-        return InferredInfectionProbability(value, self.mean, self.shape, sigma, self.rng)
-
-    def validate(self) -> bool:
-        """ Checks that the particle is valid, i.e. that infection probability is
-        between 0 and 1.
-
-        :return: Whether the parameter is valid
-        """
-        return np.all(self.value.Value > 0.) and np.all(self.value.Value < 1.)
-
-    def prior_pdf(self) -> np.ndarray:
-        """ Compute pdf of the prior distribution evaluated at the parameter x.
-        Infection probability has a prior a beta distribution. The pdf is evaluated
-        at the current value of the parameter.
-
-        :return: pdf value of prior distribution evaluated at x
-        """
-        return np.prod(stats.beta.pdf(self.value.Value, self.shape,
-                                      self.shape * (1 - self.mean.Value) / self.mean.Value))
-
-    def perturbation_pdf(self, x: pd.DataFrame) -> np.ndarray:
-        """ Compute pdf of the perturbation evaluated at the parameter x,
-        from the current parameter. In ABC-SMC when a particle is sampled
-        from the previous population it is slightly perturbed:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(max(P_{t-1} - \sigma, 0),\min(\sigma + P_{t-1}, 1))
-
-        Given in the sampling the perturbation was capped and floored in [0, 1]
-        to keep the particle valid, it results in a truncated uniform
-        distribution which is reflected in the pdf.
-
-        :param x: Particle to evaluate the pdf at
-        :return: pdf value of perturbation from previous particle evaluated at x
-        """
-        return np.prod(uniform_pdf(x.Value, np.maximum(self.value.Value - self.kernel_sigma, 0),
-                                   np.minimum(self.value.Value + self.kernel_sigma, 1)))
-
-
-class InferredInitialInfections(InferredVariable):
-    """
-    Class representing inferred initial infections to be used inside ABC-SMC fitter.
-    Initial infections are the number of exposed individuals per node at the start
-    date of the model.
-    """
-
-    # pylint: disable=too-many-arguments
-    def __init__(
-            self,
-            value: pd.DataFrame,
-            mean: pd.DataFrame,
-            stddev: float,
-            stddev_min: float,
-            kernel_sigma: float,
-            rng: np.random.Generator
-    ):
-        super().__init__(value, mean)
-        self.stddev = stddev
-        self.stddev_min = stddev_min
-        self.kernel_sigma = kernel_sigma
-        self.rng = rng
-
-    @staticmethod
-    def generate_from_prior(fitter: ABCSMC) -> InferredInitialInfections:
-        """ Sample from prior distribution. For initial infections, we use
-        the values in the data pipeline as mean of our priors, and the std dev
-        is taken as a percentage of the mean. This allow the prior to scale
-        the uncertainty with the scale of the prior itself.
-
-        :param fitter: ABC-SMC fitter object
-        :return: New InferredInitialInfections randomly sampled from prior
-        """
-        stddev = fitter.initial_infections_stddev
-        stddev_min = fitter.initial_infections_stddev_min
-        sigma = fitter.initial_infections_kernel_sigma
-
-        value = fitter.initial_infections.copy()
-        value.Infected = lognormal(value.Infected, stddev, stddev_min).rvs(random_state=fitter.rng)
-
-        return InferredInitialInfections(value, fitter.initial_infections, stddev, stddev_min, sigma, fitter.rng)
-
-    def generate_perturbated(self) -> InferredInitialInfections:
-        """ From current table, add a perturbation to every parameter and return
-        a newly created perturbated particle. For initial infections, we apply a uniform
-        perturbation from the current value:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
-
-        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
-        that the infection probability remains valid. This is correct as the algorithm
-        states that the particle should be re-sampled as long as the perturbation brings it
-        out of bounds, and the truncation of a uniform distribution is still a uniform
-        distribution.
-
-        :return: New parameter which is similar to self up to a perturbation
-        """
-        sigma = self.kernel_sigma
-        value = self.value.copy()
-        value.Infected = self.rng.uniform(np.maximum(value.Infected - sigma, 0.), value.Infected + sigma)
-        return InferredInitialInfections(value, self.mean, self.stddev, self.stddev_min, self.kernel_sigma, self.rng)
-
-    def validate(self) -> bool:
-        """ Checks that the particle is valid, i.e. that all initial infections are
-        positive or 0.
-
-        :return: Whether the particle is valid
-        """
-        return np.all(self.value.Infected >= 0.)
-
-    def prior_pdf(self) -> float:
-        """ Compute pdf of the prior distribution evaluated at the parameter x.
-        As all priors are independent the joint pdf is the product of individual pdfs.
-        The pdf is evaluated at the current value of the parameter.
-
-        :return: pdf value of prior distribution evaluated at x
-        """
-        pdf = 1.
-        for index, row in self.mean.iterrows():
-            pdf *= lognormal(row.Infected, self.stddev, self.stddev_min).pdf(self.value.at[index, "Infected"])
-
-        return pdf
-
-    def perturbation_pdf(self, x: pd.DataFrame) -> float:
-        """ Compute pdf of the perturbation evaluated at the parameter ``x``,
-        from the current parameter. In ABC-SMC when a particle is sampled
-        from the previous population it is slightly perturbed:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
-
-        As all perturbations are independent the joint pdf is the product
-        of individual pdfs.
-
-        :param x: Particle to evaluate the pdf at
-        :return: pdf value of perturbation from previous particle evaluated at x
-        """
-        pdf = 1.
-        for index, row in self.value.iterrows():
-            pdf *= uniform_pdf(x.at[index, "Infected"], max(row.Infected - self.kernel_sigma, 0.),
-                               row.Infected + self.kernel_sigma)
-
-        return pdf
-
-
-class InferredContactMultipliers(InferredVariable):
-    """
-    Class representing inferred contact multipliers to be used inside ABC-SMC fitter.
-    Contact multipliers are adjustment numbers by which we adjust the contact to
-    simulate the effect of quarantine and social distancing.
-    """
-
-    # pylint: disable=too-many-arguments
-    def __init__(
-            self,
-            value: pd.DataFrame,
-            mean: pd.DataFrame,
-            stddev: float,
-            kernel_sigma: float,
-            partitions: List[dt.date],
-            rng: np.random.Generator
-    ):
-        super().__init__(value, mean)
-        self.stddev = stddev
-        self.rng = rng
-        self.kernel_sigma = kernel_sigma
-        self.partitions = partitions
-
-    @staticmethod
-    def generate_from_prior(fitter: ABCSMC) -> InferredContactMultipliers:
-        """ Sample from prior distribution. For contact multipliers, we use
-        the values in the data pipeline as mean of our priors, and the std dev
-        is taken as a fixed number. We use a lognormal prior.
-
-        :param fitter: ABC-SMC fitter object
-        :return: New InferredInitialInfections randomly sampled from prior
-        """
-        stddev = fitter.contact_multipliers_stddev
-        sigma = fitter.contact_multipliers_kernel_sigma
-        partitions = fitter.contact_multipliers_partitions
-
-        value = fitter.movement_multipliers.copy()
-        for multiplier, index in split_dataframe(value, partitions):
-            value.loc[index, "Contact_Multiplier"] = lognormal(multiplier, stddev).rvs(random_state=fitter.rng)
-
-        return InferredContactMultipliers(value, fitter.movement_multipliers, stddev, sigma, partitions, fitter.rng)
-
-    def generate_perturbated(self) -> InferredContactMultipliers:
-        """ From current table, add a perturbation to every parameter and return
-        a newly created perturbated particle. For contact multipliers, we apply a uniform
-        perturbation from the current value:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
-
-        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
-        that the infection probability remains valid. This is correct as the algorithm
-        states that the particle should be re-sampled as long as the perturbation brings it
-        out of bounds, and the truncation of a uniform distribution is still a uniform
-        distribution.
-
-        :return: New parameter which is similar to self up to a perturbation
-        """
-        value = self.value.copy()
-        for multiplier, index in split_dataframe(value, self.partitions):
-            value.loc[index, "Contact_Multiplier"] = self.rng.uniform(np.maximum(multiplier - self.kernel_sigma, 0.),
-                                                                      multiplier + self.kernel_sigma)
-
-        return InferredContactMultipliers(value, self.mean, self.stddev, self.kernel_sigma, self.partitions, self.rng)
-
-    def validate(self) -> bool:
-        """ Checks that the particle is valid, i.e. that all contact multipliers are
-        strictly positive 0.
-
-        :return: Whether the particle is valid
-        """
-        return np.all(self.value.Contact_Multiplier > 0.)
-
-    def prior_pdf(self) -> float:
-        """ Compute pdf of the prior distribution evaluated at the parameter x.
-        As all priors are independent the joint pdf is the product of individual pdfs.
-        The pdf is evaluated at the current value of the parameter.
-
-        :return: pdf value of prior distribution evaluated at x
-        """
-        pdf = 1.
-
-        for multiplier, index in split_dataframe(self.value, self.partitions):
-            mean_x = self.mean.loc[index, "Contact_Multiplier"].values[0]
-            pdf *= lognormal(mean_x, self.stddev).pdf(multiplier)
-
-        return pdf
-
-    def perturbation_pdf(self, x: pd.DataFrame) -> float:
-        """ Compute pdf of the perturbation evaluated at the parameter ``x``,
-        from the current parameter. In ABC-SMC when a particle is sampled
-        from the previous population it is slightly perturbed:
-
-        .. math::
-            P_t^* \sim K(P_t | P_{t-1}) \sim P_{t-1} + \sigma * Uniform([-1,1])
-
-        As all perturbations are independent the joint pdf is the product
-        of individual pdfs.
-
-        :param x: Particle to evaluate the pdf at
-        :return: pdf value of perturbation from previous particle evaluated at x
-        """
-        pdf = 1.
-        for multiplier, index in split_dataframe(self.value, self.partitions):
-            curr_x = x.loc[index, "Contact_Multiplier"].values[0]
-            pdf *= uniform_pdf(curr_x, max(multiplier - self.kernel_sigma, 0.), multiplier + self.kernel_sigma)
-
-        return pdf
-
-
 class Particle:
     """
     Class representing a particle, a collection of parameters that will be
@@ -540,6 +143,48 @@ class Particle:
 
         return pdf
 
+    @staticmethod
+    def to_matrix(particles: List[Particle]) -> np.ndarray:
+        """ Represents a population of particles as a matrix, with the values of all the inferred variables of each
+        particle in a row.
+
+        :param particles: List of particles
+        :return: A (n_particles, n_params) matrix
+        """
+        return np.array([np.concatenate([variable.to_array() for variable in particle.inferred_variables.values()])
+                         for particle in particles])
+
+    @staticmethod
+    def kernel_bounds(particles: List[Particle]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Bounds of the uniform perturbation around each particle of a population, in the same layout as to_matrix.
+
+        :param particles: List of particles
+        :return: Two (n_particles, n_params) matrices, with the lower and upper bounds of the perturbation
+        """
+        bounds = [[variable.kernel_bounds() for variable in particle.inferred_variables.values()]
+                  for particle in particles]
+        lower = np.array([np.concatenate([low for low, _ in particle]) for particle in bounds])
+        upper = np.array([np.concatenate([high for _, high in particle]) for particle in bounds])
+        return lower, upper
+
+    @staticmethod
+    def prior_pdfs(particles: List[Particle]) -> np.ndarray:
+        """ Vectorized prior_pdf, for a whole population of particles. The prior parameters are the same for every
+        particle, so they are taken from the first one.
+
+        :param particles: List of particles
+        :return: pdf value of prior distribution evaluated at each particle
+        """
+        values = Particle.to_matrix(particles)
+        pdf = np.ones(len(particles))
+        start = 0
+        for variable in particles[0].inferred_variables.values():
+            end = start + len(variable.to_array())
+            pdf *= variable.prior_pdfs(values[:, start:end])
+            start = end
+
+        return pdf
+
 
 # pylint: disable=too-many-instance-attributes
 class ABCSMC:
@@ -563,13 +208,18 @@ class ABCSMC:
                 Particle is accepted for the current population
                 Compute weight for current particle
 
+    The candidate particles are drawn ``batch_size`` at a time and each batch is run concurrently in a pool of worker
+    processes. Since they are all drawn in this process, and accepted in the order they were drawn, the result only
+    depends on the seed and the batch size, not on the number of workers. A candidate's run is stopped as soon as its
+    distance is certain to exceed the threshold (see ``particle_evaluation.WeeklyDeathsDistance``).
+
     References:
         https://royalsocietypublishing.org/doi/pdf/10.1098/rsif.2008.0172
         https://en.wikipedia.org/wiki/Approximate_Bayesian_computation
         https://pyabc.readthedocs.io/en/latest/index.html
     """
 
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments,too-many-locals
     def __init__(
             self,
             parameters: pd.DataFrame,
@@ -585,7 +235,8 @@ class ABCSMC:
             start_end_date: pd.DataFrame,
             movement_multipliers: pd.DataFrame,
             stochastic_mode: pd.DataFrame,
-            random_seed: pd.DataFrame
+            random_seed: pd.DataFrame,
+            max_workers: Optional[int] = None,
     ):
         self.historical_deaths = loaders.readHistoricalDeaths(historical_deaths)
         parameters = loaders.readABCSMCParameters(parameters)
@@ -600,6 +251,7 @@ class ABCSMC:
         self.contact_multipliers_stddev = parameters["contact_multipliers_stddev"]
         self.contact_multipliers_kernel_sigma = parameters["contact_multipliers_kernel_sigma"]
         self.contact_multipliers_partitions = parameters["contact_multipliers_partitions"]
+        self.batch_size = parameters["batch_size"]
 
         assert self.n_smc_steps > 0
         assert self.n_particles > 0
@@ -610,6 +262,7 @@ class ABCSMC:
         assert self.initial_infections_kernel_sigma > 0.
         assert self.contact_multipliers_stddev > 0
         assert self.contact_multipliers_kernel_sigma > 0
+        assert self.batch_size > 0
 
         self.compartment_transition_table = compartment_transition_table
         self.population_table = population_table
@@ -628,8 +281,47 @@ class ABCSMC:
         assert trials.at[0, "Value"] == 1, "Only one trial should be used for both stochastic and deterministic mode"
         assert len(infection_probability) == 1, "Only one infection probability is allowed"
 
+        # Only the infection probability, the initial infections and the contact multipliers change between particles,
+        # so everything else is built once, here, and each particle just replaces those (see
+        # ParticleEvaluator.create_network)
+        self.network, self.network_issues = ss.createNetworkOfPopulation(
+            compartment_transition_table,
+            population_table,
+            commutes_table,
+            mixing_matrix_table,
+            infectious_states,
+            infection_probability,
+            initial_infections,
+            trials,
+            start_end_date,
+            movement_multipliers,
+            stochastic_mode,
+        )
+        log_issues(self.network_issues, "creating the network")
+        # Only this is sent to the worker processes, the rest of the fitter stays here (see publish)
+        self.evaluator = ParticleEvaluator.create(
+            self.network,
+            self.historical_deaths,
+            loaders.readRandomSeed(random_seed),
+        )
+
         self.threshold = np.inf
         self.fit_statistics: Dict[int] = {}
+        # Worker processes kept warm across all the particles, they are only started when the first batch runs
+        self.pool = SimulationPool(max_workers)
+
+    def publish(self) -> Tuple[str, str]:
+        """ Publishes the evaluator, with the current threshold, to the worker processes, so that the tasks evaluating
+        particles only need to carry the particles (see evaluate_particles). The network is published on its own, so
+        that its arrays are shared.
+
+        :return: The directories of the published network and evaluator, to be removed with
+                 ``SimulationPool.unpublish``
+        """
+        return (
+            self.pool.publish(self.network),
+            self.pool.publishObject(self.evaluator._replace(network=None, threshold=self.threshold)),
+        )
 
     def fit(self) -> Tuple[List[Particle], List[float], List[float]]:
         """ Performs ABC-SMC iterative procedure for finding posterior distributions
@@ -647,10 +339,11 @@ class ABCSMC:
         prev_weights: List[float] = []
         distances: List[float] = []
 
-        for smc_step in range(self.n_smc_steps):
-            logger.info("SMC step %d/%d", smc_step + 1, self.n_smc_steps)
-            prev_particles, prev_weights, distances = self.sample_particles(smc_step, prev_particles, prev_weights)
-            self.update_threshold(distances)
+        with self.pool:
+            for smc_step in range(self.n_smc_steps):
+                logger.info("SMC step %d/%d", smc_step + 1, self.n_smc_steps)
+                prev_particles, prev_weights, distances = self.sample_particles(smc_step, prev_particles, prev_weights)
+                self.update_threshold(distances)
 
         return prev_particles, prev_weights, distances
 
@@ -679,95 +372,103 @@ class ABCSMC:
         """
         t0 = time.time()
 
+        # The threshold doesn't change during an iteration, so the evaluator is published to the workers once for all
+        # of its batches
+        published = self.publish() if self.batch_size > 1 else None
+        try:
+            particles, distances, particles_simulated = self.sample_batches(
+                smc_step, prev_particles, prev_weights, published
+            )
+        finally:
+            if published is not None:
+                for directory in published:
+                    self.pool.unpublish(directory)
+
+        weights = list(ABCSMC.compute_weights(smc_step, prev_particles, prev_weights, particles))
+
+        logger.info("Particles accepted %d/%d", len(particles), particles_simulated)
+        self.add_iteration_statistics(smc_step, particles, weights, particles_simulated, distances, t0)
+
+        return particles, weights, distances
+
+    def sample_batches(
+            self,
+            smc_step: int,
+            prev_particles: List[Particle],
+            prev_weights: List[float],
+            published: Optional[Tuple[str, str]] = None,
+    ) -> Tuple[List[Particle], List[float], int]:
+        """ Draws and evaluates the candidate particles of an iteration, ``batch_size`` at a time, until enough of
+        them are accepted.
+
+        :param smc_step: ABC-SMC iteration number
+        :param prev_particles: List of particles accepted on previous round
+        :param prev_weights: List of particles weights accepted on previous round
+        :param published: The directories returned by publish, if the evaluator has already been published
+        :return: The accepted particles, their distances and the number of particles simulated
+        """
         particles = []
-        weights = []
         distances = []
-
-        particles_accepted = 0
         particles_simulated = 0
-        while particles_accepted < self.n_particles:
+        while len(particles) < self.n_particles:
 
             if smc_step == 0:
-                particle = Particle.generate_from_priors(self)
+                candidates = [Particle.generate_from_priors(self) for _ in range(self.batch_size)]
             else:
-                particle = Particle.resample_and_perturbate(prev_particles, prev_weights, self.rng)
-
-            result = self.run_model(particle)
-            distance = self.compute_distance(result)
+                candidates = [Particle.resample_and_perturbate(prev_particles, prev_weights, self.rng)
+                              for _ in range(self.batch_size)]
 
-            if distance <= self.threshold:
-                logger.info("Particle accepted with distance %d", distance)
-                weight = ABCSMC.compute_weight(smc_step, prev_particles, prev_weights, particle)
-                particles.append(particle)
-                weights.append(weight)
-                distances.append(distance)
-                particles_accepted += 1
+            for particle, distance in zip(candidates, self.evaluate_particles(candidates, published)):
+                # The candidates left once enough particles are accepted are dropped, as if they were never drawn
+                if len(particles) == self.n_particles:
+                    break
 
-            particles_simulated += 1
+                if distance <= self.threshold:
+                    logger.info("Particle accepted with distance %d", distance)
+                    particles.append(particle)
+                    distances.append(distance)
 
-        logger.info("Particles accepted %d/%d", particles_accepted, particles_simulated)
-        self.add_iteration_statistics(smc_step, particles, weights, particles_simulated, distances, t0)
+                particles_simulated += 1
 
-        return particles, weights, distances
+        return particles, distances, particles_simulated
 
-    def run_model(self, particle: Particle) -> pd.DataFrame:
-        """ Run models using current particle as parameters.
+    def evaluate_particles(self, particles: List[Particle], published: Optional[Tuple[str, str]] = None) -> List[float]:
+        """ Runs the model with each of the particles and computes their distances. The particles are evaluated
+        concurrently in the worker processes, unless there's only one of them.
 
-        :param particle: Particle under consideration
-        :return: Model run results for current particle
+        :param particles: Particles under consideration
+        :param published: The directories returned by publish, if the evaluator has already been published with the
+                          current threshold. Otherwise it's published just for these particles
+        :return: The distance of each particle, in the same order as the particles
         """
-        network, issues = ss.createNetworkOfPopulation(
-            self.compartment_transition_table,
-            self.population_table,
-            self.commutes_table,
-            self.mixing_matrix_table,
-            self.infectious_states,
-            particle.inferred_variables["infection-probability"].value,
-            particle.inferred_variables["initial-infections"].value,
-            self.trials,
-            self.start_end_date,
-            particle.inferred_variables["contact-multipliers"].value,
-            self.stochastic_mode,
-        )
-        random_seed = loaders.readRandomSeed(self.random_seed)
-        results = sm.runSimulation(network, random_seed, issues=issues)
-        if issues:
-            logger.warning("We had %s issues when running the model:", len(issues))
-            for issue in issues:
-                logger.warning("%s (severity: %s)", issue.description, issue.severity)
-        aggregated = sm.aggregateResults(results)
-        return aggregated.output
-
-    def compute_distance(self, result: pd.DataFrame) -> float:
-        """ Computes distance between target and model run with current particle.
-        For dynamical systems such as epidemiological models, the distance generally
-        used is the root mean squared distance between model and historical outputs.
-        e.g. for a dynamical system which outputs `y(t)` (number of deaths, number
-        of infected, etc):
+        if len(particles) == 1:
+            return [self.evaluate_particle(particles[0])]
+
+        unpublish = published is None
+        network_directory, evaluator_directory = self.publish() if published is None else published
+        delayed = [
+            self.pool.submit(evaluate_published_particle, network_directory, evaluator_directory, particle)
+            for particle in particles
+        ]
+        try:
+            return [future.result() for future in delayed]
+        finally:
+            for future in delayed:
+                future.cancel()
+            futures.wait(delayed)
+            if unpublish:
+                self.pool.unpublish(network_directory)
+                self.pool.unpublish(evaluator_directory)
+
+    def evaluate_particle(self, particle: Particle) -> float:
+        """ Runs the model with a particle and computes its distance. The run stops as soon as the distance is certain
+        to exceed the current threshold (see ``ParticleEvaluator.evaluate``), since the particle can't be accepted
+        anyway.
 
-        .. math::
-            \sqrt{\sum_{t=1,...,T} ( y_{model}(t) - y_{reality}(t) )^2}
-
-        In our case, `y(t)` is the number of deaths per node and per week.
-
-        :param result: Model run results
-        :return: distance value between model run and target
+        :param particle: Particle under consideration
+        :return: The distance of the particle, or a lower bound of it above the threshold if the run was stopped
         """
-        result_by_node = (
-            result
-            .query("state == 'D'")
-            .groupby(["date", "node"])
-            .sum()
-            .reset_index()
-            .assign(date=lambda x: pd.to_datetime(x.date))
-            .pivot(index="date", columns="node", values="mean")
-            .diff()
-            .resample('7D').sum()
-        )
-
-        distance = (result_by_node - self.historical_deaths)**2
-        distance = np.sqrt(distance.sum().sum() / distance.count().sum())
-        return distance
+        return self.evaluator._replace(threshold=self.threshold).evaluate(particle)
 
     @staticmethod
     def compute_weight(
@@ -795,13 +496,34 @@ class ABCSMC:
         :param particle: Particle under consideration
         :return: Weight of the particle under consideration
         """
-        if smc_step == 0:
-            return 1.
+        return ABCSMC.compute_weights(smc_step, particles, weights, [particle])[0]
+
+    @staticmethod
+    def compute_weights(
+            smc_step: int,
+            prev_particles: List[Particle],
+            prev_weights: List[float],
+            particles: List[Particle]
+    ) -> np.ndarray:
+        """ Vectorized compute_weight, for all the particles accepted in an iteration at once. The particles of
+        both iterations are represented as (n_particles, n_params) matrices, and the perturbation kernel is evaluated
+        for every pair of previous and new particles with broadcasting.
+
+        :param smc_step: Step number of ABC-SMC algorithm
+        :param prev_particles: List of accepted particles in the previous run
+        :param prev_weights: List of weights of accepted particles in the previous run
+        :param particles: Particles under consideration
+        :return: Weight of each particle under consideration
+        """
+        if smc_step == 0 or not particles:
+            return np.ones(len(particles))
 
-        num = particle.prior_pdf()
-        denom = sum(weights[i] * p.perturbation_pdf(particle) for i, p in enumerate(particles))
+        lower, upper = Particle.kernel_bounds(prev_particles)
+        values = Particle.to_matrix(particles)[:, np.newaxis, :]
+        # (n_particles, n_prev_particles) matrix with the perturbation pdf from each previous particle
+        kernel = np.prod(uniform_pdf(values, lower[np.newaxis], upper[np.newaxis]), axis=2)
 
-        return num / denom
+        return Particle.prior_pdfs(particles) / (kernel @ np.asarray(prev_weights, dtype=float))
 
     # pylint: disable=too-many-arguments
     def add_iteration_statistics(
@@ -853,11 +575,12 @@ class ABCSMC:
         return results
 
 
-def run_inference(config) -> Dict:
+def run_inference(config, max_workers: Optional[int] = None) -> Dict:
     """Run inference routine
 
     :param config: Config file name
     :type config: string
+    :param max_workers: maximum number of processes used to evaluate the particles
     :return: Result runs for inference
     """
     info = common.get_repo_info()
@@ -877,6 +600,7 @@ def run_inference(config) -> Dict:
             store.read_table("human/movement-multipliers", "movement-multipliers"),
             store.read_table("human/stochastic-mode", "stochastic-mode"),
             store.read_table("human/random-seed", "random-seed"),
+            max_workers=max_workers,
         )
 
         t0 = time.time()
@@ -892,7 +616,7 @@ def main(argv):
     logger.info("Running inference ABC SMC...")
 
     t0 = time.time()
-    run_inference("../config_inference.yaml")
+    run_inference("../config_inference.yaml", max_workers=None if not args.workers else args.workers)
 
     logger.info("Writing output")
     logger.info("Took %.2fs to run the inference.", time.time() - t0)
@@ -0,0 +1,505 @@
+"""
+The variables inferred by the ABC-SMC inference, with their priors and perturbation kernels. Each particle of the
+inference holds one of each (see ``inference.Particle``).
+"""
+from __future__ import annotations
+
+import datetime as dt
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from more_itertools import pairwise
+
+if TYPE_CHECKING:
+    from .inference import ABCSMC
+
+
+def uniform_pdf(
+        x: Union[float, np.array],
+        a: Union[float, np.array],
+        b: Union[float, np.array]
+) -> Union[float, np.array]:
+    """pdf function for uniform distribution
+
+    :param x: value at which to evaluate the pdf
+    :param a: lower bound of the distribution
+    :param b: upper bound of the distribution
+    """
+    return ((a <= x) & (x <= b)) / (b - a)
+
+
+def lognormal(mean: float, stddev: float, stddev_min: float = -np.inf) -> stats.rv_continuous:
+    """Constructs Scipy lognormal object to match a given mean and std
+    dev passed as input. The parameters to input in the model are inverted
+    from the formulas:
+
+    .. math::
+            if X~LogNormal(mu, scale)
+        then:
+            E[X] = exp{mu + sigma^2 * 0.5}
+            Var[X] = (exp{sigma^2} - 1) * exp{2 * mu + sigma^2}
+
+    The stddev is taken as a % of the mean, floored at 10. This
+    allows natural scaling with the size of the population inside the
+    nodes, always allowing for a minimal uncertainty.
+
+    :param mean: Mean to match
+    :param stddev: Std dev to match
+    :param stddev_min: Minimum std dev to match
+    :return: Distribution object representing a lognormal distribution with
+    the given mean and std dev
+    """
+    stddev = np.maximum(mean * stddev, stddev_min)
+    sigma = np.sqrt(np.log(1 + (stddev**2 / mean**2)))
+    mu = np.log(mean / np.sqrt(1 + (stddev**2 / mean**2)))
+    return stats.lognorm(s=sigma, loc=0., scale=np.exp(mu))
+
+
+def split_dataframe(multipliers, partitions, col="Contact_Multiplier"):
+    df = multipliers.copy()
+    df.Date = pd.to_datetime(df.Date)
+    for prev_date, curr_date in pairwise(partitions):
+        index = (df.Date.dt.date < curr_date) & (df.Date.dt.date >= prev_date)
+        values = df.loc[index, col].values
+
+        if len(values) == 0:
+            continue
+
+        yield values[0], index
+
+
+class InferredVariable(ABC):
+    """
+    Abstract class representing a variable to infer in ABC-SMC. To be inferred,
+    we require from a parameter to:
+    - Sample and retrieve pdf from prior
+    - Perturb the parameter and get the perturbation pdf
+    - Validate if the parameter is correct
+    - Convert to frame to be initialize and run the model
+    """
+    value: pd.DataFrame
+
+    def __init__(self, value: pd.DataFrame, mean: pd.DataFrame):
+        self.value = value
+        self.mean = mean
+
+    @staticmethod
+    @abstractmethod
+    def generate_from_prior(fitter: ABCSMC) -> InferredVariable:
+        """ Abstract method for generating a parameter from the prior """
+
+    @abstractmethod
+    def generate_perturbated(self) -> InferredVariable:
+        """ Abstract method for generating a perturbated copy """
+
+    @abstractmethod
+    def validate(self) -> bool:
+        """ Abstract method for validating the parameter correctness """
+
+    @abstractmethod
+    def prior_pdf(self) -> float:
+        """ Abstract method for generating the prior pdf """
+
+    @abstractmethod
+    def perturbation_pdf(self, x: pd.DataFrame) -> float:
+        """ Abstract method for generating the perturbation pdf """
+
+    @abstractmethod
+    def to_array(self) -> np.ndarray:
+        """ Abstract method for converting the parameter into a flat array of values """
+
+    @abstractmethod
+    def kernel_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Abstract method for the bounds of the uniform perturbation around each of the values of to_array """
+
+    @abstractmethod
+    def prior_pdfs(self, values: np.ndarray) -> np.ndarray:
+        """ Abstract method for the prior pdf of each row of a (n, len(to_array())) matrix of values """
+
+
+class InferredInfectionProbability(InferredVariable):
+    """
+    Class representing inferred infection probability to be used inside ABC-SMC fitter.
+    Infection probability is the odd that a contact between an infectious and susceptible
+    person leads to a new infection.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            value: pd.DataFrame,
+            mean: pd.DataFrame,
+            shape: float,
+            kernel_sigma: float,
+            rng: np.random.Generator
+    ):
+        super().__init__(value, mean)
+        self.shape = shape
+        self.kernel_sigma = kernel_sigma
+        self.rng = rng
+
+    @staticmethod
+    def generate_from_prior(fitter: ABCSMC) -> InferredInfectionProbability:
+        """ Sample from prior distribution. For infection probability, we use
+        the value in the data pipeline as mean of our prior, and shape parameter
+        is fixed at 2. This defines a Beta distribution centered around our prior.
+
+        :param fitter: ABC-SMC fitter object
+        :return: New InferredInitialInfections randomly sampled from prior
+        """
+        shape = fitter.infection_probability_shape
+        sigma = fitter.infection_probability_kernel_sigma
+        mean = fitter.infection_probability
+
+        value = fitter.infection_probability.copy()
+        value.Value = fitter.rng.beta(shape, shape * (1 - mean.Value) / mean.Value)
+
+        return InferredInfectionProbability(value, mean, shape, sigma, fitter.rng)
+
+    def generate_perturbated(self) -> InferredInfectionProbability:
+        """ From current parameter, add a perturbation to infection probability and return
+        a newly created perturbated parameter:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(max(P_{t-1} - \sigma, 0),\min(\sigma + P_{t-1}, 1))
+
+        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
+        that the infection probability remains valid. This is correct as the algorithm
+        states that the particle should be re-sampled as long as the perturbation brings it
+        out of bounds, and the truncation of a uniform distribution is still a uniform
+        distribution.
+
+        :return: New parameter which is similar to self up to a perturbation
+        """
+        sigma = self.kernel_sigma
+        value = self.value.copy()
+        value.Value = self.rng.uniform(np.maximum(value.Value - sigma, 0), np.minimum(value.Value + sigma, 1.))
+        return InferredInfectionProbability(value, self.mean, self.shape, sigma, self.rng)
+
+    def validate(self) -> bool:
+        """ Checks that the particle is valid, i.e. that infection probability is
+        between 0 and 1.
+
+        :return: Whether the parameter is valid
+        """
+        return np.all(self.value.Value > 0.) and np.all(self.value.Value < 1.)
+
+    def prior_pdf(self) -> np.ndarray:
+        """ Compute pdf of the prior distribution evaluated at the parameter x.
+        Infection probability has a prior a beta distribution. The pdf is evaluated
+        at the current value of the parameter.
+
+        :return: pdf value of prior distribution evaluated at x
+        """
+        return np.prod(stats.beta.pdf(self.value.Value, self.shape,
+                                      self.shape * (1 - self.mean.Value) / self.mean.Value))
+
+    def perturbation_pdf(self, x: pd.DataFrame) -> np.ndarray:
+        """ Compute pdf of the perturbation evaluated at the parameter x,
+        from the current parameter. In ABC-SMC when a particle is sampled
+        from the previous population it is slightly perturbed:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(max(P_{t-1} - \sigma, 0),\min(\sigma + P_{t-1}, 1))
+
+        Given in the sampling the perturbation was capped and floored in [0, 1]
+        to keep the particle valid, it results in a truncated uniform
+        distribution which is reflected in the pdf.
+
+        :param x: Particle to evaluate the pdf at
+        :return: pdf value of perturbation from previous particle evaluated at x
+        """
+        return np.prod(uniform_pdf(x.Value, np.maximum(self.value.Value - self.kernel_sigma, 0),
+                                   np.minimum(self.value.Value + self.kernel_sigma, 1)))
+
+    def to_array(self) -> np.ndarray:
+        """ Infection probabilities as an array.
+
+        :return: The value of each infection probability
+        """
+        return self.value.Value.to_numpy(dtype=float)
+
+    def kernel_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Bounds of the uniform perturbation of each infection probability, see perturbation_pdf.
+
+        :return: Lower and upper bounds of the perturbation
+        """
+        value = self.to_array()
+        return np.maximum(value - self.kernel_sigma, 0.), np.minimum(value + self.kernel_sigma, 1.)
+
+    def prior_pdfs(self, values: np.ndarray) -> np.ndarray:
+        """ Vectorized prior_pdf, evaluated at many values at once.
+
+        :param values: A (n, len(to_array())) matrix of infection probabilities
+        :return: pdf value of prior distribution evaluated at each row
+        """
+        mean = self.mean.Value.to_numpy(dtype=float)
+        return np.prod(stats.beta.pdf(values, self.shape, self.shape * (1 - mean) / mean), axis=1)
+
+
+class InferredInitialInfections(InferredVariable):
+    """
+    Class representing inferred initial infections to be used inside ABC-SMC fitter.
+    Initial infections are the number of exposed individuals per node at the start
+    date of the model.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            value: pd.DataFrame,
+            mean: pd.DataFrame,
+            stddev: float,
+            stddev_min: float,
+            kernel_sigma: float,
+            rng: np.random.Generator
+    ):
+        super().__init__(value, mean)
+        self.stddev = stddev
+        self.stddev_min = stddev_min
+        self.kernel_sigma = kernel_sigma
+        self.rng = rng
+
+    @staticmethod
+    def generate_from_prior(fitter: ABCSMC) -> InferredInitialInfections:
+        """ Sample from prior distribution. For initial infections, we use
+        the values in the data pipeline as mean of our priors, and the std dev
+        is taken as a percentage of the mean. This allow the prior to scale
+        the uncertainty with the scale of the prior itself.
+
+        :param fitter: ABC-SMC fitter object
+        :return: New InferredInitialInfections randomly sampled from prior
+        """
+        stddev = fitter.initial_infections_stddev
+        stddev_min = fitter.initial_infections_stddev_min
+        sigma = fitter.initial_infections_kernel_sigma
+
+        value = fitter.initial_infections.copy()
+        value.Infected = lognormal(value.Infected, stddev, stddev_min).rvs(random_state=fitter.rng)
+
+        return InferredInitialInfections(value, fitter.initial_infections, stddev, stddev_min, sigma, fitter.rng)
+
+    def generate_perturbated(self) -> InferredInitialInfections:
+        """ From current table, add a perturbation to every parameter and return
+        a newly created perturbated particle. For initial infections, we apply a uniform
+        perturbation from the current value:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
+
+        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
+        that the infection probability remains valid. This is correct as the algorithm
+        states that the particle should be re-sampled as long as the perturbation brings it
+        out of bounds, and the truncation of a uniform distribution is still a uniform
+        distribution.
+
+        :return: New parameter which is similar to self up to a perturbation
+        """
+        sigma = self.kernel_sigma
+        value = self.value.copy()
+        value.Infected = self.rng.uniform(np.maximum(value.Infected - sigma, 0.), value.Infected + sigma)
+        return InferredInitialInfections(value, self.mean, self.stddev, self.stddev_min, self.kernel_sigma, self.rng)
+
+    def validate(self) -> bool:
+        """ Checks that the particle is valid, i.e. that all initial infections are
+        positive or 0.
+
+        :return: Whether the particle is valid
+        """
+        return np.all(self.value.Infected >= 0.)
+
+    def prior_pdf(self) -> float:
+        """ Compute pdf of the prior distribution evaluated at the parameter x.
+        As all priors are independent the joint pdf is the product of individual pdfs.
+        The pdf is evaluated at the current value of the parameter.
+
+        :return: pdf value of prior distribution evaluated at x
+        """
+        pdf = 1.
+        for index, row in self.mean.iterrows():
+            pdf *= lognormal(row.Infected, self.stddev, self.stddev_min).pdf(self.value.at[index, "Infected"])
+
+        return pdf
+
+    def perturbation_pdf(self, x: pd.DataFrame) -> float:
+        """ Compute pdf of the perturbation evaluated at the parameter ``x``,
+        from the current parameter. In ABC-SMC when a particle is sampled
+        from the previous population it is slightly perturbed:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
+
+        As all perturbations are independent the joint pdf is the product
+        of individual pdfs.
+
+        :param x: Particle to evaluate the pdf at
+        :return: pdf value of perturbation from previous particle evaluated at x
+        """
+        pdf = 1.
+        for index, row in self.value.iterrows():
+            pdf *= uniform_pdf(x.at[index, "Infected"], max(row.Infected - self.kernel_sigma, 0.),
+                               row.Infected + self.kernel_sigma)
+
+        return pdf
+
+    def to_array(self) -> np.ndarray:
+        """ Initial infections as an array, in the order of the mean table.
+
+        :return: The infections of each row
+        """
+        return self.value.Infected.reindex(self.mean.index).to_numpy(dtype=float)
+
+    def kernel_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Bounds of the uniform perturbation of each initial infection, see perturbation_pdf.
+
+        :return: Lower and upper bounds of the perturbation
+        """
+        value = self.to_array()
+        return np.maximum(value - self.kernel_sigma, 0.), value + self.kernel_sigma
+
+    def prior_pdfs(self, values: np.ndarray) -> np.ndarray:
+        """ Vectorized prior_pdf, evaluated at many values at once.
+
+        :param values: A (n, len(to_array())) matrix of initial infections
+        :return: pdf value of prior distribution evaluated at each row
+        """
+        mean = self.mean.Infected.to_numpy(dtype=float)
+        return np.prod(lognormal(mean, self.stddev, self.stddev_min).pdf(values), axis=1)
+
+
+class InferredContactMultipliers(InferredVariable):
+    """
+    Class representing inferred contact multipliers to be used inside ABC-SMC fitter.
+    Contact multipliers are adjustment numbers by which we adjust the contact to
+    simulate the effect of quarantine and social distancing.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            value: pd.DataFrame,
+            mean: pd.DataFrame,
+            stddev: float,
+            kernel_sigma: float,
+            partitions: List[dt.date],
+            rng: np.random.Generator
+    ):
+        super().__init__(value, mean)
+        self.stddev = stddev
+        self.rng = rng
+        self.kernel_sigma = kernel_sigma
+        self.partitions = partitions
+
+    @staticmethod
+    def generate_from_prior(fitter: ABCSMC) -> InferredContactMultipliers:
+        """ Sample from prior distribution. For contact multipliers, we use
+        the values in the data pipeline as mean of our priors, and the std dev
+        is taken as a fixed number. We use a lognormal prior.
+
+        :param fitter: ABC-SMC fitter object
+        :return: New InferredInitialInfections randomly sampled from prior
+        """
+        stddev = fitter.contact_multipliers_stddev
+        sigma = fitter.contact_multipliers_kernel_sigma
+        partitions = fitter.contact_multipliers_partitions
+
+        value = fitter.movement_multipliers.copy()
+        for multiplier, index in split_dataframe(value, partitions):
+            value.loc[index, "Contact_Multiplier"] = lognormal(multiplier, stddev).rvs(random_state=fitter.rng)
+
+        return InferredContactMultipliers(value, fitter.movement_multipliers, stddev, sigma, partitions, fitter.rng)
+
+    def generate_perturbated(self) -> InferredContactMultipliers:
+        """ From current table, add a perturbation to every parameter and return
+        a newly created perturbated particle. For contact multipliers, we apply a uniform
+        perturbation from the current value:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim Uniform(\max(P_{t-1} - \sigma, 0),P_{t-1} + \sigma)
+
+        A uniform perturbation of range 2 * kernel_sigma is targeted, with a floor at 0 so
+        that the infection probability remains valid. This is correct as the algorithm
+        states that the particle should be re-sampled as long as the perturbation brings it
+        out of bounds, and the truncation of a uniform distribution is still a uniform
+        distribution.
+
+        :return: New parameter which is similar to self up to a perturbation
+        """
+        value = self.value.copy()
+        for multiplier, index in split_dataframe(value, self.partitions):
+            value.loc[index, "Contact_Multiplier"] = self.rng.uniform(np.maximum(multiplier - self.kernel_sigma, 0.),
+                                                                      multiplier + self.kernel_sigma)
+
+        return InferredContactMultipliers(value, self.mean, self.stddev, self.kernel_sigma, self.partitions, self.rng)
+
+    def validate(self) -> bool:
+        """ Checks that the particle is valid, i.e. that all contact multipliers are
+        strictly positive 0.
+
+        :return: Whether the particle is valid
+        """
+        return np.all(self.value.Contact_Multiplier > 0.)
+
+    def prior_pdf(self) -> float:
+        """ Compute pdf of the prior distribution evaluated at the parameter x.
+        As all priors are independent the joint pdf is the product of individual pdfs.
+        The pdf is evaluated at the current value of the parameter.
+
+        :return: pdf value of prior distribution evaluated at x
+        """
+        pdf = 1.
+
+        for multiplier, index in split_dataframe(self.value, self.partitions):
+            mean_x = self.mean.loc[index, "Contact_Multiplier"].values[0]
+            pdf *= lognormal(mean_x, self.stddev).pdf(multiplier)
+
+        return pdf
+
+    def perturbation_pdf(self, x: pd.DataFrame) -> float:
+        """ Compute pdf of the perturbation evaluated at the parameter ``x``,
+        from the current parameter. In ABC-SMC when a particle is sampled
+        from the previous population it is slightly perturbed:
+
+        .. math::
+            P_t^* \sim K(P_t | P_{t-1}) \sim P_{t-1} + \sigma * Uniform([-1,1])
+
+        As all perturbations are independent the joint pdf is the product
+        of individual pdfs.
+
+        :param x: Particle to evaluate the pdf at
+        :return: pdf value of perturbation from previous particle evaluated at x
+        """
+        pdf = 1.
+        for multiplier, index in split_dataframe(self.value, self.partitions):
+            curr_x = x.loc[index, "Contact_Multiplier"].values[0]
+            pdf *= uniform_pdf(curr_x, max(multiplier - self.kernel_sigma, 0.), multiplier + self.kernel_sigma)
+
+        return pdf
+
+    def to_array(self) -> np.ndarray:
+        """ Contact multipliers as an array, with one value per partition.
+
+        :return: The multiplier of each partition
+        """
+        return np.array([multiplier for multiplier, _ in split_dataframe(self.value, self.partitions)], dtype=float)
+
+    def kernel_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Bounds of the uniform perturbation of each contact multiplier, see perturbation_pdf.
+
+        :return: Lower and upper bounds of the perturbation
+        """
+        value = self.to_array()
+        return np.maximum(value - self.kernel_sigma, 0.), value + self.kernel_sigma
+
+    def prior_pdfs(self, values: np.ndarray) -> np.ndarray:
+        """ Vectorized prior_pdf, evaluated at many values at once.
+
+        :param values: A (n, len(to_array())) matrix of contact multipliers
+        :return: pdf value of prior distribution evaluated at each row
+        """
+        mean = np.array([self.mean.loc[index, "Contact_Multiplier"].values[0]
+                         for _, index in split_dataframe(self.value, self.partitions)], dtype=float)
+        return np.prod(lognormal(mean, self.stddev).pdf(values), axis=1)
@@ -3,7 +3,7 @@
 import datetime
 import json
 import math
-from typing import Any, Dict, NamedTuple, List, Tuple, Union
+from typing import Any, Dict, NamedTuple, List, Optional, Tuple, Union
 
 import networkx as nx  # type: ignore
 import numpy as np  # type: ignore
@@ -209,6 +209,8 @@ def readABCSMCParameters(parameters: pd.DataFrame) -> Dict:
     parameters["initial_infections_kernel_sigma"] = float(parameters["initial_infections_kernel_sigma"])
     parameters["contact_multipliers_stddev"] = float(parameters["contact_multipliers_stddev"])
     parameters["contact_multipliers_kernel_sigma"] = float(parameters["contact_multipliers_kernel_sigma"])
+    # Optional: how many candidate particles are drawn and evaluated together, one at a time by default
+    parameters["batch_size"] = int(parameters.get("batch_size", 1))
 
     partitions = [datetime.datetime.strptime(d, '%Y-%m-%d').date()
                   for d in parameters["contact_multipliers_partitions"].split(", ")]
@@ -496,3 +498,21 @@ class MixingMatrix:
         all be strings, since that's how the public interface when indexing the matrix.
         """
         return iter(age_range for age_range in self._matrix)
+
+    @property
+    def ages(self) -> List[str]:
+        """The ages in the matrix, sorted. This is the default order of the rows and columns of :meth:`asArray`."""
+        return sorted(self._matrix)
+
+    def asArray(self, ages: Optional[List[str]] = None) -> np.ndarray:
+        """Return the matrix as a dense numpy array.
+
+        ``array[i, j]`` is the expected number of interactions someone in ``ages[i]`` will have with someone in
+        ``ages[j]`` in a day, ie. the same as ``self[ages[i]][ages[j]]``.
+
+        :param ages: The order of the rows and columns in the array. Defaults to :meth:`ages`.
+        :return: An (ages, ages) array
+        """
+        if ages is None:
+            ages = self.ages
+        return np.array([[self._matrix[ageTo][ageFrom] for ageFrom in ages] for ageTo in ages], dtype=float)
@@ -13,18 +13,37 @@ the model. The main entrypoint function for the simulation is :meth:`basicSimula
 will run a simulation based on the data in the `NetworkOfPopulation` instance and it will output a pandas DataFrame
 with disease progression over time. Just like most public functions in this module, it does not make changes to the
 objects passed as inputs.
+
+Three engines are available to run the simulation, selected with the ``engine`` parameter of
+:meth:`basicSimulationInternalAgeStructure`:
+
+1. ``"dict"`` -- The original implementation. The state of each node is a dict of ``(age, compartment)`` tuples which
+   gets rebuilt every day.
+2. ``"array"`` -- The state of the whole network is kept in a single ``(nodes, ages, compartments)`` numpy array. The
+   position of each node, age and compartment in that array is given by the `StateIndex` stored in the
+   `NetworkOfPopulation`. The movements between nodes are kept in sparse ``(destination, origin)`` matrices, so that
+   the contacts between nodes are computed with a single matrix-vector product. In deterministic mode it produces the
+   same numbers as the dict engine (up to floating point rounding), in stochastic mode it follows the same model but it
+   draws random numbers in a different order.
+3. ``"batched"`` -- The array engine, running several trials at once with a leading trials axis on the state array
+   (see :meth:`basicSimulationTrials`). Each trial draws its random numbers from its own generator, so the results of
+   every trial are the same as running it with the array engine on its own.
 """
 # pylint: disable=import-error
 # pylint: disable=too-many-lines
+import collections
 import copy
 import datetime as dt
 import logging
-from typing import Dict, Tuple, NamedTuple, List, Optional, Iterable, cast, Any, Union
+from pathlib import Path
+from typing import Dict, Tuple, NamedTuple, List, Optional, Iterable, Iterator, cast, Any, Union, Callable
 
 from data_pipeline_api import standard_api
 import networkx as nx  # type: ignore
 import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
+import scipy.sparse as sparse  # type: ignore
+import scipy.stats as stats  # type: ignore
 
 from simple_network_sim import loaders
 from simple_network_sim.common import Lazy, IssueSeverity, log_issue
@@ -38,6 +57,55 @@ NodeName = str
 
 RESULT_DTYPES = {"date": str, "age": "category", "state": "category", "node": "category"}
 
+DICT_ENGINE = "dict"
+ARRAY_ENGINE = "array"
+BATCHED_ENGINE = "batched"
+ENGINES = [DICT_ENGINE, ARRAY_ENGINE, BATCHED_ENGINE]
+
+# Name of the single age left when the ages are summed up (see OutputSelection)
+ALL_AGES = "all"
+
+
+class StateIndex(NamedTuple):
+    """
+    Integer positions of the nodes, ages and compartments along the axes of the ``(nodes, ages, compartments)`` arrays
+    used by the array engine. The dicts keep their insertion order, so ``list(index.nodes)`` is the list of node names
+    sorted by their position in the array.
+    """
+    nodes: Dict[NodeName, int]
+    ages: Dict[Age, int]
+    compartments: Dict[Compartment, int]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """
+        :return: The shape of a state array indexed by this object
+        """
+        return len(self.nodes), len(self.ages), len(self.compartments)
+
+
+class ParameterSchedule(NamedTuple):
+    """
+    The parameters that change over time, compiled into arrays indexed by the number of days since the start date. Each
+    array has one entry for every day from the start date to the end date (both inclusive), and the values are forward
+    filled, ie. each entry has the value in force on that day.
+    """
+    movement: np.ndarray
+    contact: np.ndarray
+    infectionProb: np.ndarray
+
+
+class OutputSelection(NamedTuple):
+    """
+    The part of the state recorded by the array engines (see :meth:`simulateStateArrays`), when only a few observables
+    are needed. Only the given nodes, ages and compartments are recorded, in the given order, or all of them when None.
+    With ``sumAges``, the selected ages are added up into a single age named ``ALL_AGES``.
+    """
+    nodes: Optional[List[NodeName]] = None
+    ages: Optional[List[Age]] = None
+    compartments: Optional[List[Compartment]] = None
+    sumAges: bool = False
+
 
 class NetworkOfPopulation(NamedTuple):
     """
@@ -55,6 +123,11 @@ class NetworkOfPopulation(NamedTuple):
     startDate: dt.date
     endDate: dt.date
     stochastic: bool
+    stateIndex: StateIndex
+    commuteMatrix: sparse.csr_matrix
+    deltaAdjustmentMatrix: sparse.csr_matrix
+    transitionMatrix: np.ndarray
+    schedule: ParameterSchedule
 
 
 def dateRange(startDate: dt.date, endDate: dt.date) -> Iterable[dt.date]:
@@ -102,14 +175,23 @@ def basicSimulationInternalAgeStructure(
         network: NetworkOfPopulation,
         initialInfections: Dict[NodeName, Dict[Age, float]],
         generator: np.random.Generator,
+        engine: str = DICT_ENGINE,
 ) -> Tuple[pd.DataFrame, List[standard_api.Issue]]:
     """Run the simulation of a disease progressing through a network of regions.
 
     :param network: This is a NetworkOfPopulation instance which will have the states field modified by this function.
     :param initialInfections: Initial infections of the disease
     :param generator: Seeded random number generated to use in this simulation
+    :param engine: Which implementation to use to run the simulation, one of ``ENGINES``. See the module documentation
+                   for the differences between them
     :return: A time series of the size of the infectious population.
     """
+    if engine in (ARRAY_ENGINE, BATCHED_ENGINE):
+        # A single trial of the batched engine is the same as the array engine
+        return _basicSimulationArray(network, initialInfections, generator)
+    if engine != DICT_ENGINE:
+        raise ValueError(f"Unknown engine {engine}. Valid values are: {', '.join(ENGINES)}")
+
     history: List[pd.DataFrame] = []
     issues: List[standard_api.Issue] = []
 
@@ -173,6 +255,27 @@ def basicSimulationInternalAgeStructure(
     return (pd.concat(history, copy=False, ignore_index=True), issues)
 
 
+def basicSimulationInternalAgeStructureByDay(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generator: np.random.Generator,
+        issues: Optional[List[standard_api.Issue]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Generator version of :meth:`basicSimulationInternalAgeStructure`, using the array engine. Rather than returning
+    the whole time series at the end, it yields the rows of each day as soon as that day has been simulated, so that
+    they can be written somewhere else without keeping the full history in memory.
+
+    :param network: This is a NetworkOfPopulation instance which will have the states field modified by this function.
+    :param initialInfections: Initial infections of the disease
+    :param generator: Seeded random number generated to use in this simulation
+    :param issues: if any issues are found and a list is passed as this parameter, append the issues to it.
+    :return: An iterator with a DataFrame per day, from the start date until the end date. Concatenating all of them
+             results in the same DataFrame :meth:`basicSimulationInternalAgeStructure` returns.
+    """
+    for date, state in iterateStateArrays(network, initialInfections, generator, issues if issues is not None else []):
+        yield arrayToPandas(date, state, network.stateIndex)
+
+
 def nodesToPandas(date: dt.date, nodes: Dict[NodeName, Dict[Tuple[Age, Compartment], float]]) -> pd.DataFrame:
     """
     Converts a dict of nodes into a pandas DataFrame
@@ -910,6 +1013,9 @@ def createNetworkOfPopulation(
             for compartment in compartments:
                 region[(age, compartment)] = 0
 
+    stateIndex = createStateIndex(list(graph.nodes()), progression)
+    commuteMatrix, deltaAdjustmentMatrix = createCommuteMatrices(graph, stateIndex)
+
     logger.info("Nodes: %s, Ages: %s, States: %s", len(state0), agesInInfectionMatrix, all_states)
     nop = NetworkOfPopulation(
         progression=progression,
@@ -924,10 +1030,310 @@ def createNetworkOfPopulation(
         startDate=start_date,
         endDate=end_date,
         stochastic=stochastic_mode,
+        stateIndex=stateIndex,
+        commuteMatrix=commuteMatrix,
+        deltaAdjustmentMatrix=deltaAdjustmentMatrix,
+        transitionMatrix=createTransitionMatrix(progression, stateIndex),
+        schedule=createParameterSchedule(start_date, end_date, movementMultipliers, infection_prob),
     )
     return (nop, issues)
 
 
+def withOverrides(
+        network: NetworkOfPopulation,
+        infection_prob: Optional[pd.DataFrame] = None,
+        initial_infections: Optional[pd.DataFrame] = None,
+        movement_multipliers_table: Optional[pd.DataFrame] = None,
+) -> NetworkOfPopulation:
+    """Creates a copy of an existing network with some of its parameters replaced. This is much cheaper than
+    :meth:`createNetworkOfPopulation`, since the graph, the populations and the matrices derived from them are shared
+    with the original network, which makes it suitable for running the same network with many different parameters.
+
+    :param network: object representing the network of populations
+    :param infection_prob: Probability that a given contact will result in an infection, if it should be replaced
+    :param initial_infections: Initial infections of the population at time 0, if they should be replaced
+    :param movement_multipliers_table: pd.Dataframe with the movement multipliers, if they should be replaced
+    :return: The new network
+    """
+    changes: Dict[str, Any] = {}
+    if infection_prob is not None:
+        changes["infectionProb"] = loaders.readInfectionProbability(infection_prob)
+    if initial_infections is not None:
+        changes["initialInfections"] = loaders.readInitialInfections(initial_infections)
+    if movement_multipliers_table is not None:
+        changes["movementMultipliers"] = loaders.readMovementMultipliers(movement_multipliers_table)
+    network = network._replace(**changes)
+    if infection_prob is not None or movement_multipliers_table is not None:
+        network = network._replace(schedule=createParameterSchedule(
+            network.startDate,
+            network.endDate,
+            network.movementMultipliers,
+            network.infectionProb,
+        ))
+    return network
+
+
+def createStateIndex(
+        nodes: List[NodeName],
+        progression: Dict[Age, Dict[Compartment, Dict[Compartment, float]]],
+) -> StateIndex:
+    """
+    Assigns an integer position to every node, age and compartment. The positions follow the order in which the
+    dict engine stores them (see :meth:`createNetworkOfPopulation`), ie. ages and compartments appear in the same order
+    as in the progression table and the susceptible compartment always comes first.
+
+    >>> createStateIndex(["nodea", "nodeb"], {"70+": {"E": {"E": 0.5, "I": 0.5}, "I": {"I": 0.9, "D": 0.1}}})
+    StateIndex(nodes={'nodea': 0, 'nodeb': 1}, ages={'70+': 0}, compartments={'S': 0, 'E': 1, 'I': 2, 'D': 3})
+
+    :param nodes: The names of all nodes in the network
+    :param progression: The disease progression table
+    :return: The StateIndex for the network
+    """
+    compartments = [SUSCEPTIBLE_STATE]
+    for states in progression.values():
+        for state in states:
+            if state not in compartments:
+                compartments.append(state)
+    # Compartments that people can move into but never leave come last
+    for states in progression.values():
+        for nextStates in states.values():
+            for nextState in nextStates:
+                if nextState not in compartments:
+                    compartments.append(nextState)
+
+    return StateIndex(
+        nodes={node: i for i, node in enumerate(nodes)},
+        ages={age: i for i, age in enumerate(progression)},
+        compartments={compartment: i for i, compartment in enumerate(compartments)},
+    )
+
+
+def createParameterSchedule(
+        startDate: dt.date,
+        endDate: dt.date,
+        movementMultipliers: Dict[dt.date, loaders.Multiplier],
+        infectionProb: Dict[dt.date, float],
+) -> ParameterSchedule:
+    """
+    Compiles the time series of parameters into arrays indexed by the number of days since the start date. The value
+    of each day is the same one :meth:`basicSimulationInternalAgeStructure` uses for that day.
+
+    >>> schedule = createParameterSchedule(
+    ...     dt.date(2020, 1, 1),
+    ...     dt.date(2020, 1, 4),
+    ...     {dt.date(2020, 1, 3): loaders.Multiplier(movement=0.5, contact=0.8)},
+    ...     {dt.date(2019, 12, 1): 0.1, dt.date(2020, 1, 2): 0.3},
+    ... )
+    >>> schedule.movement, schedule.contact, schedule.infectionProb
+    (array([1. , 1. , 0.5, 0.5]), array([1. , 1. , 0.8, 0.8]), array([0.1, 0.3, 0.3, 0.3]))
+
+    :param startDate: Start date of the network
+    :param endDate: End date of the network
+    :param movementMultipliers: Movement and contact multipliers indexed by date. The multipliers are 1.0 until the
+                                first date.
+    :param infectionProb: Infection probabilities indexed by date. There must be a value at or before the start date.
+    :return: The schedule of parameters
+    """
+    multipliers = getInitialParameter(startDate, movementMultipliers, loaders.Multiplier(contact=1.0, movement=1.0))
+    prob = getInitialParameter(startDate, infectionProb, default=None, raise_on_missing=True)
+
+    days = (endDate - startDate).days + 1
+    schedule = ParameterSchedule(movement=np.empty(days), contact=np.empty(days), infectionProb=np.empty(days))
+    for day in range(days):
+        date = startDate + dt.timedelta(days=day)
+        if day > 0:
+            multipliers = movementMultipliers.get(date, multipliers)
+            prob = infectionProb.get(date, prob)
+        schedule.movement[day] = multipliers.movement
+        schedule.contact[day] = multipliers.contact
+        schedule.infectionProb[day] = prob
+    return schedule
+
+
+def createTransitionMatrix(
+        progression: Dict[Age, Dict[Compartment, Dict[Compartment, float]]],
+        stateIndex: StateIndex,
+) -> np.ndarray:
+    """
+    Compiles the disease progression table into a dense ``(ages, compartments, compartments)`` array, where
+    ``matrix[age, src, dst]`` is the probability of moving from ``src`` into ``dst`` in one day. Compartments that are
+    not in the progression table (eg. susceptibles) have all-zero rows.
+
+    >>> index = StateIndex(nodes={}, ages={"70+": 0}, compartments={"S": 0, "E": 1, "I": 2})
+    >>> createTransitionMatrix({"70+": {"E": {"E": 0.4, "I": 0.6}, "I": {"I": 1.0}}}, index)
+    array([[[0. , 0. , 0. ],
+            [0. , 0.4, 0.6],
+            [0. , 0. , 1. ]]])
+
+    :param progression: The disease progression table
+    :param stateIndex: the positions of each age and compartment in the array
+    :return: The transition matrix for every age
+    """
+    nAges, nCompartments = len(stateIndex.ages), len(stateIndex.compartments)
+    matrix = np.zeros((nAges, nCompartments, nCompartments))
+    for age, compartments in progression.items():
+        for compartment, nextStates in compartments.items():
+            for nextState, prob in nextStates.items():
+                matrix[stateIndex.ages[age], stateIndex.compartments[compartment], stateIndex.compartments[nextState]] \
+                    = prob
+    return matrix
+
+
+def createCommuteMatrices(graph: nx.DiGraph, stateIndex: StateIndex) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """
+    Converts the edges of the movement graph into two sparse ``(destination, origin)`` matrices, one with the weights
+    and another one with the delta adjustments. Both matrices have exactly the same sparsity structure, so that their
+    ``data`` arrays can be combined element by element (see :meth:`getWeightMatrix`). Self loops are left out, since
+    people moving within a node are already covered by the internal contacts. The edges of each row are kept in the
+    order of ``graph.predecessors``, which is the order :meth:`getIncomingInfectiousContactsByNode` adds them up in, so
+    the indices are not necessarily sorted.
+
+    >>> graph = nx.DiGraph()
+    >>> graph.add_edge("nodea", "nodeb", weight=10.0, delta_adjustment=0.5)
+    >>> graph.add_edge("nodeb", "nodeb", weight=20.0, delta_adjustment=1.0)
+    >>> index = StateIndex(nodes={"nodea": 0, "nodeb": 1}, ages={}, compartments={})
+    >>> weights, deltas = createCommuteMatrices(graph, index)
+    >>> weights.toarray()
+    array([[ 0.,  0.],
+           [10.,  0.]])
+    >>> deltas.toarray()
+    array([[0. , 0. ],
+           [0.5, 0. ]])
+
+    :param graph: A graph with each region as a node and the weights corresponding to the movements
+                  between regions. Edges must contain weight and delta_adjustment attributes
+    :param stateIndex: the positions of each node in the matrices
+    :return: A tuple with the weights matrix and the delta adjustments matrix
+    """
+    nNodes = len(stateIndex.nodes)
+    rows: List[List[Tuple[int, float, float]]] = [[] for _ in range(nNodes)]
+    for dest, d in stateIndex.nodes.items():
+        for orig in graph.predecessors(dest):
+            if orig != dest:
+                edge = graph.get_edge_data(orig, dest)
+                rows[d].append((stateIndex.nodes[orig], edge["weight"], edge["delta_adjustment"]))
+    edges = [edge for row in rows for edge in row]
+    indices = np.array([edge[0] for edge in edges], dtype=int)
+    indptr = np.concatenate([[0], np.cumsum([len(row) for row in rows], dtype=int)])
+
+    weights = np.array([edge[1] for edge in edges], dtype=float)
+    deltaAdjustments = np.array([edge[2] for edge in edges], dtype=float)
+    return (
+        sparse.csr_matrix((weights, indices, indptr), shape=(nNodes, nNodes)),
+        sparse.csr_matrix((deltaAdjustments, indices.copy(), indptr.copy()), shape=(nNodes, nNodes)),
+    )
+
+
+def getWeightMatrix(
+        commuteMatrix: sparse.csr_matrix,
+        deltaAdjustmentMatrix: sparse.csr_matrix,
+        multiplier: float,
+) -> sparse.csr_matrix:
+    """
+    Applies the movement multiplier to every edge at once, using the same formula as :meth:`getWeight`.
+
+    :param commuteMatrix: sparse (destination, origin) matrix with the movement weights
+    :param deltaAdjustmentMatrix: sparse (destination, origin) matrix with the delta adjustments, it must have the same
+                                  structure as commuteMatrix
+    :param multiplier: Value that will dampen or heighten movements between nodes.
+    :return: A new sparse (destination, origin) matrix with the adjusted weights
+    """
+    weights = commuteMatrix.copy()
+    delta = commuteMatrix.data - (commuteMatrix.data * multiplier)
+    weights.data = commuteMatrix.data - (delta * deltaAdjustmentMatrix.data)
+    return weights
+
+
+class WeightMatrixCache:
+    """
+    Keeps the matrices returned by :meth:`getWeightMatrix` for the most recently used movement multipliers, so the
+    weights of every edge are only recalculated when the multiplier changes. The multiplier usually takes a handful of
+    values in a run, but the number of cached matrices is bounded by maxsize in case it varies a lot, and the least
+    recently used matrix is dropped first.
+
+    >>> cache = WeightMatrixCache(sparse.csr_matrix([[0.0, 2.0]]), sparse.csr_matrix([[0.0, 1.0]]), maxsize=1)
+    >>> cache.get(0.5).toarray()
+    array([[0., 1.]])
+    >>> cache.get(0.5) is cache.get(0.5)
+    True
+    """
+
+    def __init__(self, commuteMatrix: sparse.csr_matrix, deltaAdjustmentMatrix: sparse.csr_matrix, maxsize: int = 8):
+        """
+        :param commuteMatrix: sparse (destination, origin) matrix with the movement weights
+        :param deltaAdjustmentMatrix: sparse (destination, origin) matrix with the delta adjustments, it must have the
+                                      same structure as commuteMatrix
+        :param maxsize: Maximum number of matrices kept
+        """
+        assert maxsize > 0, "The cache must be able to hold at least one matrix"
+        self._commuteMatrix = commuteMatrix
+        self._deltaAdjustmentMatrix = deltaAdjustmentMatrix
+        self._maxsize = maxsize
+        self._matrices: "collections.OrderedDict[float, sparse.csr_matrix]" = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._matrices)
+
+    def get(self, multiplier: float) -> sparse.csr_matrix:
+        """
+        Returns the weight matrix for the multiplier, calculating it if it's not in the cache. The matrix is shared by
+        all callers, so it must not be changed.
+
+        :param multiplier: Value that will dampen or heighten movements between nodes.
+        :return: A sparse (destination, origin) matrix with the adjusted weights
+        """
+        multiplier = float(multiplier)
+        weights = self._matrices.get(multiplier)
+        if weights is None:
+            weights = getWeightMatrix(self._commuteMatrix, self._deltaAdjustmentMatrix, multiplier)
+            self._matrices[multiplier] = weights
+            if len(self._matrices) > self._maxsize:
+                self._matrices.popitem(last=False)
+        else:
+            self._matrices.move_to_end(multiplier)
+        return weights
+
+
+def saveNetworkArrays(network: NetworkOfPopulation, directory: Union[str, Path]) -> NetworkOfPopulation:
+    """
+    Saves the arrays used by the array engine (the commute matrices and the transition matrix) into .npy files, so
+    that several processes can share them with :meth:`loadNetworkArrays` instead of each receiving its own copy.
+
+    :param network: The network whose arrays will be saved
+    :param directory: An existing directory where the files are written
+    :return: A copy of the network without the saved arrays, which is cheaper to send to other processes
+    """
+    directory = Path(directory)
+    np.save(directory / "commute-data.npy", network.commuteMatrix.data)
+    np.save(directory / "commute-indices.npy", network.commuteMatrix.indices)
+    np.save(directory / "commute-indptr.npy", network.commuteMatrix.indptr)
+    np.save(directory / "delta-adjustment-data.npy", network.deltaAdjustmentMatrix.data)
+    np.save(directory / "transition.npy", network.transitionMatrix)
+    return network._replace(commuteMatrix=None, deltaAdjustmentMatrix=None, transitionMatrix=None)
+
+
+def loadNetworkArrays(network: NetworkOfPopulation, directory: Union[str, Path]) -> NetworkOfPopulation:
+    """
+    Puts back the arrays saved by :meth:`saveNetworkArrays`. The files are memory mapped read-only, so the operating
+    system keeps a single copy of them no matter how many processes load them.
+
+    :param network: The network returned by :meth:`saveNetworkArrays`
+    :param directory: The directory passed to :meth:`saveNetworkArrays`
+    :return: A copy of the network with all its arrays
+    """
+    directory = Path(directory)
+    shape = (len(network.stateIndex.nodes), len(network.stateIndex.nodes))
+    indices = np.load(directory / "commute-indices.npy", mmap_mode="r")
+    indptr = np.load(directory / "commute-indptr.npy", mmap_mode="r")
+    commuteData = np.load(directory / "commute-data.npy", mmap_mode="r")
+    deltaData = np.load(directory / "delta-adjustment-data.npy", mmap_mode="r")
+    return network._replace(
+        commuteMatrix=sparse.csr_matrix((commuteData, indices, indptr), shape=shape, copy=False),
+        deltaAdjustmentMatrix=sparse.csr_matrix((deltaData, indices, indptr), shape=shape, copy=False),
+        transitionMatrix=np.load(directory / "transition.npy", mmap_mode="r"),
+    )
+
+
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 def createNextStep(
@@ -1094,3 +1500,886 @@ def randomlyInfectRegions(
             infections[regionID][age] = infected
 
     return infections
+
+
+# The functions below implement the array engine. They work on a single (nodes, ages, compartments) numpy array instead
+# of the dicts of the functions above, and they use StateIndex to find out where each node, age and compartment is in
+# the array. The movements between nodes come from the sparse matrices in NetworkOfPopulation rather than from the
+# graph. The deterministic calculations follow the same formulas as the dict engine, but the numbers are not always
+# added up in the same order, so both engines agree up to floating point rounding.
+#
+# Every array can also have a leading trials axis, ie. (trials, nodes, ages, compartments), which is how the batched
+# engine runs several trials at once. In that case, the random numbers come from a TrialGenerators instance.
+
+
+class TrialGenerators:
+    """
+    One random number generator per trial, used in place of a ``np.random.Generator`` when the arrays have a leading
+    trials axis. Each method splits its array parameters along the first axis and draws the numbers of every trial from
+    that trial's own generator, with exactly the same parameters it would get if the trial was run on its own. Only the
+    methods used by the array engine are implemented.
+
+    :param generators: The generator of each trial
+    """
+
+    def __init__(self, generators: List[np.random.Generator]):
+        """Initialise."""
+        self.generators = list(generators)
+
+    def __len__(self):
+        """Return the number of trials."""
+        return len(self.generators)
+
+    def binomial(self, n: np.ndarray, p: Union[np.ndarray, float]) -> np.ndarray:
+        """Same as ``np.random.Generator.binomial``"""
+        n, p = np.broadcast_arrays(n, p)
+        return np.stack([generator.binomial(n[t], p[t]) for t, generator in enumerate(self.generators)])
+
+    def poisson(self, lam: np.ndarray) -> np.ndarray:
+        """Same as ``np.random.Generator.poisson``"""
+        return np.stack([generator.poisson(lam[t]) for t, generator in enumerate(self.generators)])
+
+    def hypergeometric(self, ngood: np.ndarray, nbad: np.ndarray, nsample: np.ndarray) -> np.ndarray:
+        """Same as ``np.random.Generator.hypergeometric``"""
+        ngood, nbad, nsample = np.broadcast_arrays(ngood, nbad, nsample)
+        return np.stack([
+            generator.hypergeometric(ngood[t], nbad[t], nsample[t]) for t, generator in enumerate(self.generators)
+        ])
+
+    def multinomial(self, n: np.ndarray, pvals: np.ndarray) -> np.ndarray:
+        """Same as ``np.random.Generator.multinomial``. The probabilities are shared by all trials."""
+        return np.stack([generator.multinomial(n[t], pvals) for t, generator in enumerate(self.generators)])
+
+
+def _basicSimulationArray(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generator: np.random.Generator,
+) -> Tuple[pd.DataFrame, List[standard_api.Issue]]:
+    """Run the simulation using the array engine. See :meth:`basicSimulationInternalAgeStructure` for a description of
+    the parameters.
+    """
+    history, issues = simulateStateArrays(network, initialInfections, generator)
+    return historyToPandas(network.startDate, history, network.stateIndex), issues
+
+
+def basicSimulationTrials(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generators: List[np.random.Generator],
+) -> List[Tuple[pd.DataFrame, List[standard_api.Issue]]]:
+    """Run several trials of the simulation at once, using the batched engine. The result of each trial is the same as
+    calling :meth:`basicSimulationInternalAgeStructure` with the array engine and that trial's generator.
+
+    :param network: This is a NetworkOfPopulation instance which will have the states field modified by this function.
+    :param initialInfections: Initial infections of the disease
+    :param generators: One seeded random number generator per trial
+    :return: A list with a time series and a list of issues for every trial
+    """
+    history, issues = simulateTrialStateArrays(network, initialInfections, generators)
+    return [
+        (historyToPandas(network.startDate, trialHistory, network.stateIndex), trialIssues)
+        for trialHistory, trialIssues in zip(history, issues)
+    ]
+
+
+def simulateStateArrays(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generator: np.random.Generator,
+        output: Optional[OutputSelection] = None,
+        until: Optional[Callable[[int, np.ndarray], bool]] = None,
+) -> Tuple[np.ndarray, List[standard_api.Issue]]:
+    """Run the simulation using the array engine, without converting the results into a DataFrame. The state of every
+    day is written into a single preallocated array, which can be converted with :meth:`historyToPandas` if needed.
+
+    :param network: This is a NetworkOfPopulation instance which will have the state of each node updated.
+    :param initialInfections: Initial infections that are applied to the network before the first step
+    :param generator: Seeded random number generator to use in the simulation
+    :param output: The parts of the state to record, all of it by default. The positions in the recorded states are
+                   given by :meth:`selectStateIndex`
+    :param until: Called with the number of days since the start date and the recorded state of that day, every day.
+                  The simulation stops as soon as it returns True, which is useful when the rest of the run is not
+                  going to be needed
+    :return: A tuple with a (days, nodes, ages, compartments) array, with one entry per day from the start date to the
+             end date (both inclusive) or to the day the simulation was stopped, and a list of issues found during the
+             simulation
+    """
+    issues: List[standard_api.Issue] = []
+    states = iterateStateArrays(network, initialInfections, generator, issues)
+    history = _simulateStateArrays(network, states, output, until)
+    return history, issues
+
+
+def simulateTrialStateArrays(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generators: List[np.random.Generator],
+        output: Optional[OutputSelection] = None,
+) -> Tuple[np.ndarray, List[List[standard_api.Issue]]]:
+    """Batched engine version of :meth:`simulateStateArrays`. All the trials are stepped forward together, with a
+    leading trials axis on the state array.
+
+    :param network: This is a NetworkOfPopulation instance which will have the state of each node updated.
+    :param initialInfections: Initial infections that are applied to the network before the first step
+    :param generators: One seeded random number generator per trial
+    :param output: The parts of the state to record, all of it by default
+    :return: A tuple with a (trials, days, nodes, ages, compartments) array and a list of issues for every trial
+    """
+    issues: List[List[standard_api.Issue]] = [[] for _ in generators]
+    states = iterateTrialStateArrays(network, initialInfections, generators, issues)
+    history = _simulateStateArrays(network, states, output)
+    return np.moveaxis(history, 1, 0), issues
+
+
+def iterateStateArrays(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generator: np.random.Generator,
+        issues: List[standard_api.Issue],
+) -> Iterator[Tuple[dt.date, np.ndarray]]:
+    """Run the simulation using the array engine, yielding the state of each day as soon as it is calculated.
+
+    :param network: This is a NetworkOfPopulation instance which will have the state of each node updated.
+    :param initialInfections: Initial infections that are applied to the network before the first step
+    :param generator: Seeded random number generator to use in the simulation
+    :param issues: Issues found during the simulation are appended to it
+    :return: An iterator of (date, (nodes, ages, compartments) array) tuples, from the start date until the end date
+    """
+    initialState = createExposedArray(
+        initialInfections,
+        createStateArray(network.initialState, network.stateIndex),
+        network.stateIndex,
+    )
+    return _iterateStateArrays(network, initialState, generator, issues)
+
+
+def iterateTrialStateArrays(
+        network: NetworkOfPopulation,
+        initialInfections: Dict[NodeName, Dict[Age, float]],
+        generators: List[np.random.Generator],
+        issues: List[List[standard_api.Issue]],
+) -> Iterator[Tuple[dt.date, np.ndarray]]:
+    """Batched engine version of :meth:`iterateStateArrays`.
+
+    :param network: This is a NetworkOfPopulation instance which will have the state of each node updated.
+    :param initialInfections: Initial infections that are applied to the network before the first step
+    :param generators: One seeded random number generator per trial
+    :param issues: One list per trial, issues found during the simulation of a trial are appended to its list
+    :return: An iterator of (date, (trials, nodes, ages, compartments) array) tuples, from the start date until the end
+             date
+    """
+    initialState = createExposedArray(
+        initialInfections,
+        createStateArray(network.initialState, network.stateIndex),
+        network.stateIndex,
+    )
+    initialState = np.repeat(initialState[np.newaxis], len(generators), axis=0)
+    return _iterateStateArrays(network, initialState, TrialGenerators(generators), issues)
+
+
+def _simulateStateArrays(
+        network: NetworkOfPopulation,
+        states: Iterator[Tuple[dt.date, np.ndarray]],
+        output: Optional[OutputSelection] = None,
+        until: Optional[Callable[[int, np.ndarray], bool]] = None,
+) -> np.ndarray:
+    """Writes the states of every day into a single preallocated array.
+
+    :param network: The network being simulated, used to find out the number of days
+    :param states: The iterator returned by :meth:`iterateStateArrays` or :meth:`iterateTrialStateArrays`
+    :param output: The parts of the states to write, all of them by default
+    :param until: Stops the simulation when it returns True (see :meth:`simulateStateArrays`)
+    :return: A (days,) + state.shape array, with the shape of the selected state if output is given
+    """
+    history: Optional[np.ndarray] = None
+    if output is not None:
+        select = createOutputSelector(network.stateIndex, output)
+        states = ((date, select(state)) for date, state in states)
+    for day, (_, state) in enumerate(states):
+        if history is None:
+            history = np.empty(((network.endDate - network.startDate).days + 1,) + state.shape)
+        history[day] = state
+        if until is not None and until(day, state):
+            return history[:day + 1]
+    return history
+
+
+def _iterateStateArrays(
+        network: NetworkOfPopulation,
+        initialState: np.ndarray,
+        random_state: Union[np.random.Generator, TrialGenerators],
+        issues: Union[List[standard_api.Issue], List[List[standard_api.Issue]]],
+) -> Iterator[Tuple[dt.date, np.ndarray]]:
+    """Steps the state forward from the start date until the end date, yielding the state of every day.
+
+    :param network: This is a NetworkOfPopulation instance which will have the state of each node updated.
+    :param initialState: The state at the start date, with the initial infections already applied. It may have a leading
+                         trials axis, in which case random_state must be a TrialGenerators instance
+    :param random_state: Random number generator used for the model
+    :param issues: Issues found during the simulation are appended to it. One list per trial if the state has a trials
+                   axis
+    :return: An iterator of (date, state) tuples, where each state has the same shape as initialState
+    """
+    compartments = list(network.stateIndex.compartments)
+    mixingMatrix = network.mixingMatrix.asArray(list(network.stateIndex.ages))
+    mixingOrder = createMixingOrder(network.mixingMatrix, network.stateIndex)
+    compartmentAxes = tuple(range(initialState.ndim - 1))
+    schedule = network.schedule
+    weightMatrices = WeightMatrixCache(network.commuteMatrix, network.deltaAdjustmentMatrix)
+
+    current = initialState
+    logger.debug("Date (%s/%s). Status: %s", network.startDate, network.endDate,
+                 Lazy(lambda: dict(zip(compartments, current.sum(axis=compartmentAxes)))))
+    yield network.startDate, current
+    for day, date in enumerate(dateRange(network.startDate, network.endDate), start=1):
+        progression = getInternalProgressionArray(
+            current,
+            network.transitionMatrix,
+            network.stochastic,
+            random_state,
+        )
+        internalContacts = getInternalInfectiousContactsArray(
+            current,
+            mixingMatrix,
+            schedule.contact[day],
+            network.infectiousStates,
+            network.stateIndex,
+            network.stochastic,
+            random_state,
+            mixingOrder=mixingOrder,
+        )
+        externalContacts = getExternalInfectiousContactsArray(
+            weightMatrices.get(schedule.movement[day]),
+            current,
+            network.infectiousStates,
+            network.stateIndex,
+            network.stochastic,
+            random_state,
+            issues=issues,
+        )
+
+        current = createNextStepArray(
+            progression,
+            internalContacts + externalContacts,
+            current,
+            schedule.infectionProb[day],
+            network.stateIndex,
+            network.stochastic,
+            random_state,
+        )
+
+        logger.debug("Date (%s/%s). Status: %s", date, network.endDate,
+                     Lazy(lambda: dict(zip(compartments, current.sum(axis=compartmentAxes)))))
+        yield date, current
+
+
+def createStateArray(nodes: Dict[NodeName, Dict[Tuple[Age, Compartment], float]], stateIndex: StateIndex) -> np.ndarray:
+    """
+    Converts a dict of nodes into the array used by the array engine. Anything not present in the dict is zero.
+
+    >>> index = StateIndex(nodes={"nodea": 0}, ages={"70+": 0}, compartments={"S": 0, "E": 1})
+    >>> createStateArray({"nodea": {("70+", "S"): 10.0, ("70+", "E"): 5.0}}, index)
+    array([[[10.,  5.]]])
+
+    :param nodes: a dict of nodes
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: a (nodes, ages, compartments) array with the number of people in each of them
+    """
+    state = np.zeros(stateIndex.shape)
+    for name, node in nodes.items():
+        for (age, compartment), value in node.items():
+            state[stateIndex.nodes[name], stateIndex.ages[age], stateIndex.compartments[compartment]] = value
+    return state
+
+
+def arrayToPandas(date: dt.date, state: np.ndarray, stateIndex: StateIndex) -> pd.DataFrame:
+    """
+    Converts a state array into a pandas DataFrame. The DataFrame has the same format as the one returned by
+    :meth:`nodesToPandas`.
+
+    >>> index = StateIndex(nodes={"nodea": 0}, ages={"70+": 0}, compartments={"S": 0, "E": 1})
+    >>> arrayToPandas(dt.date(2020, 1, 1), np.array([[[10.0, 15.0]]]), index)  # doctest: +NORMALIZE_WHITESPACE
+             date   node  age state  total
+    0  2020-01-01  nodea  70+     S   10.0
+    1  2020-01-01  nodea  70+     E   15.0
+
+    :param date: date that will be inserted into every row
+    :param state: a (nodes, ages, compartments) array
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: a pandas dataframe representation of the state
+    """
+    return historyToPandas(date, state[np.newaxis], stateIndex)
+
+
+def selectStateIndex(stateIndex: StateIndex, output: OutputSelection) -> StateIndex:
+    """
+    The positions of the nodes, ages and compartments in the states recorded with an output selection, which can be
+    used to convert them with :meth:`historyToPandas`.
+
+    >>> index = StateIndex(nodes={"a": 0, "b": 1}, ages={"70+": 0, "[0,17)": 1}, compartments={"S": 0, "D": 1})
+    >>> selectStateIndex(index, OutputSelection(nodes=["b"], compartments=["D"], sumAges=True))
+    StateIndex(nodes={'b': 0}, ages={'all': 0}, compartments={'D': 0})
+
+    :param stateIndex: the positions of each node, age and compartment in the full state
+    :param output: the parts of the state to record
+    :return: the positions of each node, age and compartment in the recorded state
+    """
+    def positions(selected: Optional[List[str]], index: Dict[str, int]) -> Dict[str, int]:
+        return dict(index) if selected is None else {name: i for i, name in enumerate(selected)}
+
+    return StateIndex(
+        nodes=positions(output.nodes, stateIndex.nodes),
+        ages={ALL_AGES: 0} if output.sumAges else positions(output.ages, stateIndex.ages),
+        compartments=positions(output.compartments, stateIndex.compartments),
+    )
+
+
+def createOutputSelector(stateIndex: StateIndex, output: OutputSelection) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Creates the function that takes the selected part out of a state array.
+
+    :param stateIndex: the positions of each node, age and compartment in the full state
+    :param output: the parts of the state to record
+    :return: a function from a (..., nodes, ages, compartments) array to the same array with only the selected nodes,
+             ages and compartments, and a single age if the ages are summed up
+    """
+    def positions(selected: Optional[List[str]], index: Dict[str, int], kind: str) -> List[int]:
+        if selected is None:
+            return list(index.values())
+        unknown = [name for name in selected if name not in index]
+        if unknown:
+            raise ValueError(f"Unknown {kind}: {', '.join(unknown)}")
+        return [index[name] for name in selected]
+
+    indices = (Ellipsis,) + np.ix_(
+        positions(output.nodes, stateIndex.nodes, "nodes"),
+        positions(output.ages, stateIndex.ages, "ages"),
+        positions(output.compartments, stateIndex.compartments, "compartments"),
+    )
+
+    def select(state: np.ndarray) -> np.ndarray:
+        selected = state[indices]
+        return selected.sum(axis=-2, keepdims=True) if output.sumAges else selected
+
+    return select
+
+
+def historyToPandas(startDate: dt.date, history: np.ndarray, stateIndex: StateIndex) -> pd.DataFrame:
+    """
+    Converts the states of consecutive days into a single pandas DataFrame, in the format returned by
+    :meth:`basicSimulationInternalAgeStructure`.
+
+    >>> index = StateIndex(nodes={"nodea": 0}, ages={"70+": 0}, compartments={"S": 0, "E": 1})
+    >>> historyToPandas(dt.date(2020, 1, 1), np.array([[[[10.0, 15.0]]], [[[8.0, 17.0]]]]), index)
+             date   node  age state  total
+    0  2020-01-01  nodea  70+     S   10.0
+    1  2020-01-01  nodea  70+     E   15.0
+    2  2020-01-02  nodea  70+     S    8.0
+    3  2020-01-02  nodea  70+     E   17.0
+
+    :param startDate: date of the first state in history
+    :param history: a (days, nodes, ages, compartments) array
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: a pandas dataframe representation of all the states
+    """
+    return historyIndex(startDate, len(history), stateIndex).assign(total=history.ravel())
+
+
+def pandasToHistory(df: pd.DataFrame, stateIndex: StateIndex) -> np.ndarray:
+    """
+    Converts the output of :meth:`basicSimulationInternalAgeStructure` back into the states of consecutive days, ie.
+    the inverse of :meth:`historyToPandas`. The rows must be in the order both engines write them in, which is the order
+    of the dates and then of the positions in stateIndex.
+
+    >>> index = StateIndex(nodes={"nodea": 0}, ages={"70+": 0}, compartments={"S": 0, "E": 1})
+    >>> pandasToHistory(historyToPandas(dt.date(2020, 1, 1), np.array([[[[10.0, 15.0]]], [[[8.0, 17.0]]]]), index), index)
+    array([[[[10., 15.]]],
+    <BLANKLINE>
+    <BLANKLINE>
+           [[[ 8., 17.]]]])
+
+    :param df: a pandas dataframe with every node, age and compartment of every day
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: a (days, nodes, ages, compartments) array
+    """
+    size = int(np.prod(stateIndex.shape))
+    assert len(df) % size == 0, f"{len(df)} rows can't be split into days of {size} rows"
+    return df["total"].to_numpy(dtype=float).reshape((-1,) + stateIndex.shape)
+
+
+def historyIndex(startDate: dt.date, nDays: int, stateIndex: StateIndex) -> pd.DataFrame:
+    """
+    Creates the date, node, age and state columns of :meth:`historyToPandas`, in the same order as the flattened
+    history. They are the same for every run of a network, so they can be created once and shared by all the runs, eg.
+    ``historyIndex(startDate, len(history), stateIndex).assign(total=history.ravel())``.
+
+    :param startDate: date of the first state in history
+    :param nDays: the number of days in history
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: a pandas dataframe with one row per value of a (days, nodes, ages, compartments) array
+    """
+    nNodes, nAges, nCompartments = stateIndex.shape
+    dates = [str(startDate + dt.timedelta(days=day)) for day in range(nDays)]
+    return pd.DataFrame({
+        "date": np.repeat(dates, nNodes * nAges * nCompartments),
+        "node": np.tile(np.repeat(list(stateIndex.nodes), nAges * nCompartments), nDays),
+        "age": np.tile(np.repeat(list(stateIndex.ages), nCompartments), nDays * nNodes),
+        "state": np.tile(list(stateIndex.compartments), nDays * nNodes * nAges),
+    }).astype(RESULT_DTYPES, copy=True)
+
+
+def createExposedArray(
+        infections: Dict[NodeName, Dict[Age, float]],
+        state: np.ndarray,
+        stateIndex: StateIndex,
+) -> np.ndarray:
+    """Array engine version of :meth:`createExposedRegions`.
+
+    :param infections: The number of infections per region per age
+    :param state: The current state array, it is not modified
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: A new state array with the infections moved from susceptible to exposed
+    """
+    exposedState = state.copy()
+    susceptible = stateIndex.compartments[SUSCEPTIBLE_STATE]
+    exposed = stateIndex.compartments[EXPOSED_STATE]
+    for nodeName, node in infections.items():
+        for age, value in node.items():
+            n = stateIndex.nodes[nodeName]
+            a = stateIndex.ages[age]
+            assert exposedState[n, a, susceptible] >= value, f"S:{exposedState[n, a, susceptible]} < E:{value}"
+            exposedState[n, a, exposed] += value
+            exposedState[n, a, susceptible] -= value
+    return exposedState
+
+
+def getInternalProgressionArray(
+        state: np.ndarray,
+        transitionMatrix: np.ndarray,
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`getInternalProgressionAllNodes`. In deterministic mode the progression of every
+    node is a single batched matrix product with the transition matrix.
+
+    In stochastic mode there is one multinomial draw (``random_state.multinomial`` with an array of ``n``) for each age
+    and compartment with outgoing transitions, covering every node at once. The draws happen in the order of the
+    positions in the transition matrix, ie. age by age and, within an age, compartment by compartment, so the same
+    generator state always results in the same progression.
+
+    :param state: The current state array, it is not modified
+    :param transitionMatrix: A (ages, compartments, compartments) array with the probabilities of progressing from one
+                             state to the next (see :meth:`createTransitionMatrix`)
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :return: A (nodes, ages, compartments) array with the number of people that progressed into each compartment. The
+             susceptible compartment is always zero.
+    """
+    if not stochastic:
+        return np.einsum("...as,asd->...ad", state, transitionMatrix)
+
+    progression = np.zeros(state.shape)
+    for a, c in zip(*np.nonzero(transitionMatrix.sum(axis=2))):
+        people = state[..., a, c]
+        assert np.all(np.mod(people, 1) == 0)
+        progression[..., a, :] += random_state.multinomial(people.astype(int), transitionMatrix[a, c])
+    return progression
+
+
+def _sumCompartments(state: np.ndarray, compartments: List[int]) -> np.ndarray:
+    """
+    Adds up the given compartments of a (nodes, ages, compartments) array. The sum is done one compartment at a time,
+    in the order given, which is the same order the dict engine uses.
+
+    :param state: a (nodes, ages, compartments) array
+    :param compartments: positions of the compartments to add up
+    :return: a (nodes, ages) array
+    """
+    total = np.zeros(state.shape[:-1])
+    for c in compartments:
+        total += state[..., c]
+    return total
+
+
+def _sumAges(values: np.ndarray, ages: List[int]) -> np.ndarray:
+    """
+    Adds up the given ages of a (nodes, ages) array, one age at a time, in the order given.
+
+    :param values: a (nodes, ages) array
+    :param ages: positions of the ages to add up
+    :return: a (nodes,) array
+    """
+    total = np.zeros(values.shape[:-1])
+    for a in ages:
+        total += values[..., a]
+    return total
+
+
+def createMixingOrder(mixingMatrix: loaders.MixingMatrix, stateIndex: StateIndex) -> List[List[int]]:
+    """
+    The order in which the dict engine adds up the contacts each age gets from every other age, ie. the order of the
+    rows of the mixing matrix, as positions in the state array.
+
+    >>> matrix = loaders.MixingMatrix({"a": {"b": 1.0, "a": 2.0}, "b": {"a": 0.5, "b": 1.0}})
+    >>> createMixingOrder(matrix, StateIndex(nodes={}, ages={"a": 0, "b": 1}, compartments={}))
+    [[1, 0], [0, 1]]
+
+    :param mixingMatrix: Stores expected numbers of interactions between people of different ages.
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :return: For each age, in the order of stateIndex, the positions of the ages it gets contacts from
+    """
+    return [
+        [stateIndex.ages[ageFrom] for ageFrom in mixingMatrix[ageTo] if ageFrom in stateIndex.ages]
+        for ageTo in stateIndex.ages
+    ]
+
+
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+def getInternalInfectiousContactsArray(
+        state: np.ndarray,
+        mixingMatrix: np.ndarray,
+        contactsMultiplier: float,
+        infectiousStates: List[Compartment],
+        stateIndex: StateIndex,
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+        mixingOrder: Optional[List[List[int]]] = None,
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`getInternalInfectiousContacts`. In deterministic mode the contacts of every node are
+    computed at once, one (receiving age, giving age) pair at a time. The pairs are added up in the same order as the
+    dict engine, given by mixingOrder, so that the results are exactly the same.
+
+    In stochastic mode the statistical model is the same as in :meth:`_computeInfectiousContactsStochastic`, but the
+    draws are made in aggregate (see :meth:`_sampleInfectiousContactsArray`), so memory use does not depend on the
+    number of infectious people.
+
+    :param state: The current state array, it is not modified
+    :param mixingMatrix: An (ages, ages) array, ordered as in stateIndex, with the expected numbers of interactions
+                         between people of different ages (see :meth:`loaders.MixingMatrix.asArray`)
+    :param contactsMultiplier: Multiplier applied to the number of infectious contacts.
+    :param infectiousStates: States that are considered infectious
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :param mixingOrder: For each age, the ages it gets contacts from, in the order they are added up (see
+                        :meth:`createMixingOrder`). Defaults to the order of stateIndex
+    :return: A (nodes, ages) array with the number of infectious contacts
+    """
+    susceptibles = state[..., stateIndex.compartments[SUSCEPTIBLE_STATE]]
+    totalInAge = _sumCompartments(state, list(stateIndex.compartments.values()))
+    infectious = _sumCompartments(state, [stateIndex.compartments[c] for c in infectiousStates])
+    hasSusceptibles = (susceptibles > 0) & (totalInAge > 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractionSus = np.where(hasSusceptibles, susceptibles / totalInAge, 0.0)
+
+    if stochastic:
+        return _sampleInfectiousContactsArray(
+            np.where(hasSusceptibles[..., np.newaxis], infectious[..., np.newaxis, :], 0.0),
+            mixingMatrix * contactsMultiplier,
+            susceptibles,
+            totalInAge,
+            random_state,
+        )
+
+    if mixingOrder is None:
+        mixingOrder = [list(stateIndex.ages.values())] * len(stateIndex.ages)
+    contacts = np.zeros(susceptibles.shape)
+    for ageTo, agesFrom in enumerate(mixingOrder):
+        for ageFrom in agesFrom:
+            # Same order of operations as in getInternalInfectiousContactsInNode
+            contacts[..., ageTo] += (
+                mixingMatrix[ageTo, ageFrom] * contactsMultiplier * infectious[..., ageFrom] * fractionSus[..., ageTo]
+            )
+    return contacts
+
+
+def _sampleInfectiousContactsArray(
+        infectious: np.ndarray,
+        contacts: np.ndarray,
+        susceptibles: np.ndarray,
+        totalInAge: np.ndarray,
+        random_state: Union[np.random.Generator, TrialGenerators],
+) -> np.ndarray:
+    """
+    Aggregate version of :meth:`_computeInfectiousContactsStochastic`, for every node and age at once. Each infectious
+    person has a Poisson number of contacts, capped to the number of people in the age group, and the contacts of each
+    person are drawn without replacement from that age group. Rather than drawing the contacts of each person:
+
+    1. We draw how many people have exactly ``j`` contacts, for ``j = 0, 1, ...``, as a chain of binomials with the
+       probability of having ``j`` contacts given at least ``j``, until everyone has been assigned a number.
+    2. We go through the contacts of everyone in parallel, counting the people who have found ``m`` susceptibles so
+       far. The next contact of someone who has already made ``s`` contacts reaches a susceptible with probability
+       ``(susceptibles - m) / (totalInAge - s)``, which is the hypergeometric draw of the dict engine, one contact at a
+       time. Before the ``s``-th contact, the people with exactly ``s`` contacts leave, chosen at random from every
+       group, since the number of contacts of a person doesn't depend on who they reach.
+
+    The number of draws depends on the largest number of contacts drawn, not on the number of infectious people.
+
+    :param infectious: A (nodes, ages, ages) array with the number of infectious people in the giving age (last axis)
+                       that make contacts in the receiving age (middle axis). It must be zero where the receiving age
+                       has no susceptibles
+    :param contacts: An (ages, ages) array with the mean number of contacts of a person in the giving age (columns)
+                     with people in the receiving age (rows)
+    :param susceptibles: A (nodes, ages) array with the number of susceptibles
+    :param totalInAge: A (nodes, ages) array with the number of people
+    :param random_state: Random number generator used for the model
+    :return: A (nodes, ages) array with the number of infectious contacts
+    """
+    assert np.all(np.mod(infectious, 1) == 0)
+    assert np.all(np.mod(totalInAge, 1) == 0)
+    assert np.all(np.mod(susceptibles, 1) == 0)
+    cap = totalInAge.astype(int)[..., np.newaxis]
+
+    # 1. How many people have each number of contacts, adding up all the giving ages
+    remaining = infectious.astype(int)
+    byNumberOfContacts = []
+    while np.any(remaining > 0):
+        j = len(byNumberOfContacts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hazard = stats.poisson.pmf(j, contacts) / stats.poisson.sf(j - 1, contacts)
+        hazard = np.where((j >= cap) | ~np.isfinite(hazard), 1.0, np.clip(hazard, 0.0, 1.0))
+        people = random_state.binomial(remaining, hazard)
+        remaining = remaining - people
+        byNumberOfContacts.append(people.sum(axis=-1))
+
+    # 2. The contacts of everyone, one at a time. active[..., m] is the number of people who have found m
+    # susceptibles so far and still have contacts left
+    total = np.zeros(susceptibles.shape)
+    if not byNumberOfContacts:
+        return total
+    active = np.zeros(susceptibles.shape + (len(byNumberOfContacts),), dtype=int)
+    active[..., 0] = sum(byNumberOfContacts)
+    for s, leaving in enumerate(byNumberOfContacts):
+        # multivariate hypergeometric draw of the people who leave, as a chain of hypergeometric draws
+        others = active.sum(axis=-1)
+        for m in range(s + 1):
+            if not np.any(leaving > 0):
+                break
+            others = others - active[..., m]
+            left = leaving if m == s else random_state.hypergeometric(active[..., m], others, leaving)
+            active[..., m] -= left
+            leaving = leaving - left
+            total += m * left
+        if s + 1 == len(byNumberOfContacts):
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            prob = (susceptibles[..., np.newaxis] - np.arange(s + 1)) / (totalInAge[..., np.newaxis] - s)
+        prob = np.where(active[..., :s + 1] > 0, np.clip(prob, 0.0, 1.0), 0.0)
+        found = random_state.binomial(active[..., :s + 1], prob)
+        active[..., :s + 1] -= found
+        active[..., 1:s + 2] += found
+    return total
+
+
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+def getExternalInfectiousContactsArray(
+        weights: sparse.csr_matrix,
+        state: np.ndarray,
+        infectiousStates: List[Compartment],
+        stateIndex: StateIndex,
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+        issues: Optional[List[standard_api.Issue]] = None,
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`getExternalInfectiousContacts`. The contacts through every edge are computed (or, in
+    stochastic mode, sampled) at once, and then added up for each destination with a single sparse matrix product. The
+    edges of each destination are added up in the order of ``weights`` (see :meth:`createCommuteMatrices`), and every
+    product is evaluated in the same order as in :meth:`getIncomingInfectiousContactsByNode`, so the deterministic
+    results are exactly the same as the dict engine's.
+
+    :param weights: A sparse (destination, origin) matrix with the movements between nodes, with the movement
+                    multiplier already applied (see :meth:`getWeightMatrix`). Self loops are expected to be absent.
+    :param state: The current state array, it is not modified
+    :param infectiousStates: States that are considered infectious
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :param issues: if any issues are found and a list is passed as this parameter, append the issues to it.
+    :return: A (nodes, ages) array with the number of infectious contacts
+    """
+    susceptibles = state[..., stateIndex.compartments[SUSCEPTIBLE_STATE]]
+    # The dict engine goes through the compartments of a node age by age, so we do the same here
+    infectiousByNode = np.zeros(state.shape[:-2])
+    totalByNode = np.zeros(state.shape[:-2])
+    for a in stateIndex.ages.values():
+        for compartment, c in stateIndex.compartments.items():
+            totalByNode += state[..., a, c]
+            if compartment in infectiousStates:
+                infectiousByNode += state[..., a, c]
+    sortedAges = [stateIndex.ages[age] for age in sorted(stateIndex.ages)]
+    totalSusceptibles = _sumAges(susceptibles, sortedAges)
+
+    # Nodes with no infectious people don't give any contacts, and nodes with no susceptibles don't receive any. That
+    # also takes care of nodes with nobody in them.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractionGivingInfected = np.where(infectiousByNode > 0, infectiousByNode / totalByNode, 0.0)
+        fractionReceivingSus = np.where(totalSusceptibles > 0, totalSusceptibles / totalByNode, 0.0)
+
+    dests = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+    if stochastic:
+        # Same as _computeInfectiousCommutesStochastic, but for every edge at once. Edges going into a node without
+        # susceptibles or coming from a node without infectious people always result in zero contacts.
+        commutes = random_state.binomial(np.round(weights.data).astype(int), fractionReceivingSus[..., dests])
+        contactsByEdge = random_state.binomial(commutes, fractionGivingInfected[..., weights.indices]).astype(float)
+    else:
+        contactsByEdge = weights.data * fractionGivingInfected[..., weights.indices] * fractionReceivingSus[..., dests]
+    # A (destinations, edges) matrix of ones: the product adds up the edges of each destination one by one, in order
+    edgesByDestination = sparse.csr_matrix(
+        (np.ones(weights.nnz), np.arange(weights.nnz), weights.indptr),
+        shape=(weights.shape[0], weights.nnz),
+    )
+    incomingContacts = (edgesByDestination @ contactsByEdge.T).T
+
+    return distributeContactsOverAgesArray(
+        susceptibles,
+        totalSusceptibles,
+        incomingContacts,
+        sortedAges,
+        stochastic,
+        random_state,
+        issues=issues,
+    )
+
+
+# pylint: disable=too-many-arguments
+def distributeContactsOverAgesArray(
+        susceptibles: np.ndarray,
+        totalSusceptibles: np.ndarray,
+        newContacts: np.ndarray,
+        ages: List[int],
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+        issues: Optional[List[standard_api.Issue]] = None,
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`distributeContactsOverAges`, distributing the contacts of every node at once.
+
+    :param susceptibles: A (nodes, ages) array with the number of susceptibles
+    :param totalSusceptibles: A (nodes,) array with the total number of susceptibles in each node
+    :param newContacts: A (nodes,) array with the number of contacts to be distributed across age ranges
+    :param ages: The positions of the ages, in the order in which the contacts are distributed
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :param issues: if any issues are found and a list is passed as this parameter, append the issues to it. Logging will
+                   happen regardless. If the arrays have a leading trials axis, this must have one list per trial.
+    :return: A (nodes, ages) array with the number of new infections in each age group
+    """
+    for position in zip(*np.nonzero(totalSusceptibles < newContacts)):
+        trialIssues = issues[position[0]] if issues is not None and totalSusceptibles.ndim > 1 else issues
+        log_issue(
+            logger,
+            f"totalSus < incoming contacts ({totalSusceptibles[position]} < {newContacts[position]}) - adjusting to "
+            f"totalSus",
+            IssueSeverity.HIGH,
+            trialIssues if trialIssues is not None else [],
+        )
+    newContacts = np.minimum(newContacts, totalSusceptibles)
+
+    newInfections = np.zeros(susceptibles.shape)
+    if stochastic:
+        assert np.all(np.mod(newContacts, 1) == 0)
+        # A multinomial for every node, drawn as a chain of binomials: each age gets its share of the contacts that
+        # were not given to the ages before it
+        remainingContacts = newContacts
+        remainingSusceptibles = totalSusceptibles
+        for a in ages:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                prob = np.where(remainingSusceptibles > 0, susceptibles[..., a] / remainingSusceptibles, 0.0)
+            newInfections[..., a] = random_state.binomial(remainingContacts.astype(int), np.minimum(prob, 1.0))
+            remainingContacts = remainingContacts - newInfections[..., a]
+            remainingSusceptibles = remainingSusceptibles - susceptibles[..., a]
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for a in ages:
+                newInfections[..., a] = np.where(
+                    totalSusceptibles > 0,
+                    (susceptibles[..., a] / totalSusceptibles) * newContacts,
+                    0.0,
+                )
+    return newInfections
+
+
+# pylint: disable=too-many-arguments
+def createNextStepArray(
+        progression: np.ndarray,
+        infectiousContacts: np.ndarray,
+        state: np.ndarray,
+        infectionProb: float,
+        stateIndex: StateIndex,
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`createNextStep`.
+
+    :param progression: A (nodes, ages, compartments) array with the number of individuals that have progressed into
+                        each compartment
+    :param infectiousContacts: A (nodes, ages) array with the number of contacts
+    :param state: The current state array, it is not modified
+    :param infectionProb: the expected rate at which contacts will transmit the diseases
+    :param stateIndex: the positions of each node, age and compartment in the array
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :return: The new state array
+    """
+    susceptible = stateIndex.compartments[SUSCEPTIBLE_STATE]
+    exposedState = stateIndex.compartments[EXPOSED_STATE]
+
+    nextStep = progression.copy()
+    nextStep[..., susceptible] = state[..., susceptible]
+
+    exposed = calculateExposedArray(
+        nextStep[..., susceptible],
+        infectiousContacts,
+        infectionProb,
+        stochastic,
+        random_state,
+    )
+    assert np.all(nextStep[..., susceptible] >= exposed), "S < E"
+
+    nextStep[..., exposedState] += exposed
+    nextStep[..., susceptible] -= exposed
+
+    return nextStep
+
+
+def calculateExposedArray(
+        susceptible: np.ndarray,
+        contacts: np.ndarray,
+        infectionProb: float,
+        stochastic: bool,
+        random_state: Optional[Union[np.random.Generator, TrialGenerators]],
+) -> np.ndarray:
+    """
+    Array engine version of :meth:`calculateExposed`. Look at its documentation for an explanation of the maths.
+
+    :param susceptible: array with the number of susceptible individuals
+    :param contacts: array, with the same shape as susceptible, with the number of contacts
+    :param infectionProb: probability (float) that a given contact will result in infection
+    :param stochastic: Whether to run the model in a stochastic or deterministic mode
+    :param random_state: Random number generator used for the model
+    :return: array, with the same shape as susceptible, with the number of newly exposed individuals
+    """
+    adjustedContacts = np.array(contacts, dtype=float)
+    chosen = susceptible > 1.
+    # numpy may evaluate ** with vectorised routines that differ from the C library in the last bit, and that error is
+    # amplified by (1 - probaNeverChosen). We use python floats so that we get exactly the same results as the dict
+    # engine
+    probaNeverChosen = np.array([
+        base ** exponent for base, exponent in zip((1 - (1 / susceptible[chosen])).tolist(), contacts[chosen].tolist())
+    ])
+    adjustedContacts[chosen] = susceptible[chosen] * (1 - probaNeverChosen)
+
+    if stochastic:
+        infectiousContacts = random_state.binomial(np.round(adjustedContacts).astype(int), infectionProb)
+    else:
+        infectiousContacts = adjustedContacts * infectionProb
+
+    return np.minimum(infectiousContacts, susceptible)
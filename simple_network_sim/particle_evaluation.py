@@ -0,0 +1,208 @@
+"""
+Scores the particles of the ABC-SMC inference, by running the model with their parameters and comparing the deaths of
+the run with the historical deaths. This is kept apart from the ``ABCSMC`` fitter, so that only what is needed to score
+a particle is sent to the worker processes.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import logging
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from data_pipeline_api import standard_api
+
+from . import network_of_populations as ss
+from .pool import loadPublishedNetwork, loadPublishedObject
+
+if TYPE_CHECKING:
+    from .inference import Particle
+
+logger = logging.getLogger(__name__)
+
+
+class WeeklyDeathsDistance:
+    """
+    Streaming version of ``ParticleEvaluator.compute_deaths_distance``, which is updated with the deaths of each day as
+    the model runs. The squared error of each week is added as soon as the week is over, and since the remaining weeks
+    can only add to it, the distance computed with the weeks seen so far is a lower bound of the final distance. This
+    allows rejecting a particle as soon as that bound goes over the threshold, without running the model until the end
+    date.
+    """
+
+    def __init__(self, historical_weekly_deaths: np.ndarray, n_days: int):
+        """
+        :param historical_weekly_deaths: A (weeks, nodes) array with the historical deaths, NaN where unknown
+        :param n_days: Number of days in a run, from the start date to the end date (both inclusive)
+        """
+        self.historical_weekly_deaths = historical_weekly_deaths
+        self.observed = ~np.isnan(historical_weekly_deaths)
+        self.n_observed = self.observed.sum()
+        self.n_days = n_days
+        self.squared_error = 0.
+        self.week_start_deaths: Optional[np.ndarray] = None
+
+    def add(self, day: int, deaths: np.ndarray) -> float:
+        """ Adds the deaths of the next day.
+
+        :param day: Number of days since the start date
+        :param deaths: Cumulative deaths in each node on that day
+        :return: The lower bound of the distance, including the week that has just ended, if any
+        """
+        if self.week_start_deaths is None:
+            # Nothing is counted on the first day, since the deaths before it aren't known
+            self.week_start_deaths = deaths
+        if day % 7 == 6 or day == self.n_days - 1:
+            week = day // 7
+            observed = self.observed[week]
+            error = (deaths - self.week_start_deaths)[observed] - self.historical_weekly_deaths[week, observed]
+            self.squared_error += np.sum(error**2)
+            self.week_start_deaths = deaths
+        return self.distance()
+
+    def distance(self) -> float:
+        """
+        :return: The distance with the weeks added so far, which is the final distance once all days are added
+        """
+        return np.sqrt(self.squared_error / self.n_observed)
+
+
+class ParticleEvaluator(NamedTuple):
+    """
+    Everything needed to score a particle: the base network every particle's network is made from, the historical
+    deaths it's compared with, the seed of the run and the threshold above which particles are rejected.
+    """
+    network: Optional[ss.NetworkOfPopulation]
+    historical_weekly_deaths: np.ndarray
+    random_seed: int
+    threshold: float = np.inf
+
+    @staticmethod
+    def create(network: ss.NetworkOfPopulation, historical_deaths: pd.DataFrame, random_seed: int) -> ParticleEvaluator:
+        """ Creates the evaluator of a network. The weekly deaths of a run are compared with the historical deaths of
+        the same weeks and nodes, which are picked here once, so that scoring a particle only needs array operations
+        (see compute_deaths_distance).
+
+        :param network: The base network, with everything the particles don't change
+        :param historical_deaths: The historical deaths, with one row per date and one column per node
+        :param random_seed: The seed used to create the seed of the run
+        :return: The evaluator, with no threshold
+        """
+        n_days = (network.endDate - network.startDate).days + 1
+        weeks = pd.to_datetime([network.startDate + dt.timedelta(days=int(day)) for day in range(0, n_days, 7)])
+        historical_weekly_deaths = (
+            historical_deaths
+            .reindex(index=weeks, columns=list(network.stateIndex.nodes))
+            .to_numpy(dtype=float)
+        )
+        return ParticleEvaluator(network, historical_weekly_deaths, random_seed)
+
+    @property
+    def n_days(self) -> int:
+        """Number of days in a run, from the start date to the end date (both inclusive)"""
+        assert self.network is not None, "The evaluator has no network"
+        return (self.network.endDate - self.network.startDate).days + 1
+
+    def evaluate(self, particle: Particle) -> float:
+        """ Runs the model with a particle and computes its distance. The run stops as soon as the distance is certain
+        to exceed the threshold (see ``WeeklyDeathsDistance``), since the particle can't be accepted anyway.
+
+        :param particle: Particle under consideration
+        :return: The distance of the particle, or a lower bound of it above the threshold if the run was stopped
+        """
+        bound = WeeklyDeathsDistance(self.historical_weekly_deaths, self.n_days)
+        deaths = self.simulate_deaths(particle, until=lambda day, deaths: bound.add(day, deaths) > self.threshold)
+        if len(deaths) < self.n_days:
+            return bound.distance()
+        return self.compute_deaths_distance(deaths)
+
+    def simulate_deaths(
+            self,
+            particle: Particle,
+            until: Optional[Callable[[int, np.ndarray], bool]] = None
+    ) -> np.ndarray:
+        """ Run the model using current particle as parameters, keeping only the deaths. The model is run with the
+        array engine, which only records the deaths of each node (summed over the ages), so no other compartment or
+        DataFrame is ever built.
+
+        :param particle: Particle under consideration
+        :param until: Called with the number of days since the start date and the cumulative deaths in each node on
+                      that day, every day. The run stops as soon as it returns True
+        :return: A (days, nodes) array with the cumulative deaths in each node, nodes in the order of the network. If
+                 the run was stopped, it only goes up to that day
+        """
+        network = self.create_network(particle)
+        # There is a single trial (see ABCSMC), using the same seed sampleUseOfModel.runTrial would give it
+        seed = np.random.SeedSequence(self.random_seed).spawn(network.trials)[0]
+        history, issues = ss.simulateStateArrays(
+            network,
+            network.initialInfections,
+            np.random.default_rng(seed),
+            output=ss.OutputSelection(compartments=["D"], sumAges=True),
+            until=None if until is None else lambda day, state: until(day, state[:, 0, 0]),
+        )
+        log_issues(issues)
+        return history[:, :, 0, 0]
+
+    def create_network(self, particle: Particle) -> ss.NetworkOfPopulation:
+        """ Creates the network of populations with the parameters of a particle.
+
+        :param particle: Particle under consideration
+        :return: The base network with the particle's parameters
+        """
+        assert self.network is not None, "The evaluator has no network"
+        return ss.withOverrides(
+            self.network,
+            infection_prob=particle.inferred_variables["infection-probability"].value,
+            initial_infections=particle.inferred_variables["initial-infections"].value,
+            movement_multipliers_table=particle.inferred_variables["contact-multipliers"].value,
+        )
+
+    def compute_deaths_distance(self, deaths: np.ndarray) -> float:
+        """ Computes distance between target and model run with current particle.
+        For dynamical systems such as epidemiological models, the distance generally
+        used is the root mean squared distance between model and historical outputs.
+        e.g. for a dynamical system which outputs `y(t)` (number of deaths, number
+        of infected, etc):
+
+        .. math::
+            \\sqrt{\\sum_{t=1,...,T} ( y_{model}(t) - y_{reality}(t) )^2}
+
+        In our case, `y(t)` is the number of deaths per node and per week. The daily deaths are
+        summed into weeks starting at the start date and compared with the historical deaths picked
+        in create, ignoring the weeks and nodes without historical data.
+
+        :param deaths: A (days, nodes) array with the cumulative deaths in each node, as returned by simulate_deaths
+        :return: distance value between model run and target
+        """
+        # Nothing is counted on the first day, since the deaths before it aren't known
+        daily = np.diff(deaths, axis=0, prepend=deaths[:1])
+        weekly = np.add.reduceat(daily, np.arange(0, self.n_days, 7), axis=0)
+        observed = ~np.isnan(self.historical_weekly_deaths)
+        squared = (weekly[observed] - self.historical_weekly_deaths[observed])**2
+        return np.sqrt(squared.sum() / squared.size)
+
+
+def log_issues(issues: List[standard_api.Issue], action: str = "running the model"):
+    """ Logs the issues found when running the model.
+
+    :param issues: Issues found when running the model
+    :param action: What was being done when the issues were found
+    """
+    if issues:
+        logger.warning("We had %s issues when %s:", len(issues), action)
+        for issue in issues:
+            logger.warning("%s (severity: %s)", issue.description, issue.severity)
+
+
+def evaluate_published_particle(network_directory: str, evaluator_directory: str, particle: Particle) -> float:
+    """ Runs the model with a particle and computes its distance, in a worker process.
+
+    :param network_directory: The directory the evaluator's network was published to (see ABCSMC.publish)
+    :param evaluator_directory: The directory the evaluator was published to, without its network
+    :param particle: Particle under consideration
+    :return: distance value between model run and target
+    """
+    evaluator = loadPublishedObject(evaluator_directory)
+    return evaluator._replace(network=loadPublishedNetwork(network_directory)).evaluate(particle)
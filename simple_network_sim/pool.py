@@ -0,0 +1,180 @@
+"""
+A pool of worker processes that runs the trials of the simulations, and the functions the workers use to load the
+networks published to them and to run their trials.
+"""
+# pylint: disable=import-error
+from concurrent import futures
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Any, List, Optional, Tuple, cast
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from . import network_of_populations as ss
+
+
+class SimulationPool:
+    """
+    A pool of worker processes that can be reused to run the trials of many networks, eg. one network per particle
+    during inference. The processes are only started when the pool is first used, and they are kept (along with
+    everything they have imported) until the pool is closed. Use it as a context manager to make sure it's closed:
+
+    .. code-block:: python
+
+        with SimulationPool() as pool:
+            for network in networks:
+                results = sampleUseOfModel.runSimulation(network, random_seed, issues, pool=pool)
+
+    A network is published to the workers once before its trials run: its arrays are shared through memory mapped files
+    (see :meth:`ss.saveNetworkArrays`) and the rest of it is loaded by each worker the first time it gets one of its
+    trials. The tasks themselves only carry the seeds of the trials. A closed pool can be used again, in which case new
+    processes are started.
+
+    :param max_workers: maximum number of processes, defaults to the number of CPUs in the machine
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """Initialise."""
+        self._maxWorkers = max_workers
+        self._executor: Optional[futures.ProcessPoolExecutor] = None
+        # Created when the first network or object is published, and removed with everything in it by close
+        self._directory: Optional[Path] = None
+        self._published = 0
+
+    def __enter__(self) -> "SimulationPool":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def max_workers(self) -> int:
+        """The number of processes in the pool"""
+        return self._maxWorkers or os.cpu_count() or 1
+
+    def submit(self, fn, *args) -> futures.Future:
+        """Schedules fn(*args) to run in one of the processes, starting them if needed.
+
+        :param fn: a function that can be pickled
+        :param args: the arguments of fn
+        :return: The future of the call
+        """
+        if self._executor is None:
+            self._executor = futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(fn, *args)
+
+    def publish(self, network: ss.NetworkOfPopulation) -> str:
+        """Saves a network where the workers can load it from.
+
+        :param network: object representing the network of populations
+        :return: The directory that identifies the network in the tasks, it's never reused while the pool is open
+        """
+        directory = self._newDirectory("network")
+        pd.to_pickle(ss.saveNetworkArrays(network, directory), directory / "network.pkl")
+        return str(directory)
+
+    def publishObject(self, obj: Any) -> str:
+        """Saves any other object the tasks need where the workers can load it from (see
+        :meth:`loadPublishedObject`), so that it's pickled once rather than with every task.
+
+        :param obj: an object that can be pickled
+        :return: The directory that identifies the object in the tasks, it's never reused while the pool is open
+        """
+        directory = self._newDirectory("object")
+        pd.to_pickle(obj, directory / "object.pkl")
+        return str(directory)
+
+    def _newDirectory(self, kind: str) -> Path:
+        if self._directory is None:
+            self._directory = Path(tempfile.mkdtemp(prefix="simulation-pool-"))
+        directory = self._directory / f"{kind}-{self._published}"
+        self._published += 1
+        directory.mkdir()
+        return directory
+
+    @staticmethod
+    def unpublish(directory: str):
+        """Removes a network or object that was published, once none of the tasks using it are running.
+
+        :param directory: The directory returned by :meth:`publish` or :meth:`publishObject`
+        """
+        shutil.rmtree(directory)
+
+    def close(self):
+        """Stops the processes and removes all the published networks"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._directory is not None:
+            shutil.rmtree(self._directory)
+            self._directory = None
+
+
+# The last network used by a worker process, and the directory it was published to
+_workerNetwork: Tuple[Optional[str], Optional[ss.NetworkOfPopulation]] = (None, None)
+
+
+def loadPublishedNetwork(directory: str) -> ss.NetworkOfPopulation:
+    """Loads a network published by :meth:`SimulationPool.publish`, unless it's the same one the worker has already
+    loaded.
+
+    :param directory: The directory of the network
+    :return: The network
+    """
+    global _workerNetwork  # pylint: disable=global-statement
+    if _workerNetwork[0] != directory:
+        _workerNetwork = (directory, ss.loadNetworkArrays(pd.read_pickle(Path(directory) / "network.pkl"), directory))
+    return cast(ss.NetworkOfPopulation, _workerNetwork[1])
+
+
+# The last object published with SimulationPool.publishObject used by a worker process, and its directory
+_workerObject: Tuple[Optional[str], Any] = (None, None)
+
+
+def loadPublishedObject(directory: str) -> Any:
+    """Loads an object published by :meth:`SimulationPool.publishObject`, unless it's the same one the worker has
+    already loaded.
+
+    :param directory: The directory of the object
+    :return: The object
+    """
+    global _workerObject  # pylint: disable=global-statement
+    if _workerObject[0] != directory:
+        _workerObject = (directory, pd.read_pickle(Path(directory) / "object.pkl"))
+    return _workerObject[1]
+
+
+def simulateTrial(directory: str, seed: np.random.SeedSequence, engine: str):
+    """Runs a single trial of a published network.
+
+    :param directory: The directory of the network
+    :param seed: The seed of the trial
+    :param engine: which engine to use to run the simulations (see :meth:`ss.basicSimulationInternalAgeStructure`)
+    :return: The history array of the trial and its issues
+    """
+    network = loadPublishedNetwork(directory)
+    if engine == ss.ARRAY_ENGINE:
+        return ss.simulateStateArrays(network, network.initialInfections, np.random.default_rng(seed))
+    df, issues = ss.basicSimulationInternalAgeStructure(
+        network,
+        network.initialInfections,
+        np.random.default_rng(seed),
+        engine,
+    )
+    # The DataFrame is turned back into a history array, which is much cheaper to send to the parent process
+    return ss.pandasToHistory(df, network.stateIndex), issues
+
+
+def simulateTrials(directory: str, seeds: List[np.random.SeedSequence]):
+    """Runs several trials of a published network together, with the batched engine.
+
+    :param directory: The directory of the network
+    :param seeds: The seed of each trial
+    :return: The history arrays of all the trials and the issues of each trial
+    """
+    network = loadPublishedNetwork(directory)
+    generators = [np.random.default_rng(seed) for seed in seeds]
+    return ss.simulateTrialStateArrays(network, network.initialInfections, generators)
@@ -4,13 +4,16 @@ This is the main module used to run simulations based on network of populations
 # pylint: disable=import-error
 import argparse
 from concurrent import futures
+import datetime as dt
+import functools
 from functools import reduce
+import itertools
 import logging
 import logging.config
 from pathlib import Path
 import sys
 import time
-from typing import Optional, List, NamedTuple, Dict, Set
+from typing import Callable, Optional, List, NamedTuple, Dict, Iterable, Iterator, Tuple, cast
 
 from data_pipeline_api import standard_api  # type: ignore
 import numpy as np  # type: ignore
@@ -19,10 +22,17 @@ import pandas as pd  # type: ignore
 from simple_network_sim.common import IssueSeverity, log_issue
 from . import common, loaders
 from . import network_of_populations as ss
+from .aggregation import RunningAggregate, RunningMoments, quantileColumn
+from .pool import SimulationPool, simulateTrial, simulateTrials
+from .spool import RunSpool, spoolName
+from .streaming import streamSimulation
 
 # Default logger, used if module not called as __main__
 logger = logging.getLogger(__name__)
 
+# Percentiles added to the aggregated results when they are requested
+QUANTILES = [0.025, 0.25, 0.5, 0.75, 0.975]
+
 
 def main(argv):
     """
@@ -63,8 +73,15 @@ def main(argv):
         issues.extend(new_issues)
 
         random_seed = loaders.readRandomSeed(store.read_table("human/random-seed", "random-seed"))
-        results = runSimulation(network, random_seed, issues=issues, max_workers=None if not args.workers else args.workers)
-        aggregated = aggregateResults(results)
+        quantiles = QUANTILES if args.quantiles else []
+        if args.stream_output:
+            streamSimulation(store, network, random_seed, issues, quantiles)
+            logger.info("Took %.2fs to run the simulation.", time.time() - t0)
+            return
+
+        spool = _openSpool(args, network, random_seed)
+        results = _iterateRuns(args, network, random_seed, issues, spool)
+        aggregated = _writeRuns(store, network, results, spool, quantiles)
 
         logger.info("Writing output")
         store.write_table(
@@ -74,14 +91,8 @@ def main(argv):
             issues=issues,
             description=aggregated.description,
         )
-        for i, result in enumerate(results):
-            store.write_table(
-                "output/simple_network_sim/outbreak-timeseries",
-                f"run-{i}",
-                _convert_category_to_str(result.output),
-                issues=result.issues,
-                description=result.description,
-            )
+        if spool is not None:
+            spool.remove()
 
         logger.info("Took %.2fs to run the simulation.", time.time() - t0)
         logger.info(
@@ -90,6 +101,107 @@ def main(argv):
         )
 
 
+def _openSpool(args: argparse.Namespace, network: ss.NetworkOfPopulation, random_seed: int) -> Optional[RunSpool]:
+    """The spool the runs are kept in when --resume-dir is used. Deterministic runs are not spooled, since only one
+    trial is simulated anyway.
+
+    :param args: The command line arguments
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :return: The spool, or None if the runs are not spooled
+    """
+    if args.resume_dir is None or not network.stochastic:
+        return None
+    name = spoolName(Path(args.data_pipeline_config), random_seed, args.engine, args.use_movement_multipliers)
+    spool = RunSpool(args.resume_dir / name)
+    logger.info("Resuming from %s (%s/%s trials finished)", spool.directory, len(spool.trials()), network.trials)
+    return spool
+
+
+def _iterateRuns(
+        args: argparse.Namespace,
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        issues: List[standard_api.Issue],
+        spool: Optional[RunSpool],
+) -> Iterator[Tuple[int, "Result"]]:
+    """Runs the trials the command line arguments ask for: until the ensemble converges when --convergence-tolerance
+    is used, or otherwise the trials that aren't in the spool, after loading the ones that are.
+
+    :param args: The command line arguments
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :param issues: list of issues to report to the pipeline
+    :param spool: The spool of the runs, if any
+    :return: The index of the trial and its Result, for all the trials
+    """
+    max_workers = None if not args.workers else args.workers
+    if args.convergence_tolerance is not None:
+        return iterateAdaptiveSimulation(
+            network,
+            random_seed,
+            issues=issues,
+            summaries=args.convergence_outputs,
+            tolerance=args.convergence_tolerance,
+            max_trials=args.max_trials,
+            max_workers=max_workers,
+            engine=args.engine,
+        )
+    finished = [] if spool is None else spool.trials()
+    return itertools.chain(
+        ((trial, cast(RunSpool, spool).load(trial)) for trial in finished),
+        iterateSimulation(
+            network,
+            random_seed,
+            issues=issues,
+            max_workers=max_workers,
+            engine=args.engine,
+            trials=[trial for trial in range(network.trials) if trial not in finished],
+        ),
+    )
+
+
+def _writeRuns(
+        store: standard_api.StandardAPI,
+        network: ss.NetworkOfPopulation,
+        results: Iterable[Tuple[int, "Result"]],
+        spool: Optional[RunSpool],
+        quantiles: List[float],
+) -> "Result":
+    """Writes each run as soon as it's finished, and adds it to the spool unless it was already there. The runs are
+    then dropped, only their aggregate is kept until the end. In deterministic mode every run is the same Result, so the
+    aggregate is made straight from it instead.
+
+    :param store: The data pipeline API the runs are written to
+    :param network: object representing the network of populations
+    :param results: The index of the trial and its Result, for all the trials
+    :param spool: The spool of the runs, if any
+    :param quantiles: quantiles of the runs added to the aggregated results
+    :return: The aggregated results
+    """
+    spooled = set() if spool is None else set(spool.trials())
+    aggregate = RunningAggregate(quantiles)
+    deterministic: Optional[Result] = None
+    for trial, result in results:
+        if spool is not None and trial not in spooled:
+            spool.save(trial, result)
+        logger.info("Writing run %s", trial)
+        store.write_table(
+            "output/simple_network_sim/outbreak-timeseries",
+            f"run-{trial}",
+            _convert_category_to_str(result.output),
+            issues=result.issues,
+            description=result.description,
+        )
+        if network.stochastic:
+            aggregate.add(result.output, trial)
+        else:
+            deterministic = result
+    if network.stochastic:
+        return Result(output=aggregate.result(), issues=[], description="Mean and stddev for all the runs")
+    return aggregateDeterministicResult(cast(Result, deterministic), quantiles)
+
+
 class Result(NamedTuple):
     """
     This object contains the results of a simulation and a small description
@@ -99,11 +211,14 @@ class Result(NamedTuple):
     description: str = "A dataframe of the number of people in each node, compartment and age over time"
 
 
+# pylint: disable=too-many-arguments
 def runSimulation(
         network: ss.NetworkOfPopulation,
         random_seed: int,
         issues: List[standard_api.Issue],
         max_workers: Optional[int] = None,
+        engine: str = ss.DICT_ENGINE,
+        pool: Optional[SimulationPool] = None,
 ) -> List[Result]:
     """Run pre-created network
 
@@ -111,41 +226,301 @@ def runSimulation(
     :param random_seed: seed to use when instantiating the SeedSequence object
     :param issues: list of issues to report to the pipeline
     :param max_workers: maximum number of processes to spawn when running multiple simulations
-    :return: Result runs for all trials of the simulation
+    :param engine: which engine to use to run the simulations (see :meth:`ss.basicSimulationInternalAgeStructure`)
+    :param pool: the processes used to run the trials, a new pool is created (and closed) if not given
+    :return: Result runs for all trials of the simulation, in the order of the trials. In deterministic mode all the
+             trials share the same Result
+    """
+    runs = iterateSimulation(network, random_seed, issues, max_workers, engine, pool=pool)
+    runs = sorted(runs, key=lambda run: run[0])
+    return [result for _, result in runs]
+
+
+# pylint: disable=too-many-arguments
+def iterateSimulation(
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        issues: List[standard_api.Issue],
+        max_workers: Optional[int] = None,
+        engine: str = ss.DICT_ENGINE,
+        trials: Optional[Iterable[int]] = None,
+        pool: Optional[SimulationPool] = None,
+) -> Iterator[Tuple[int, Result]]:
+    """Run pre-created network, yielding the result of each trial as soon as it's finished. The trials are yielded in
+    the order they finish, so callers can process them without waiting for (or holding on to) all the others.
+
+    Trial i always uses the i-th child of the seed sequence, so running only some of the trials gives the same numbers
+    for them as running all of them.
+
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :param issues: list of issues to report to the pipeline
+    :param max_workers: maximum number of processes to spawn when running multiple simulations
+    :param engine: which engine to use to run the simulations (see :meth:`ss.basicSimulationInternalAgeStructure`)
+    :param trials: the trials to run, all the trials of the network by default
+    :param pool: the processes used to run the trials. If not given, a new pool with max_workers processes is created
+                 and closed when all the trials are finished
+    :return: The index of the trial and its Result, for all the trials that were run. In deterministic mode all the
+             trials share the same Result
     """
-    results = []
-    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        delayed: List[futures.Future] = []
-        for seq in np.random.SeedSequence(random_seed).spawn(network.trials):
-            delayed.append(
-                executor.submit(
-                    ss.basicSimulationInternalAgeStructure,
-                    network,
-                    network.initialInfections,
-                    np.random.default_rng(seq),
+    seeds = np.random.SeedSequence(random_seed).spawn(network.trials)
+    trials = list(range(network.trials)) if trials is None else list(trials)
+    if not trials:
+        return
+    if not network.stochastic:
+        # Every trial of a deterministic simulation would produce exactly the same numbers, so we only run one
+        logger.info("Running simulation (1/1), deterministic mode")
+        result = runTrial(network, random_seed, 0, issues, engine)
+        for trial in trials:
+            yield trial, result
+        return
+
+    if pool is None:
+        with SimulationPool(max_workers) as ownPool:
+            yield from _iterateTrials(network, seeds, trials, issues, engine, ownPool)
+    else:
+        yield from _iterateTrials(network, seeds, trials, issues, engine, pool)
+
+
+def runTrial(
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        trial: int,
+        issues: List[standard_api.Issue],
+        engine: str = ss.DICT_ENGINE,
+) -> Result:
+    """Runs a single trial of the network in this process, with the same seed :meth:`iterateSimulation` would use for
+    it. This is useful when the caller is already running in a worker process.
+
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :param trial: the index of the trial to run
+    :param issues: list of issues to report to the pipeline
+    :param engine: which engine to use to run the simulations (see :meth:`ss.basicSimulationInternalAgeStructure`)
+    :return: The Result of the trial
+    """
+    seed = np.random.SeedSequence(random_seed).spawn(network.trials)[trial]
+    df, new_issues = ss.basicSimulationInternalAgeStructure(
+        network,
+        network.initialInfections,
+        np.random.default_rng(seed),
+        engine,
+    )
+    return Result(output=df, issues=issues + new_issues, description="An individual model run")
+
+
+# pylint: disable=too-many-arguments
+def _iterateTrials(
+        network: ss.NetworkOfPopulation,
+        seeds: List[np.random.SeedSequence],
+        trials: List[int],
+        issues: List[standard_api.Issue],
+        engine: str,
+        pool: SimulationPool,
+) -> Iterator[Tuple[int, Result]]:
+    """Runs the trials of a stochastic network in the pool (see :meth:`iterateSimulation`)"""
+    finished = 0
+    # The workers send back the plain (days, nodes, ages, compartments) arrays, which are much smaller than the
+    # equivalent DataFrames. Since the date, node, age and state columns are the same for every run, they are created
+    # only once, here, and each run only adds its own totals
+    index: Optional[pd.DataFrame] = None
+
+    directory = pool.publish(network)
+    delayed: Dict[futures.Future, List[int]] = {}
+    try:
+        delayed.update(_submitTrials(pool, directory, seeds, trials, engine))
+        for future in futures.as_completed(delayed):
+            if engine == ss.BATCHED_ENGINE:
+                runs = list(zip(delayed[future], *future.result()))
+            else:
+                runs = [(delayed[future][0], *future.result())]
+            for trial, output, new_issues in runs:
+                if index is None:
+                    index = ss.historyIndex(network.startDate, len(output), network.stateIndex)
+                finished += 1
+                logger.info("Running simulation (%s/%s)", finished, len(trials))
+                yield trial, Result(
+                    output=index.assign(total=output.ravel()),
+                    issues=issues + new_issues,
+                    description="An individual model run",
                 )
-            )
+    finally:
+        for future in delayed:
+            future.cancel()
+        futures.wait(delayed)
+        pool.unpublish(directory)
+
+
+def _submitTrials(
+        pool: SimulationPool,
+        directory: str,
+        seeds: List[np.random.SeedSequence],
+        trials: List[int],
+        engine: str,
+) -> Dict[futures.Future, List[int]]:
+    """Submits the trials of a published network to the pool (see :meth:`_iterateTrials`)
+
+    :return: The trials run by each task
+    """
+    delayed: Dict[futures.Future, List[int]] = {}
+    if engine == ss.BATCHED_ENGINE:
+        # Every worker runs its share of the trials together, each trial still using its own seed
+        for batch in np.array_split(trials, min(len(trials), pool.max_workers)):
+            delayed[pool.submit(simulateTrials, directory, [seeds[t] for t in batch])] = batch.tolist()
+    else:
+        for trial in trials:
+            delayed[pool.submit(simulateTrial, directory, seeds[trial], engine)] = [trial]
+    return delayed
+
+
+def cumulativeDeaths(network: ss.NetworkOfPopulation, df: pd.DataFrame) -> np.ndarray:
+    """Summary of a run with the number of deaths in each node by the end of the simulation.
+
+    :param network: object representing the network of populations
+    :param df: The output of a run
+    :return: The deaths of each node, in the order of the network's nodes
+    """
+    last = df[(df.date == df.date.max()) & (df.state == "D")]
+    return last.groupby("node").total.sum().reindex(list(network.stateIndex.nodes), fill_value=0.0).to_numpy()
+
+
+def peakDate(network: ss.NetworkOfPopulation, df: pd.DataFrame) -> np.ndarray:
+    """Summary of a run with the day when the most people were infectious across the whole network.
 
-        for t, future in enumerate(futures.as_completed(delayed), start=1):
-            logger.info("Running simulation (%s/%s)", t, network.trials)
-            df, new_issues = future.result()
-            results.append(Result(output=df, issues=issues + new_issues, description="An individual model run"))
+    :param network: object representing the network of populations
+    :param df: The output of a run
+    :return: A single element array with the number of days between the start date and the peak
+    """
+    infectious = df[df.state.isin(network.infectiousStates)].groupby("date").total.sum()
+    return np.array([(dt.date.fromisoformat(str(infectious.idxmax())) - network.startDate).days], dtype=float)
+
+
+# Summaries of a run that can be used to decide when the ensemble has converged
+SUMMARIES = {"deaths": cumulativeDeaths, "peak-date": peakDate}
+
+
+# pylint: disable=too-many-arguments
+def iterateAdaptiveSimulation(
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        issues: List[standard_api.Issue],
+        summaries: List[str],
+        tolerance: float,
+        max_trials: int,
+        max_workers: Optional[int] = None,
+        engine: str = ss.DICT_ENGINE,
+        pool: Optional[SimulationPool] = None,
+) -> Iterator[Tuple[int, Result]]:
+    """Run pre-created network in waves of ``network.trials`` trials, until the ensemble mean of the summaries has
+    converged or max_trials have been run. The ensemble has converged when the Monte Carlo standard error of the mean
+    of every element of every summary is smaller than tolerance times that mean.
+
+    The trials are numbered (and seeded) exactly like :meth:`iterateSimulation` would, so the first n trials are the
+    same regardless of the number of waves. A deterministic network runs only once, like in :meth:`iterateSimulation`.
+
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :param issues: list of issues to report to the pipeline
+    :param summaries: names of the summaries (see :data:`SUMMARIES`) that need to converge
+    :param tolerance: the largest standard error accepted, relative to the mean. Must be positive
+    :param max_trials: the number of trials after which the simulation stops even if it hasn't converged. Must be at
+                       least ``network.trials``
+    :param max_workers: maximum number of processes to spawn when running multiple simulations
+    :param engine: which engine to use to run the simulations (see :meth:`ss.basicSimulationInternalAgeStructure`)
+    :param pool: the processes used to run the trials. If not given, a new pool with max_workers processes is created
+                 and used by all the waves
+    :return: The index of the trial and its Result, for all the trials that were run
+    """
+    if max_trials < network.trials:
+        raise ValueError(f"max_trials ({max_trials}) must be at least the number of trials ({network.trials})")
+    if tolerance <= 0.0:
+        raise ValueError(f"tolerance ({tolerance}) must be a positive number")
+    # The arguments are checked above, rather than in the generator, so that they fail when this is called
+    return _iterateWaves(network, random_seed, issues, summaries, tolerance, max_trials, max_workers, engine, pool)
+
+
+def _iterateWaves(
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        issues: List[standard_api.Issue],
+        summaries: List[str],
+        tolerance: float,
+        max_trials: int,
+        max_workers: Optional[int],
+        engine: str,
+        pool: Optional[SimulationPool],
+) -> Iterator[Tuple[int, Result]]:
+    """Runs the waves of trials of :meth:`iterateAdaptiveSimulation`"""
+    if not network.stochastic:
+        yield from iterateSimulation(network, random_seed, issues, max_workers, engine, pool=pool)
+        return
+    if pool is None:
+        with SimulationPool(max_workers) as ownPool:
+            yield from _iterateWaves(
+                network, random_seed, issues, summaries, tolerance, max_trials, max_workers, engine, ownPool
+            )
+        return
 
-    return results
+    runWave = functools.partial(
+        iterateSimulation, network._replace(trials=max_trials), random_seed, issues, max_workers, engine, pool=pool
+    )
+    yield from _iterateUntilConverged(network, runWave, summaries, tolerance, max_trials)
 
 
-def aggregateResults(results: List[Result]) -> Result:
+def _iterateUntilConverged(
+        network: ss.NetworkOfPopulation,
+        runWave: Callable[..., Iterator[Tuple[int, Result]]],
+        summaries: List[str],
+        tolerance: float,
+        max_trials: int,
+) -> Iterator[Tuple[int, Result]]:
+    """Runs waves of trials with runWave(trials=...) until the summaries converge (see
+    :meth:`iterateAdaptiveSimulation`)"""
+    moments = {name: RunningMoments() for name in summaries}
+    wave = max(network.trials, 2)
+    done = 0
+    while done < max_trials:
+        trials = range(done, min(done + wave, max_trials))
+        for trial, result in runWave(trials=trials):
+            for name, summary in moments.items():
+                summary.add(SUMMARIES[name](network, result.output))
+            yield trial, result
+        done = trials.stop
+
+        error = max(summary.relativeStandardError() for summary in moments.values())
+        logger.info("Ran %s trials, largest relative standard error is %.4f", done, error)
+        if error < tolerance:
+            return
+    logger.warning("The ensemble didn't converge after %s trials", done)
+
+
+def aggregateResults(results: Iterable[Result], quantiles: Optional[List[float]] = None) -> Result:
     """Aggregate results from runs
 
-    :param results: result runs from runSimulation
+    :param results: result runs from runSimulation (or iterateSimulation)
+    :param quantiles: quantiles (between 0 and 1) of the runs to be estimated along with the mean and std
     :return: Averaged number of infection through time, for all trial
     """
-    issues: Set[standard_api.Issue] = set()
-    agg = results[0].output.set_index(["date", "node", "age", "state"])
-    for i, result in enumerate(results):
-        agg = agg.join(result.output.set_index(["date", "node", "age", "state"]), rsuffix=str(i))
-    agg = pd.DataFrame({"mean": agg.mean(axis=1), "std": agg.std(axis=1)})
-    return Result(output=agg.reset_index(), issues=list(issues), description="Mean and stddev for all the runs")
+    aggregate = RunningAggregate(quantiles)
+    for result in results:
+        aggregate.add(result.output)
+    return Result(output=aggregate.result(), issues=[], description="Mean and stddev for all the runs")
+
+
+def aggregateDeterministicResult(result: Result, quantiles: Optional[List[float]] = None) -> Result:
+    """Aggregate the runs of a deterministic simulation, which are all the same run. This gives the same output as
+    :meth:`aggregateResults` with any number of copies of the run, without going through them: the mean and every
+    quantile are the run itself and the std is 0.
+
+    :param result: The result of the single run
+    :param quantiles: quantiles (between 0 and 1) of the runs to be added along with the mean and std
+    :return: Averaged number of infection through time, for all trial
+    """
+    total = result.output["total"].to_numpy(dtype=float)
+    agg = result.output[["date", "node", "age", "state"]].reset_index(drop=True).assign(mean=total, std=0.0)
+    for q in quantiles or []:
+        agg[quantileColumn(q)] = total
+    return Result(output=agg, issues=[], description="Mean and stddev for all the runs")
 
 
 def _convert_category_to_str(df: pd.DataFrame) -> pd.DataFrame:
@@ -275,10 +650,68 @@ def build_args(argv):
         "--workers",
         type=int,
         default=0,
-        help="Defaults to the number of CPUs in the machine",
+        help="Defaults to the number of CPUs in the machine. Can't be used with --stream-output",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ss.ENGINES,
+        default=ss.DICT_ENGINE,
+        help="Selects the implementation used to run the model. The array engine keeps the whole network in a single "
+             "numpy array instead of one dict per node. The batched engine is the array engine running many trials at "
+             "once in each worker. Ignored with --stream-output, which always uses the batched engine",
+    )
+    parser.add_argument(
+        "--resume-dir",
+        type=Path,
+        default=None,
+        help="Keep every finished run in a directory inside this one, named after the data pipeline config and the "
+             "random seed. If the simulation is interrupted, running it again with the same parameters only runs the "
+             "trials that hadn't finished. The directory is removed once all the outputs are written",
+    )
+    parser.add_argument(
+        "--convergence-tolerance",
+        type=float,
+        default=None,
+        help="Instead of running the number of trials in human/trials, keep running that many trials at a time until "
+             "the Monte Carlo standard error of the mean of the --convergence-outputs is below this fraction of the "
+             "mean, or --max-trials is reached",
+    )
+    parser.add_argument(
+        "--convergence-outputs",
+        nargs="+",
+        choices=list(SUMMARIES),
+        default=["deaths"],
+        help="Summaries of the runs that must converge when --convergence-tolerance is used: the deaths in each node "
+             "by the end date and/or the day infections peak",
+    )
+    parser.add_argument(
+        "--max-trials",
+        type=int,
+        default=1000,
+        help="The largest number of trials run when --convergence-tolerance is used",
+    )
+    parser.add_argument(
+        "--quantiles",
+        action="store_true",
+        help=f"Add the {', '.join(str(q) for q in QUANTILES)} quantiles of the runs to the aggregated results. They "
+             "are estimated while the runs finish, since the runs aren't kept in memory",
+    )
+    parser.add_argument(
+        "--stream-output",
+        action="store_true",
+        help="Write the results one day at a time while the simulation runs, instead of keeping every run in memory "
+             "until the end. All the trials run in a single process with the batched engine, regardless of --engine, "
+             "so it can't be used with --workers or --resume-dir",
     )
 
-    return parser.parse_args(argv)
+    args = parser.parse_args(argv)
+    if args.stream_output and args.resume_dir is not None:
+        parser.error("--resume-dir can't be used with --stream-output")
+    if args.stream_output and args.workers:
+        parser.error("--workers can't be used with --stream-output")
+    if args.convergence_tolerance is not None and (args.stream_output or args.resume_dir is not None):
+        parser.error("--convergence-tolerance can't be used with --stream-output or --resume-dir")
+    return args
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+"""
+Keeps the finished runs of a simulation on disk, so that an interrupted simulation can be resumed.
+"""
+# pylint: disable=import-error
+import hashlib
+import os
+from pathlib import Path
+import shutil
+from typing import Any, List
+
+import pandas as pd  # type: ignore
+
+
+class RunSpool:
+    """
+    Keeps a copy of every finished run in a local directory, so that a simulation that was interrupted can be resumed
+    without running again the trials that had already finished.
+
+    :param directory: The directory where the runs are kept, it's created if it doesn't exist
+    """
+
+    def __init__(self, directory: Path):
+        """Initialise."""
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def trials(self) -> List[int]:
+        """
+        :return: The trials that are in the spool, in ascending order
+        """
+        return sorted(int(path.stem[len("run-"):]) for path in self.directory.glob("run-*.pkl"))
+
+    def load(self, trial: int) -> Any:
+        """
+        :param trial: The index of the trial
+        :return: The result of the trial, as it was saved
+        """
+        return pd.read_pickle(self.directory / f"run-{trial}.pkl")
+
+    def save(self, trial: int, result: Any):
+        """Adds a finished run to the spool. The file is only renamed to its final name when it's complete, so a run
+        will never be half written if the process dies.
+
+        :param trial: The index of the trial
+        :param result: The result of the trial, anything that can be pickled
+        """
+        partial = self.directory / f"run-{trial}.pkl.partial"
+        pd.to_pickle(result, partial)
+        os.replace(partial, self.directory / f"run-{trial}.pkl")
+
+    def remove(self):
+        """Removes the spool and all the runs in it"""
+        shutil.rmtree(self.directory)
+
+
+def spoolName(config: Path, random_seed: int, engine: str, use_movement_multipliers: bool) -> str:
+    """Name of the spool directory of a simulation. Any change to the data pipeline config or to the options that
+    change the results of the trials gives a different name.
+
+    :param config: The data pipeline config file
+    :param random_seed: The seed used to create the seeds of the trials
+    :param engine: The engine used to run the simulations
+    :param use_movement_multipliers: Whether the movement multipliers are used
+    :return: The name of the directory
+    """
+    digest = hashlib.sha256(config.read_bytes())
+    digest.update(f"{engine}:{use_movement_multipliers}".encode())
+    return f"{digest.hexdigest()[:16]}-{random_seed}"
@@ -0,0 +1,151 @@
+"""
+Writes the results of a simulation one day at a time while it runs, so that the runs never need to be kept in memory.
+"""
+# pylint: disable=import-error
+import datetime as dt
+import logging
+from pathlib import Path
+import tempfile
+from typing import List, Optional
+
+from data_pipeline_api import standard_api  # type: ignore
+import h5py  # type: ignore
+import numpy as np  # type: ignore
+
+from . import network_of_populations as ss
+from .aggregation import aggregateStates, quantileColumn
+
+logger = logging.getLogger(__name__)
+
+
+def streamSimulation(
+        store: standard_api.StandardAPI,
+        network: ss.NetworkOfPopulation,
+        random_seed: int,
+        issues: List[standard_api.Issue],
+        quantiles: Optional[List[float]] = None,
+) -> None:
+    """Run all the trials with the batched engine and write the results while the simulation progresses, so that only
+    a single day of every trial is ever kept in memory.
+
+    The rows of each day are appended to chunked, extendable tables in a scratch hdf5 file. Since the data pipeline API
+    records the issues of a table when it is opened, the tables are only copied into the data pipeline once the
+    simulation is over and all the issues are known. The copy is done by hdf5 itself, so it doesn't load the tables into
+    memory. The tables written are the same ones :meth:`simple_network_sim.sampleUseOfModel.main` writes when the
+    results are kept in memory.
+
+    :param store: The data pipeline API the results will be written to
+    :param network: object representing the network of populations
+    :param random_seed: seed to use when instantiating the SeedSequence object
+    :param issues: list of issues to report to the pipeline
+    :param quantiles: quantiles of the trials added to the aggregated results. They are estimated like in
+                      :class:`~simple_network_sim.aggregation.RunningAggregate`, so both modes write the same numbers
+    """
+    quantiles = quantiles or []
+    # Only one trial is simulated in deterministic mode, and it's written into all the runs
+    generators = [
+        np.random.default_rng(seq)
+        for seq in np.random.SeedSequence(random_seed).spawn(network.trials if network.stochastic else 1)
+    ]
+    runIssues: List[List[standard_api.Issue]] = [[] for _ in generators]
+    with tempfile.TemporaryDirectory() as tmp:
+        with h5py.File(Path(tmp) / "outbreak-timeseries.h5", "w") as h5:
+            aggregated = _TableWriter(
+                h5.require_group("outbreak-timeseries"),
+                network.stateIndex,
+                ["mean", "std"] + [quantileColumn(q) for q in quantiles],
+            )
+            runs = [
+                _TableWriter(h5.require_group(f"run-{i}"), network.stateIndex, ["total"]) for i in range(network.trials)
+            ]
+
+            for date, state in ss.iterateTrialStateArrays(network, network.initialInfections, generators, runIssues):
+                logger.debug("Writing %s", date)
+                for i, run in enumerate(runs):
+                    run.append(date, state[i % len(state)])
+                aggregated.append(date, *aggregateStates(state, quantiles))
+
+            logger.info("Writing output")
+            _copyTable(store, h5, "outbreak-timeseries", "Mean and stddev for all the runs", issues)
+            for i in range(len(runs)):
+                _copyTable(store, h5, f"run-{i}", "An individual model run", issues + runIssues[i % len(runIssues)])
+
+
+# pylint: disable=too-few-public-methods
+class _TableWriter:
+    """
+    Appends the states of a simulation, one day at a time, to a chunked and extendable hdf5 table. The table has the
+    same layout as the ones written by the data pipeline API, so they can be read back with ``store.read_table``.
+
+    :param group: The hdf5 group the table will be created in
+    :param stateIndex: the positions of each node, age and compartment in the states that will be appended
+    :param columns: The names of the numeric columns of the table
+    """
+
+    def __init__(self, group: h5py.Group, stateIndex: ss.StateIndex, columns: List[str]):
+        """Initialise."""
+        nNodes, nAges, nCompartments = stateIndex.shape
+        nodes = np.repeat(np.array(list(stateIndex.nodes), dtype=np.string_), nAges * nCompartments)
+        ages = np.tile(np.repeat(np.array(list(stateIndex.ages), dtype=np.string_), nCompartments), nNodes)
+        compartments = np.tile(np.array(list(stateIndex.compartments), dtype=np.string_), nNodes * nAges)
+
+        self._columns = columns
+        self._rows = np.zeros(nNodes * nAges * nCompartments, dtype=[
+            ("date", "S10"),
+            ("node", nodes.dtype),
+            ("age", ages.dtype),
+            ("state", compartments.dtype),
+        ] + [(column, "<f8") for column in columns])
+        self._rows["node"] = nodes
+        self._rows["age"] = ages
+        self._rows["state"] = compartments
+        self._table = group.create_dataset(
+            "table",
+            shape=(0,),
+            maxshape=(None,),
+            dtype=self._rows.dtype,
+            chunks=(len(self._rows),),
+            track_times=False,
+        )
+
+    def append(self, date: dt.date, *values: np.ndarray):
+        """Append the rows of a day to the table.
+
+        :param date: The date of the rows
+        :param values: One (nodes, ages, compartments) array per column
+        """
+        self._rows["date"] = str(date)
+        for column, value in zip(self._columns, values):
+            self._rows[column] = value.ravel()
+        size = len(self._table)
+        self._table.resize((size + len(self._rows),))
+        self._table[size:] = self._rows
+
+
+def _copyTable(
+        store: standard_api.StandardAPI,
+        source: h5py.File,
+        component: str,
+        description: str,
+        issues: List[standard_api.Issue],
+):
+    """
+    Copies a table from the hdf5 file written by :meth:`streamSimulation` into the outbreak-timeseries data product.
+
+    :param store: The data pipeline API the table will be written to
+    :param source: The scratch hdf5 file
+    :param component: The name of the table in both files
+    :param description: The description of the table
+    :param issues: The issues associated with the table
+    """
+    with store.open_object_file_for_write(
+            "output/simple_network_sim/outbreak-timeseries",
+            component,
+            description,
+            issues,
+    ) as fp:
+        with h5py.File(fp, "a") as h5:
+            group = h5.require_group(component)
+            for dataset in list(group):
+                del group[dataset]
+            source.copy(source[component]["table"], group, "table")
@@ -1,4 +1,5 @@
 import pandas as pd
+import pytest
 
 from simple_network_sim import inference as inf
 
@@ -6,9 +7,10 @@ from simple_network_sim import inference as inf
 def test_inference(base_data_dir):
     summary = inf.run_inference(str(base_data_dir / "config_inference.yaml"))
 
-    assert summary["best_distance"] == 21.23091271317998
-    assert summary["weights"] == [4.535230195917359e-12, 1.2577973135105333e-14]
-    assert summary["distances"] == [21.232393437779567, 21.23091271317998]
+    # The particles are scored with the array engine, which only matches the dict engine up to floating point rounding
+    assert summary["best_distance"] == pytest.approx(21.23091271317998)
+    assert summary["weights"] == pytest.approx([4.535230195917359e-12, 1.2577973135105333e-14])
+    assert summary["distances"] == pytest.approx([21.232393437779567, 21.23091271317998])
     pd.testing.assert_frame_equal(summary["best_particle"].inferred_variables["infection-probability"].value,
                                   pd.DataFrame([{"Date": "2020-03-09", "Value": 0.148430698780}]))
     pd.testing.assert_frame_equal(summary["best_particle"].inferred_variables["initial-infections"].value,
@@ -1,6 +1,13 @@
+import os
+
+from data_pipeline_api.file_formats import object_file
+import numpy as np
 import pandas as pd
+import pytest
 
 from simple_network_sim import network_of_populations, sampleUseOfModel, hdf5_to_csv
+from simple_network_sim.pool import SimulationPool
+from simple_network_sim.spool import RunSpool, spoolName
 from tests.utils import create_baseline
 
 
@@ -75,3 +82,273 @@ def test_stochastic_seed_sequence(data_api_stochastic):
     # It's very unlikely these numbers would match unless both runs produce the same numbers
     assert df1[df1.state == "D"].total.sum() != df2[df2.state == "D"].total.sum()
     assert not issues
+
+
+def test_batched_engine_seed_sequence(data_api_stochastic):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [3]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+
+    def deaths(results):
+        return sorted(r.output[r.output.state == "D"].total.sum() for r in results)
+
+    batched = sampleUseOfModel.runSimulation(network, random_seed=123, issues=[], max_workers=2, engine="batched")
+    array = sampleUseOfModel.runSimulation(network, random_seed=123, issues=[], max_workers=2, engine="array")
+
+    assert len(batched) == 3
+    assert deaths(batched) == deaths(array)
+
+
+@pytest.mark.parametrize("extra_args", [[], ["--quantiles"]])
+def test_stream_output_matches_batched_engine(base_data_dir, extra_args):
+    h5_file = base_data_dir / "output" / "simple_network_sim" / "outbreak-timeseries" / "data.h5"
+    config = str(base_data_dir / "config_stochastic.yaml")
+    try:
+        sampleUseOfModel.main(["-c", config, "--engine", "batched", "--workers", "1"] + extra_args)
+        with open(h5_file, "rb") as fp:
+            expected = {
+                component: object_file.read_table(fp, component) for component in ["outbreak-timeseries", "run-0"]
+            }
+        h5_file.unlink()
+        (base_data_dir / "access.log").unlink()
+
+        sampleUseOfModel.main(["-c", config, "--stream-output"] + extra_args)
+
+        for component, expected_df in expected.items():
+            with open(h5_file, "rb") as fp:
+                pd.testing.assert_frame_equal(object_file.read_table(fp, component), expected_df, check_exact=True)
+    finally:
+        # TODO; remove this once https://github.com/ScottishCovidResponse/data_pipeline_api/issues/12 is done
+        (base_data_dir / "access.log").unlink()
+        h5_file.unlink()
+
+
+def test_deterministic_runs_simulation_once(data_api):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [3]}),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+    )
+
+    results = sampleUseOfModel.runSimulation(network, random_seed=123, issues=[])
+
+    assert len(results) == 3
+    assert all(result.output is results[0].output for result in results)
+
+    aggregated = sampleUseOfModel.aggregateResults(results)
+    joined = sampleUseOfModel.aggregateResults(
+        [sampleUseOfModel.Result(output=result.output.copy(), issues=result.issues) for result in results]
+    )
+    pd.testing.assert_frame_equal(aggregated.output, joined.output, check_exact=False)
+    assert (aggregated.output["std"] == 0.0).all()
+
+    quantiles = [0.25, 0.5]
+    pd.testing.assert_frame_equal(
+        sampleUseOfModel.aggregateDeterministicResult(results[0], quantiles).output,
+        sampleUseOfModel.aggregateResults(results, quantiles).output,
+    )
+
+
+def test_aggregateResults_matches_join(data_api_stochastic):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [3]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+    results = sampleUseOfModel.runSimulation(network, random_seed=123, issues=[], engine="batched")
+
+    # this is how the runs used to be aggregated, with the first one joined twice
+    joined = results[0].output.set_index(["date", "node", "age", "state"])
+    for i, result in enumerate(results):
+        joined = joined.join(result.output.set_index(["date", "node", "age", "state"]), rsuffix=str(i))
+    expected = pd.DataFrame({"mean": joined.mean(axis=1), "std": joined.std(axis=1)}).reset_index()
+
+    aggregated = sampleUseOfModel.aggregateResults(iter(results))
+
+    pd.testing.assert_frame_equal(aggregated.output, expected)
+
+
+def test_array_engine_results_match_dataframes(data_api_stochastic):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [2]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+    expected = {}
+    for engine in ["dict", "array"]:
+        for seed in np.random.SeedSequence(123).spawn(2):
+            df, _ = network_of_populations.basicSimulationInternalAgeStructure(
+                network, network.initialInfections, np.random.default_rng(seed), engine
+            )
+            expected[engine, df[df.state == "D"].total.sum()] = df
+
+    for engine in ["dict", "array", "batched"]:
+        results = sampleUseOfModel.runSimulation(network, random_seed=123, issues=[], max_workers=2, engine=engine)
+
+        assert len(results) == 2
+        for result in results:
+            df = result.output
+            key = ("dict" if engine == "dict" else "array", df[df.state == "D"].total.sum())
+            pd.testing.assert_frame_equal(df, expected[key], check_exact=True)
+
+
+def test_resume_skips_finished_trials(base_data_dir, tmp_path, monkeypatch):
+    h5_file = base_data_dir / "output" / "simple_network_sim" / "outbreak-timeseries" / "data.h5"
+    config = base_data_dir / "config_stochastic.yaml"
+    args = ["-c", str(config), "--engine", "batched", "--workers", "1", "--resume-dir", str(tmp_path)]
+
+    def read_outputs():
+        with open(h5_file, "rb") as fp:
+            outputs = {c: object_file.read_table(fp, c) for c in ["outbreak-timeseries", "run-0"]}
+        h5_file.unlink()
+        (base_data_dir / "access.log").unlink()
+        return outputs
+
+    requested = []
+    iterateSimulation = sampleUseOfModel.iterateSimulation
+
+    def recordTrials(*args, trials=None, **kwargs):
+        requested.append(trials)
+        return iterateSimulation(*args, trials=trials, **kwargs)
+
+    monkeypatch.setattr(sampleUseOfModel, "iterateSimulation", recordTrials)
+    # pretend the simulation died before cleaning up its spool
+    monkeypatch.setattr(RunSpool, "remove", lambda self: None)
+    sampleUseOfModel.main(args)
+    expected = read_outputs()
+    spool = tmp_path / spoolName(config, 123, "batched", False)
+    assert [path.name for path in spool.iterdir()] == ["run-0.pkl"]
+
+    monkeypatch.undo()
+    monkeypatch.setattr(sampleUseOfModel, "iterateSimulation", recordTrials)
+    sampleUseOfModel.main(args)
+    outputs = read_outputs()
+
+    assert requested == [[0], []]
+    assert not spool.exists()
+    for component, expected_df in expected.items():
+        pd.testing.assert_frame_equal(outputs[component], expected_df, check_exact=True)
+
+
+@pytest.mark.parametrize("tolerance,expected_trials", [(10.0, 2), (1e-9, 5)])
+def test_adaptive_simulation(data_api_stochastic, tolerance, expected_trials):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [2]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+
+    runs = sampleUseOfModel.iterateAdaptiveSimulation(
+        network,
+        random_seed=123,
+        issues=[],
+        summaries=["deaths", "peak-date"],
+        tolerance=tolerance,
+        max_trials=5,
+        max_workers=2,
+        engine="batched",
+    )
+    results = dict(runs)
+
+    assert sorted(results) == list(range(expected_trials))
+    expected = sampleUseOfModel.runSimulation(
+        network._replace(trials=expected_trials), random_seed=123, issues=[], max_workers=2, engine="batched"
+    )
+    for trial, result in enumerate(expected):
+        pd.testing.assert_frame_equal(results[trial].output, result.output)
+
+
+@pytest.mark.parametrize("tolerance,max_trials", [(0.0, 5), (-1.0, 5), (0.1, 1)])
+def test_adaptive_simulation_invalid_arguments(data_api_stochastic, tolerance, max_trials):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [2]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+
+    with pytest.raises(ValueError):
+        sampleUseOfModel.iterateAdaptiveSimulation(
+            network,
+            random_seed=123,
+            issues=[],
+            summaries=["deaths"],
+            tolerance=tolerance,
+            max_trials=max_trials,
+        )
+
+
+def test_simulation_pool_is_reused(data_api_stochastic):
+    network, _ = network_of_populations.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        pd.DataFrame({"Value": [2]}),
+        data_api_stochastic.read_table("human/start-end-date", "start-end-date"),
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [True]}),
+    )
+    networks = [network, network._replace(initialInfections={"S08000016": {"[17,70)": 50.0}})]
+
+    with SimulationPool(max_workers=1) as pool:
+        pid = pool.submit(os.getpid).result()
+        pooled = [
+            sampleUseOfModel.runSimulation(n, random_seed=123, issues=[], engine="array", pool=pool) for n in networks
+        ]
+        assert pool.submit(os.getpid).result() == pid
+
+    for n, results in zip(networks, pooled):
+        expected = sampleUseOfModel.runSimulation(n, random_seed=123, issues=[], max_workers=1, engine="array")
+        for result, expected_result in zip(results, expected):
+            pd.testing.assert_frame_equal(result.output, expected_result.output)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from simple_network_sim import aggregation
+from simple_network_sim.sampleUseOfModel import QUANTILES
+
+
+@pytest.mark.parametrize("quantile", QUANTILES)
+def test_QuantileSketch_is_exact_with_few_observations(quantile):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(5, 10))
+
+    sketch = aggregation.QuantileSketch(quantile, 10)
+    for i, values in enumerate(data):
+        sketch.add(values)
+        assert sketch.estimate() == pytest.approx(np.quantile(data[:i + 1], quantile, axis=0))
+
+
+@pytest.mark.parametrize("quantile", QUANTILES)
+def test_QuantileSketch_estimates_quantile(quantile):
+    rng = np.random.default_rng(0)
+    data = rng.normal(loc=np.arange(20), size=(1000, 20))
+
+    sketch = aggregation.QuantileSketch(quantile, 20)
+    for values in data:
+        sketch.add(values)
+
+    assert sketch.estimate() == pytest.approx(np.quantile(data, quantile, axis=0), abs=0.2)
+
+
+def test_RunningAggregate_accumulates_in_trial_order():
+    rng = np.random.default_rng(0)
+    index = pd.DataFrame({"date": ["2020-01-01"] * 3, "node": ["a"] * 3, "age": ["70+"] * 3, "state": ["S", "E", "I"]})
+    outputs = [index.assign(total=rng.random(3) * 1e3) for _ in range(20)]
+
+    fresh = aggregation.RunningAggregate(quantiles=QUANTILES)
+    for output in outputs:
+        fresh.add(output)
+    # eg. a resumed run, which adds the spooled trials first and then the others as they finish
+    resumed = aggregation.RunningAggregate(quantiles=QUANTILES)
+    for trial in [3, 7, 12, 0, 19, 1, 2, 5, 4, 6, 8, 11, 9, 10, 13, 18, 14, 15, 16, 17]:
+        resumed.add(outputs[trial], trial)
+
+    pd.testing.assert_frame_equal(resumed.result(), fresh.result(), check_exact=True)
+
+
+def test_RunningAggregate_missing_trial():
+    index = pd.DataFrame({"date": ["2020-01-01"], "node": ["a"], "age": ["70+"], "state": ["S"]})
+    aggregate = aggregation.RunningAggregate()
+    aggregate.add(index.assign(total=[1.0]), 1)
+
+    with pytest.raises(AssertionError):
+        aggregate.result()
+
+
+@pytest.mark.parametrize("trials", [1, 3, 20])
+def test_aggregateStates_matches_RunningAggregate(trials):
+    rng = np.random.default_rng(0)
+    states = rng.random((trials, 2, 1, 3)) * 1e3
+    index = pd.DataFrame({
+        "date": ["2020-01-01"] * 6,
+        "node": ["a"] * 3 + ["b"] * 3,
+        "age": ["70+"] * 6,
+        "state": ["S", "E", "I"] * 2,
+    })
+    aggregate = aggregation.RunningAggregate(quantiles=QUANTILES)
+    for state in states:
+        aggregate.add(index.assign(total=state.ravel()))
+
+    aggregated = aggregation.aggregateStates(states, QUANTILES)
+
+    expected = aggregate.result()
+    for column, values in zip(expected.columns[4:], aggregated):
+        assert values.shape == (2, 1, 3)
+        np.testing.assert_array_equal(values.ravel(), expected[column].to_numpy())
+
+
+def test_RunningMoments_matches_numpy():
+    rng = np.random.default_rng(0)
+    data = rng.normal(loc=5.0, size=(50, 3))
+
+    moments = aggregation.RunningMoments()
+    for values in data:
+        moments.add(values)
+
+    assert moments.count == 50
+    assert moments.mean == pytest.approx(data.mean(axis=0))
+    assert moments.std() == pytest.approx(data.std(axis=0, ddof=1))
+    assert moments.relativeStandardError() == pytest.approx(
+        (data.std(axis=0, ddof=1) / np.sqrt(50) / data.mean(axis=0)).max()
+    )
+
+
+def test_RunningMoments_relativeStandardError_zero_mean():
+    moments = aggregation.RunningMoments()
+    assert moments.relativeStandardError() == np.inf
+
+    moments.add(np.array([0.0, -1.0]))
+    assert moments.relativeStandardError() == np.inf
+
+    moments.add(np.array([0.0, 1.0]))
+    assert moments.relativeStandardError() == np.inf
+
+    moments = aggregation.RunningMoments()
+    moments.add(np.array([0.0, 1.0]))
+    moments.add(np.array([0.0, 1.0]))
+    assert moments.relativeStandardError() == 0.0
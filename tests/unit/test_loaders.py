@@ -343,6 +343,22 @@ def test_readABCSMCParameters():
     assert parameters["contact_multipliers_kernel_sigma"] == 0.2
     assert parameters["contact_multipliers_partitions"] == [dt.date.min, dt.date(2020, 3, 24), dt.date(2020, 4, 3),
                                                             dt.date.max]
+    assert parameters["batch_size"] == 1
+
+    parameters = pd.DataFrame([
+        {"Parameter": "n_smc_steps", "Value": 5},
+        {"Parameter": "n_particles", "Value": 100},
+        {"Parameter": "infection_probability_shape", "Value": 4.},
+        {"Parameter": "infection_probability_kernel_sigma", "Value": 0.1},
+        {"Parameter": "initial_infections_stddev", "Value": 0.2},
+        {"Parameter": "initial_infections_stddev_min", "Value": 10.},
+        {"Parameter": "initial_infections_kernel_sigma", "Value": 10.},
+        {"Parameter": "contact_multipliers_stddev", "Value": 0.2},
+        {"Parameter": "contact_multipliers_kernel_sigma", "Value": 0.2},
+        {"Parameter": "contact_multipliers_partitions", "Value": "2020-03-24, 2020-04-03"},
+        {"Parameter": "batch_size", "Value": 64},
+    ])
+    assert loaders.readABCSMCParameters(parameters)["batch_size"] == 64
 
 
 def test_readABCSMCParameters_empty():
@@ -528,6 +544,24 @@ def test_sampleMixingMatrix_iterate_keys_one_element():
         assert matrix[key]
 
 
+def test_sampleMixingMatrix_asArray(data_api):
+    matrix = loaders.MixingMatrix(data_api.read_table("human/mixing-matrix", "mixing-matrix"))
+
+    assert matrix.ages == ["70+", "[0,17)", "[17,70)"]
+    array = matrix.asArray()
+    assert array.shape == (3, 3)
+    for i, ageTo in enumerate(matrix.ages):
+        for j, ageFrom in enumerate(matrix.ages):
+            assert array[i, j] == matrix[ageTo][ageFrom]
+
+
+def test_MixingMatrix_asArray_with_ages():
+    matrix = loaders.MixingMatrix({"m": {"m": 0.2, "o": 0.5}, "o": {"o": 0.3, "m": 0.1}})
+
+    assert matrix.asArray(["o", "m"]).tolist() == [[0.3, 0.1], [0.5, 0.2]]
+    assert matrix.asArray().tolist() == [[0.2, 0.5], [0.1, 0.3]]
+
+
 def test_MixingRow_iterate_over_keys():
     row = loaders.MixingRow(["[0,17)", "[17,70)", "70+"], ["0.2", "0.03", "0.1"])
     assert list(row) == ["[0,17)", "[17,70)", "70+"]
@@ -7,6 +7,7 @@ import networkx as nx
 import numpy
 import pandas as pd
 import pytest
+import scipy.sparse
 
 from simple_network_sim import loaders
 from simple_network_sim import network_of_populations as np
@@ -187,6 +188,231 @@ def test_basicSimulationInternalAgeStructure_no_infection_prob_before_time_25(da
         assert total != susceptibles
 
 
+def test_basicSimulationInternalAgeStructure_array_engine_matches_dict_engine(data_api, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        short_simulation_dates,
+        pd.DataFrame([{"Date": "2020-03-16", "Movement_Multiplier": 1.0, "Contact_Multiplier": 1.0},
+                      {"Date": "2020-04-01", "Movement_Multiplier": 0.5, "Contact_Multiplier": 0.7}]),
+    )
+    infections = {"S08000016": {"[17,70)": 10.0}, "S08000024": {"70+": 3.5}}
+
+    expected, expected_issues = np.basicSimulationInternalAgeStructure(network, infections,
+                                                                        numpy.random.default_rng(123))
+    result, issues = np.basicSimulationInternalAgeStructure(network, infections, numpy.random.default_rng(123),
+                                                            engine=np.ARRAY_ENGINE)
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+    assert issues == expected_issues
+
+
+def test_basicSimulationInternalAgeStructure_array_engine_stochastic(data_api_stochastic, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        data_api_stochastic.read_table("human/trials", "trials"),
+        short_simulation_dates,
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        data_api_stochastic.read_table("human/stochastic-mode", "stochastic-mode"),
+    )
+    initial_population = sum(_count_people_per_region(network.initialState))
+
+    result, _ = np.basicSimulationInternalAgeStructure(network, {"S08000016": {"[17,70)": 10}},
+                                                       numpy.random.default_rng(123), engine=np.ARRAY_ENGINE)
+    again, _ = np.basicSimulationInternalAgeStructure(network, {"S08000016": {"[17,70)": 10}},
+                                                      numpy.random.default_rng(123), engine=np.ARRAY_ENGINE)
+
+    pd.testing.assert_frame_equal(result, again)
+    assert all(total == initial_population for total in result.groupby("date").total.sum())
+    assert all(result.total == result.total.round())
+    assert result[result.state != "S"].total.sum() > 0
+
+
+def test_simulateStateArrays(data_api, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        short_simulation_dates,
+    )
+    infections = {"S08000016": {"[17,70)": 10.0}}
+
+    history, issues = np.simulateStateArrays(network, infections, numpy.random.default_rng(123))
+    expected, expected_issues = np.basicSimulationInternalAgeStructure(network, infections,
+                                                                        numpy.random.default_rng(123),
+                                                                        engine=np.ARRAY_ENGINE)
+
+    assert history.shape == ((network.endDate - network.startDate).days + 1,) + network.stateIndex.shape
+    pd.testing.assert_frame_equal(np.historyToPandas(network.startDate, history, network.stateIndex), expected)
+    assert issues == expected_issues
+
+
+def test_simulateStateArrays_output_selection(data_api, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        short_simulation_dates,
+    )
+    infections = {"S08000016": {"[17,70)": 10.0}}
+    full, _ = np.simulateStateArrays(network, infections, numpy.random.default_rng(123))
+    nodes = [network.stateIndex.nodes["S08000016"], network.stateIndex.nodes["S08000015"]]
+    compartments = [network.stateIndex.compartments["D"], network.stateIndex.compartments["I"]]
+
+    output = np.OutputSelection(nodes=["S08000016", "S08000015"], compartments=["D", "I"])
+    history, _ = np.simulateStateArrays(network, infections, numpy.random.default_rng(123), output=output)
+    numpy.testing.assert_array_equal(history, full[:, nodes][:, :, :, compartments])
+    assert np.selectStateIndex(network.stateIndex, output).compartments == {"D": 0, "I": 1}
+
+    output = np.OutputSelection(compartments=["D"], sumAges=True)
+    history, _ = np.simulateStateArrays(network, infections, numpy.random.default_rng(123), output=output)
+    assert history.shape == (len(full), len(network.stateIndex.nodes), 1, 1)
+    numpy.testing.assert_allclose(history[:, :, 0, 0], full[:, :, :, network.stateIndex.compartments["D"]].sum(axis=2))
+    df = np.historyToPandas(network.startDate, history, np.selectStateIndex(network.stateIndex, output))
+    assert set(df.age) == {np.ALL_AGES} and set(df.state) == {"D"}
+
+    with pytest.raises(ValueError):
+        np.simulateStateArrays(network, infections, numpy.random.default_rng(123),
+                               output=np.OutputSelection(compartments=["X"]))
+
+
+def test_simulateStateArrays_until(data_api, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        short_simulation_dates,
+    )
+    infections = {"S08000016": {"[17,70)": 10.0}}
+    full, _ = np.simulateStateArrays(network, infections, numpy.random.default_rng(123))
+    days = []
+
+    def until(day, state):
+        days.append(day)
+        numpy.testing.assert_array_equal(state, full[day])
+        return day == 2
+
+    history, _ = np.simulateStateArrays(network, infections, numpy.random.default_rng(123), until=until)
+
+    assert days == [0, 1, 2]
+    numpy.testing.assert_array_equal(history, full[:3])
+
+
+def test_basicSimulationInternalAgeStructureByDay(data_api_stochastic, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        data_api_stochastic.read_table("human/trials", "trials"),
+        short_simulation_dates,
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        data_api_stochastic.read_table("human/stochastic-mode", "stochastic-mode"),
+    )
+    infections = {"S08000016": {"[17,70)": 10}}
+    issues = []
+
+    days = list(np.basicSimulationInternalAgeStructureByDay(network, infections, numpy.random.default_rng(123), issues))
+    expected, expected_issues = np.basicSimulationInternalAgeStructure(network, infections,
+                                                                        numpy.random.default_rng(123),
+                                                                        engine=np.ARRAY_ENGINE)
+
+    assert len(days) == (network.endDate - network.startDate).days + 1
+    assert all(day.date.nunique() == 1 for day in days)
+    pd.testing.assert_frame_equal(pd.concat(days, ignore_index=True).astype(np.RESULT_DTYPES), expected)
+    assert issues == expected_issues
+
+
+@pytest.mark.parametrize("stochastic", [False, True])
+def test_basicSimulationTrials_matches_array_engine(data_api_stochastic, short_simulation_dates, stochastic):
+    network, _ = np.createNetworkOfPopulation(
+        data_api_stochastic.read_table("human/compartment-transition", "compartment-transition"),
+        data_api_stochastic.read_table("human/population", "population"),
+        data_api_stochastic.read_table("human/commutes", "commutes"),
+        data_api_stochastic.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api_stochastic.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api_stochastic.read_table("human/infection-probability", "infection-probability"),
+        data_api_stochastic.read_table("human/initial-infections", "initial-infections"),
+        data_api_stochastic.read_table("human/trials", "trials"),
+        short_simulation_dates,
+        data_api_stochastic.read_table("human/movement-multipliers", "movement-multipliers"),
+        pd.DataFrame({"Value": [stochastic]}),
+    )
+    infections = {"S08000016": {"[17,70)": 10}}
+    seeds = numpy.random.SeedSequence(123).spawn(3)
+
+    results = np.basicSimulationTrials(network, infections, [numpy.random.default_rng(seq) for seq in seeds])
+
+    assert len(results) == 3
+    for (result, issues), seq in zip(results, seeds):
+        expected, expected_issues = np.basicSimulationInternalAgeStructure(
+            network, infections, numpy.random.default_rng(seq), engine=np.ARRAY_ENGINE
+        )
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+        assert issues == expected_issues
+    if stochastic:
+        assert not results[0][0].total.equals(results[1][0].total)
+
+
+def test_TrialGenerators_draws_from_each_generator():
+    generators = np.TrialGenerators([numpy.random.default_rng(1), numpy.random.default_rng(2)])
+    n = numpy.array([[10, 20, 30], [40, 50, 60]])
+
+    draws = generators.binomial(n, 0.3)
+
+    assert len(generators) == 2
+    assert draws.shape == (2, 3)
+    assert list(draws[0]) == list(numpy.random.default_rng(1).binomial(n[0], 0.3))
+    assert list(draws[1]) == list(numpy.random.default_rng(2).binomial(n[1], 0.3))
+
+
+def test_basicSimulationInternalAgeStructure_invalid_engine(data_api, short_simulation_dates):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        short_simulation_dates,
+    )
+
+    with pytest.raises(ValueError):
+        np.basicSimulationInternalAgeStructure(network, {}, numpy.random.default_rng(123), engine="INVALID")
+
+
 def test_createNetworkOfPopulation_missing_population_table_nodes(data_api, short_simulation_dates):
     progression = pd.DataFrame([
         {"age": "70+", "src": "D", "dst": "D", "rate": 1.0},
@@ -305,6 +531,40 @@ def test_doInternalProgressionAllNodes_e_to_a_progression():
     assert states == {"region1": {("o", "E"): 100.0, ("o", "A"): 0.0}}  # unchanged
 
 
+@pytest.mark.parametrize("stochastic", [False, True])
+def test_getInternalProgressionArray_e_to_a_progression(stochastic):
+    probs = {"o": {"E": {"A": 0.4, "E": 0.6}, "A": {"A": 1.0}}}
+    index = np.createStateIndex(["region1", "region2"], probs)
+    state = np.createStateArray({"region1": {("o", "E"): 100.0}, "region2": {("o", "E"): 50.0, ("o", "A"): 5.0}}, index)
+
+    progression = np.getInternalProgressionArray(
+        state, np.createTransitionMatrix(probs, index), stochastic, numpy.random.default_rng(123)
+    )
+
+    assert numpy.array_equal(progression.sum(axis=2), state.sum(axis=2))
+    if not stochastic:
+        assert numpy.allclose(progression[:, 0], [[0.0, 60.0, 40.0], [0.0, 30.0, 25.0]])
+
+
+def test_getInternalProgressionArray_stochastic_is_reproducible():
+    probs = {"o": {"E": {"A": 0.4, "E": 0.6}, "A": {"A": 0.7, "R": 0.3}}}
+    index = np.createStateIndex([f"region{i}" for i in range(50)], probs)
+    state = numpy.zeros(index.shape)
+    state[:, 0, index.compartments["E"]] = numpy.arange(50) * 10
+    state[:, 0, index.compartments["A"]] = 7.0
+    transitionMatrix = np.createTransitionMatrix(probs, index)
+
+    progression = np.getInternalProgressionArray(state, transitionMatrix, True, numpy.random.default_rng(123))
+
+    assert numpy.array_equal(
+        progression,
+        np.getInternalProgressionArray(state, transitionMatrix, True, numpy.random.default_rng(123)),
+    )
+    assert numpy.array_equal(progression.sum(axis=2), state.sum(axis=2))
+    assert numpy.all(progression[:, 0, index.compartments["R"]] <= 7.0)
+    assert numpy.all(progression == numpy.round(progression))
+
+
 @pytest.mark.parametrize("susceptible", [0.5, 100.0, 300.0])
 @pytest.mark.parametrize("infectious", [0.5, 100.0, 300.0])
 @pytest.mark.parametrize("asymptomatic", [0.5, 100.0, 300.0])
@@ -837,6 +1097,75 @@ def test_createNetworkOfPopulation(data_api):
     assert network.trials == 1
     assert network.startDate == dt.date(2020, 3, 16)
     assert network.endDate == dt.date(2020, 10, 2)
+    days = (network.endDate - network.startDate).days + 1
+    assert network.schedule.movement.tolist() == [1.0] * days
+    assert network.schedule.contact.tolist() == [1.0] * days
+    assert network.schedule.infectionProb.tolist() == [1.0] * days
+    assert list(network.stateIndex.nodes) == list(network.graph.nodes())
+    assert list(network.stateIndex.ages) == list(network.progression)
+    assert list(network.stateIndex.compartments) == ["S"] + list(network.progression["70+"])
+    assert list(network.stateIndex.compartments.values()) == list(range(len(network.stateIndex.compartments)))
+
+    state = np.createStateArray(network.initialState, network.stateIndex)
+    assert state.shape == network.stateIndex.shape
+    pd.testing.assert_frame_equal(
+        np.arrayToPandas(network.startDate, state, network.stateIndex),
+        np.nodesToPandas(network.startDate, network.initialState).astype({"total": float}),
+    )
+
+    edges = [(orig, dest) for orig, dest in network.graph.edges() if orig != dest]
+    assert network.commuteMatrix.shape == (len(network.stateIndex.nodes), len(network.stateIndex.nodes))
+    assert network.commuteMatrix.nnz == len(edges)
+    assert numpy.array_equal(network.commuteMatrix.indices, network.deltaAdjustmentMatrix.indices)
+    assert numpy.array_equal(network.commuteMatrix.indptr, network.deltaAdjustmentMatrix.indptr)
+    for dest, d in network.stateIndex.nodes.items():
+        row = network.commuteMatrix.indices[network.commuteMatrix.indptr[d]:network.commuteMatrix.indptr[d + 1]]
+        predecessors = [orig for orig in network.graph.predecessors(dest) if orig != dest]
+        assert list(row) == [network.stateIndex.nodes[orig] for orig in predecessors]
+
+
+@pytest.mark.parametrize("multiplier", [1.0, 0.3, 1.7])
+def test_getWeightMatrix_matches_getWeight(data_api, multiplier):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+    )
+    nx.set_edge_attributes(network.graph, 0.5, name="delta_adjustment")
+    commuteMatrix, deltaAdjustmentMatrix = np.createCommuteMatrices(network.graph, network.stateIndex)
+
+    weights = np.getWeightMatrix(commuteMatrix, deltaAdjustmentMatrix, multiplier).toarray()
+
+    for orig, o in network.stateIndex.nodes.items():
+        for dest, d in network.stateIndex.nodes.items():
+            if orig != dest and network.graph.has_edge(orig, dest):
+                assert weights[d, o] == np.getWeight(network.graph, orig, dest, multiplier)
+            else:
+                assert weights[d, o] == 0.0
+
+
+def test_WeightMatrixCache_evicts_least_recently_used():
+    commuteMatrix = scipy.sparse.csr_matrix([[0.0, 2.0], [4.0, 0.0]])
+    deltaAdjustmentMatrix = scipy.sparse.csr_matrix([[0.0, 1.0], [0.5, 0.0]])
+    cache = np.WeightMatrixCache(commuteMatrix, deltaAdjustmentMatrix, maxsize=2)
+
+    half = cache.get(0.5)
+    assert cache.get(0.5) is half
+    assert (half.toarray() == np.getWeightMatrix(commuteMatrix, deltaAdjustmentMatrix, 0.5).toarray()).all()
+
+    cache.get(0.1)
+    assert cache.get(0.5) is half
+    cache.get(0.2)  # 0.1 is the least recently used now
+    assert len(cache) == 2
+    assert cache.get(0.5) is half
+    assert cache.get(0.1) is not cache.get(0.2)
+    assert len(cache) == 2
 
 
 def test_basicSimulationInternalAgeStructure_invalid_compartment(data_api):
@@ -1271,3 +1600,179 @@ def test_randomlyInfectRegions(data_api, regions, age_groups, infected):
 def test_computeInfectiousContactsStochastic_arg_mismatch():
     with pytest.raises(ValueError):
         np._computeInfectiousContactsStochastic([1.0], [1.2, 1.3], 10, 10, numpy.random.default_rng(1))
+
+
+@pytest.mark.parametrize("susceptible", [0.0, 0.5, 1.0, 100.0, 3000.0])
+@pytest.mark.parametrize("contacts", [0.0, 0.3, 2.0, 150.0])
+def test_calculateExposedArray_matches_calculateExposed(susceptible, contacts):
+    exposed = np.calculateExposedArray(numpy.array([susceptible]), numpy.array([contacts]), 0.7, False, None)
+
+    assert exposed[0] == np.calculateExposed(susceptible, contacts, 0.7, False, None)
+
+
+def test_calculateExposedArray_stochastic():
+    susceptible = numpy.array([[100.0, 0.0], [5.0, 2000.0]])
+    contacts = numpy.array([[10.0, 0.0], [30.0, 500.0]])
+
+    exposed = np.calculateExposedArray(susceptible, contacts, 0.5, True, numpy.random.default_rng(123))
+
+    assert exposed.shape == (2, 2)
+    assert numpy.all(exposed <= susceptible)
+    assert numpy.all(exposed == exposed.round())
+
+
+def test_getInternalInfectiousContactsArray_matches_getInternalInfectiousContacts():
+    index = np.createStateIndex(["region1", "region2"], {"m": {"I": {"I": 1.0}}, "o": {"I": {"I": 1.0}}})
+    nodes = {
+        "region1": {("m", "S"): 0.3, ("m", "I"): 1.7, ("o", "S"): 3.1, ("o", "I"): 0.9},
+        "region2": {("m", "S"): 7.0, ("m", "I"): 0.1, ("o", "S"): 0.0, ("o", "I"): 2.3},
+    }
+    mixingMatrix = loaders.MixingMatrix({"m": {"o": 0.3, "m": 1.1}, "o": {"m": 0.7, "o": 0.9}})
+
+    contacts = np.getInternalInfectiousContactsArray(
+        np.createStateArray(nodes, index),
+        mixingMatrix.asArray(list(index.ages)),
+        0.7,
+        ["I"],
+        index,
+        False,
+        None,
+        mixingOrder=np.createMixingOrder(mixingMatrix, index),
+    )
+
+    expected = np.getInternalInfectiousContacts(nodes, mixingMatrix, 0.7, ["I"], False, None)
+    for node, n in index.nodes.items():
+        for age, a in index.ages.items():
+            assert contacts[n, a] == expected[node][age]
+
+
+def test_getInternalInfectiousContactsArray_stochastic_large_epidemic():
+    index = np.createStateIndex(["region1", "region2"], {"m": {"I": {"I": 1.0}}, "o": {"I": {"I": 1.0}}})
+    state = numpy.zeros(index.shape)
+    state[:, :, index.compartments["S"]] = [[4_000_000.0, 1_000_000.0], [0.0, 10.0]]
+    state[:, :, index.compartments["I"]] = [[2_000_000.0, 500_000.0], [3.0, 0.0]]
+    mixingMatrix = numpy.array([[2.0, 0.5], [0.5, 1.0]])
+
+    expected = np.getInternalInfectiousContactsArray(state, mixingMatrix, 0.8, ["I"], index, False, None)
+    draws = numpy.array([
+        np.getInternalInfectiousContactsArray(state, mixingMatrix, 0.8, ["I"], index, True, rng)
+        for rng in (numpy.random.default_rng(seed) for seed in range(100))
+    ])
+
+    assert numpy.all(draws == draws.round())
+    assert numpy.all(draws[:, 1, 0] == 0.0)
+    assert draws.mean(axis=0) == pytest.approx(expected, rel=0.01, abs=0.5)
+
+
+def test_getInternalInfectiousContactsArray_stochastic_matches_computeInfectiousContactsStochastic():
+    # A small age group, so that capping the contacts of each person and sampling without replacement both matter. Every
+    # node is an independent draw
+    draws = 40_000
+    index = np.createStateIndex([f"node{n}" for n in range(draws)], {"m": {"I": {"I": 1.0}}, "o": {"I": {"I": 1.0}}})
+    state = numpy.zeros(index.shape)
+    state[:, index.ages["m"], index.compartments["S"]] = 4.0
+    state[:, index.ages["m"], index.compartments["I"]] = 2.0
+    state[:, index.ages["o"], index.compartments["I"]] = 5.0
+    mixingMatrix = numpy.array([[0.5, 3.0], [1.0, 1.0]])
+
+    contacts = np.getInternalInfectiousContactsArray(
+        state, mixingMatrix, 1.0, ["I"], index, True, numpy.random.default_rng(1)
+    )[:, index.ages["m"]]
+
+    rng = numpy.random.default_rng(2)
+    expected = numpy.array([
+        np._computeInfectiousContactsStochastic([0.5, 3.0], [2.0, 5.0], 4.0, 6.0, rng) for _ in range(draws)
+    ])
+    bins = numpy.arange(max(contacts.max(), expected.max()) + 2)
+    frequencies = numpy.histogram(contacts, bins)[0] / draws
+    expectedFrequencies = numpy.histogram(expected, bins)[0] / draws
+    assert numpy.abs(frequencies - expectedFrequencies).sum() / 2 < 0.02
+    assert contacts.mean() == pytest.approx(expected.mean(), rel=0.01)
+    assert contacts.var() == pytest.approx(expected.var(), rel=0.05)
+
+
+def test_createParameterSchedule_forward_fills():
+    schedule = np.createParameterSchedule(
+        dt.date(2020, 3, 1),
+        dt.date(2020, 3, 5),
+        {
+            dt.date(2020, 3, 2): loaders.Multiplier(movement=0.5, contact=0.25),
+            dt.date(2020, 3, 4): loaders.Multiplier(movement=0.75, contact=1.0),
+            dt.date(2020, 3, 10): loaders.Multiplier(movement=0.0, contact=0.0),
+        },
+        {dt.date(2020, 3, 1): 0.5, dt.date(2020, 3, 5): 0.1},
+    )
+
+    assert schedule.movement.tolist() == [1.0, 0.5, 0.5, 0.75, 0.75]
+    assert schedule.contact.tolist() == [1.0, 0.25, 0.25, 1.0, 1.0]
+    assert schedule.infectionProb.tolist() == [0.5, 0.5, 0.5, 0.5, 0.1]
+
+
+def test_createParameterSchedule_missing_infection_probability():
+    with pytest.raises(ValueError):
+        np.createParameterSchedule(dt.date(2020, 3, 1), dt.date(2020, 3, 5), {}, {dt.date(2020, 3, 2): 0.5})
+
+
+def test_saveNetworkArrays_loadNetworkArrays(data_api, tmp_path):
+    network, _ = np.createNetworkOfPopulation(
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+    )
+
+    saved = np.saveNetworkArrays(network, tmp_path)
+    assert saved.commuteMatrix is None and saved.deltaAdjustmentMatrix is None and saved.transitionMatrix is None
+
+    loaded = np.loadNetworkArrays(saved, tmp_path)
+    assert (loaded.commuteMatrix != network.commuteMatrix).nnz == 0
+    assert (loaded.deltaAdjustmentMatrix != network.deltaAdjustmentMatrix).nnz == 0
+    assert (loaded.transitionMatrix == network.transitionMatrix).all()
+    pd.testing.assert_frame_equal(
+        np.basicSimulationInternalAgeStructure(loaded, {"S08000016": {"[17,70)": 10.0}}, None, "array")[0],
+        np.basicSimulationInternalAgeStructure(network, {"S08000016": {"[17,70)": 10.0}}, None, "array")[0],
+    )
+
+
+def test_withOverrides(data_api):
+    tables = [
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population"),
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+    ]
+    base, _ = np.createNetworkOfPopulation(
+        *tables,
+        data_api.read_table("human/infection-probability", "infection-probability"),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/trials", "trials"),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+    )
+    infectionProb = pd.DataFrame([{"Date": "2020-01-01", "Value": 0.3}])
+    initialInfections = pd.DataFrame([{"Health_Board": "S08000024", "Age": "[0,17)", "Infected": 10.0}])
+    movementMultipliers = data_api.read_table("human/movement-multipliers", "movement-multipliers")
+    expected, _ = np.createNetworkOfPopulation(
+        *tables,
+        infectionProb,
+        initialInfections,
+        data_api.read_table("human/trials", "trials"),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+        movementMultipliers,
+    )
+
+    network = np.withOverrides(base, infectionProb, initialInfections, movementMultipliers)
+
+    assert network.graph is base.graph
+    assert network.commuteMatrix is base.commuteMatrix
+    assert network.infectionProb == expected.infectionProb
+    assert network.initialInfections == expected.initialInfections
+    assert network.movementMultipliers == expected.movementMultipliers
+    for actual, wanted in zip(network.schedule, expected.schedule):
+        numpy.testing.assert_array_equal(actual, wanted)
+    assert np.withOverrides(base) == base
@@ -0,0 +1,132 @@
+from unittest.mock import patch, call, Mock
+
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from simple_network_sim import inference as inf, network_of_populations as ss
+from simple_network_sim.particle_evaluation import ParticleEvaluator, WeeklyDeathsDistance, evaluate_published_particle
+from simple_network_sim.pool import SimulationPool
+
+
+def test_ParticleEvaluator_create(abcsmc):
+    evaluator = ParticleEvaluator.create(abcsmc.network, abcsmc.historical_deaths, 123)
+
+    assert evaluator.network is abcsmc.network
+    assert evaluator.random_seed == 123
+    assert evaluator.threshold == np.inf
+    assert evaluator.historical_weekly_deaths.shape == (
+        (evaluator.n_days + 6) // 7,
+        len(abcsmc.network.stateIndex.nodes),
+    )
+
+
+def test_ParticleEvaluator_simulate_deaths(abcsmc):
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    deaths = abcsmc.evaluator.simulate_deaths(particle)
+    assert deaths.shape == (abcsmc.evaluator.n_days, len(abcsmc.network.stateIndex.nodes))
+    assert deaths.sum() == pytest.approx(1190.9201532330842)
+
+
+def test_ParticleEvaluator_simulate_deaths_until(abcsmc):
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    deaths = abcsmc.evaluator.simulate_deaths(particle)
+    days = []
+
+    def until(day, day_deaths):
+        days.append(day)
+        np.testing.assert_array_equal(day_deaths, deaths[day])
+        return day == 9
+
+    np.testing.assert_array_equal(abcsmc.evaluator.simulate_deaths(particle, until=until), deaths[:10])
+    assert days == list(range(10))
+
+
+def test_ParticleEvaluator_compute_deaths_distance(abcsmc):
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    diff = abcsmc.evaluator.compute_deaths_distance(abcsmc.evaluator.simulate_deaths(particle))
+    assert diff == pytest.approx(21.218467509977117)
+
+
+def test_ParticleEvaluator_evaluate(abcsmc):
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    evaluator = abcsmc.evaluator
+    distance = evaluator.compute_deaths_distance(evaluator.simulate_deaths(particle))
+
+    assert evaluator.evaluate(particle) == distance
+
+    simulate_deaths = ParticleEvaluator.simulate_deaths
+    runs = []
+
+    def simulate_and_keep(*args, **kwargs):
+        runs.append(simulate_deaths(*args, **kwargs))
+        return runs[-1]
+
+    with patch.object(ParticleEvaluator, "simulate_deaths", autospec=True, side_effect=simulate_and_keep):
+        bound = evaluator._replace(threshold=distance / 2).evaluate(particle)
+    assert distance / 2 < bound <= distance
+    assert len(runs[0]) < evaluator.n_days
+
+
+def test_evaluate_published_particle(abcsmc):
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    abcsmc.threshold = 10.
+
+    with SimulationPool(1) as pool:
+        network_directory = pool.publish(abcsmc.network)
+        evaluator_directory = pool.publishObject(abcsmc.evaluator._replace(network=None, threshold=abcsmc.threshold))
+        distance = pool.submit(evaluate_published_particle, network_directory, evaluator_directory, particle).result()
+
+    assert distance == abcsmc.evaluate_particle(particle)
+
+
+def test_WeeklyDeathsDistance():
+    historical = np.array([[1., np.nan], [2., 3.]])
+    distance = WeeklyDeathsDistance(historical, 10)
+
+    assert distance.add(0, np.array([5., 5.])) == 0.
+    assert distance.add(5, np.array([5., 6.])) == 0.
+    assert distance.add(6, np.array([8., 6.])) == pytest.approx(np.sqrt(4 / 3))
+    assert distance.add(8, np.array([9., 6.])) == pytest.approx(np.sqrt(4 / 3))
+    assert distance.add(9, np.array([10., 8.])) == pytest.approx(np.sqrt((4 + 0 + 1) / 3))
+
+
+@patch("simple_network_sim.particle_evaluation.logger.warning")
+def test_ParticleEvaluator_simulate_deaths_with_issues(mock_warn_logger, data_api):
+    abcsmc = inf.ABCSMC(
+        data_api.read_table("human/abcsmc-parameters", "abcsmc-parameters"),
+        data_api.read_table("human/historical-deaths", "historical-deaths"),
+        data_api.read_table("human/compartment-transition", "compartment-transition"),
+        data_api.read_table("human/population", "population").iloc[:10],
+        data_api.read_table("human/commutes", "commutes"),
+        data_api.read_table("human/mixing-matrix", "mixing-matrix"),
+        pd.DataFrame([{"Date": "2020-01-01", "Value": 0.5}]),
+        data_api.read_table("human/initial-infections", "initial-infections"),
+        data_api.read_table("human/infectious-compartments", "infectious-compartments"),
+        data_api.read_table("human/trials", "trials"),
+        data_api.read_table("human/start-end-date", "start-end-date"),
+        data_api.read_table("human/movement-multipliers", "movement-multipliers"),
+        data_api.read_table("human/stochastic-mode", "stochastic-mode"),
+        data_api.read_table("human/random-seed", "random-seed"),
+    )
+
+    # The issues of the network are only logged once, when it's created
+    mock_warn_logger.assert_has_calls([call("We had %s issues when %s:", 36, "creating the network")])
+    mock_warn_logger.reset_mock()
+
+    simulate = ss.simulateStateArrays
+    issue = Mock(description="Simulation issue", severity=2)
+
+    def simulate_with_issue(*args, **kwargs):
+        history, issues = simulate(*args, **kwargs)
+        return history, issues + [issue]
+
+    particle = inf.Particle.generate_from_priors(abcsmc)
+    with patch("simple_network_sim.network_of_populations.simulateStateArrays", side_effect=simulate_with_issue):
+        abcsmc.evaluator.simulate_deaths(particle)
+
+    mock_warn_logger.assert_has_calls([
+        call("We had %s issues when %s:", 1, "running the model"),
+        call("%s (severity: %s)", "Simulation issue", 2),
+    ])
@@ -0,0 +1,31 @@
+import os
+
+from simple_network_sim import pool as simulation_pool
+
+
+def test_SimulationPool_publishObject():
+    with simulation_pool.SimulationPool(max_workers=1) as pool:
+        first = pool.publishObject({"a": [1, 2]})
+        second = pool.publishObject({"a": [3]})
+        assert first != second
+
+        assert pool.submit(simulation_pool.loadPublishedObject, first).result() == {"a": [1, 2]}
+        assert pool.submit(simulation_pool.loadPublishedObject, second).result() == {"a": [3]}
+
+        pool.unpublish(first)
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+
+    assert not os.path.exists(second)
+
+
+def test_SimulationPool_close_removes_directory():
+    pool = simulation_pool.SimulationPool(max_workers=1)
+    directory = os.path.dirname(pool.publishObject({"a": [1]}))
+    assert os.path.isdir(directory)
+
+    pool.close()
+    assert not os.path.exists(directory)
+    # the pool can still be used after it's closed
+    assert os.path.exists(pool.publishObject({"a": [2]}))
+    pool.close()
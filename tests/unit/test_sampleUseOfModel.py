@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+from simple_network_sim import sampleUseOfModel
+
+
+def test_aggregateResults_quantiles():
+    index = pd.DataFrame({"date": ["2020-01-01"] * 2, "node": ["a"] * 2, "age": ["70+"] * 2, "state": ["S", "E"]})
+    results = [
+        sampleUseOfModel.Result(output=index.assign(total=[float(i), 10.0 * i]), issues=[]) for i in [3, 1, 2]
+    ]
+
+    aggregated = sampleUseOfModel.aggregateResults(results, quantiles=[0.0, 0.5, 1.0])
+
+    assert list(aggregated.output.columns) == ["date", "node", "age", "state", "mean", "std", "q0", "q0.5", "q1"]
+    assert aggregated.output["q0"].tolist() == [1.0, 10.0]
+    assert aggregated.output["q0.5"].tolist() == [2.0, 20.0]
+    assert aggregated.output["q1"].tolist() == [3.0, 30.0]
+    # the mean still counts the first run twice
+    assert aggregated.output["mean"].tolist() == pytest.approx([2.25, 22.5])
+
+
+@pytest.mark.parametrize("args", [["--workers", "2"], ["--resume-dir", "spool"]])
+def test_build_args_stream_output_incompatible(args):
+    with pytest.raises(SystemExit):
+        sampleUseOfModel.build_args(["--stream-output"] + args)